@@ -0,0 +1,120 @@
+#
+# memory.py
+#
+# Memory benchmark for the scan results of a large batch torrent.
+# Builds a synthetic tree, scans it with Engine.find_subtitles and compares
+# what the matching keeps: the legacy pipeline held the sorted list of
+# (score, folder, [(name, lang), ...]) tuples of every folder for the single
+# configured language, rank_languages keeps the best FolderCandidate only.
+# The size of all the candidates is shown to separate the record layout from
+# the streaming. Engine.scores keeps every scored candidate, up to cache_size
+# folders, so the ranked figure is shown with the cache as well: as long as
+# the cache holds the whole batch only the record layout is saved.
+#
+# Usage: python bench/memory.py [files] [folders]
+#
+import os
+import sys
+import shutil
+import logging
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'copysubtitles'))
+
+from engine import Engine, SCORE_CACHE_SIZE  # noqa
+from records import SubtitleFile  # noqa
+
+LANGUAGES = Engine.parse_languages('ru|rus')
+
+CONFIG = {
+    'lang': 'ru|rus',
+    'lang_count': 1,
+    'cache_size': SCORE_CACHE_SIZE,
+    'io_rate_limit': 0,
+    'io_ops_limit': 0,
+    'io_idle_priority': False,
+    'io_drop_cache': False,
+    # suffixes are enough, the memory is the same
+    'detection': 'suffix',
+}
+
+SUBTITLE = ('[Script Info]\nScriptType: v4.00+\n\n[Events]\n'
+            'Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text\n'
+            'Dialogue: 0,0:00:01.00,0:00:03.00,Default,,0,0,0,,Hello\n')
+
+
+def deep_size(obj, seen=None):
+    """
+    :return: size of the object with all the objects it refers to
+    :rtype: int
+    """
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(k, seen) + deep_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_size(i, seen) for i in obj)
+    elif hasattr(obj, '__slots__'):
+        size += sum(deep_size(getattr(obj, s), seen) for s in obj.__slots__ if hasattr(obj, s))
+    return size
+
+
+def make_tree(root, files, folders):
+    per_folder = files // folders
+    for j in range(per_folder):
+        open(os.path.join(root, '[Group] Show Name - E%04d [1080p].mkv' % j), 'w').close()
+    for i in range(folders):
+        folder = os.path.join(root, 'Season %02d' % i, 'Subs')
+        os.makedirs(folder)
+        for j in range(per_folder):
+            with open(os.path.join(folder, '[Group] Show Name - S%02dE%04d [1080p].rus.ass' % (i, j)), 'w') as f:
+                f.write(SUBTITLE)
+
+
+def legacy(candidates):
+    """
+    :return: the list the legacy pipeline sorted, one language and all the folders
+    :rtype: list
+    """
+    lang = LANGUAGES[0][0]
+    return sorted(list(
+        (c.scores[lang], c.location, zip(list(set(c.names)), [c.labels[lang]] * len(c.names))) for c in candidates
+    ))
+
+
+def main():
+    files = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    folders = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    root = tempfile.mkdtemp()
+    try:
+        make_tree(root, files, folders)
+        logging.basicConfig(level=logging.ERROR)
+        engine = Engine(CONFIG)
+        candidates = list(engine.find_subtitles(root, LANGUAGES))
+        old = deep_size(legacy(candidates))
+        held = deep_size(candidates)
+        # a fresh engine, so the cached scores are not shared with the legacy side
+        engine = Engine(CONFIG)
+        chosen = Engine.rank_languages(LANGUAGES, engine.find_subtitles(root, LANGUAGES), 1)
+        new = deep_size(chosen)
+        # the chosen candidate is in the cache as well, it is counted once
+        cached = deep_size((chosen, engine.scores))
+        lang, candidate = chosen[0]
+        # files are materialized only for the chosen candidate and language
+        job = deep_size(candidate.files(lang), set(id(n) for n in candidate.names))
+        print('files: %s, folders: %s' % (files, folders))
+        print('tuples:  %10d bytes' % old)
+        print('records: %10d bytes if all of them were kept, ratio %.2f' % (held, old / float(held)))
+        print('ranked:  %10d bytes (+%d bytes for a copy job), ratio %.2f' % (new, job, old / float(new + job)))
+        print('cached:  %10d bytes ranked with %d cached folders (+%d bytes for a copy job), ratio %.2f' % (
+            cached, len(engine.scores), job, old / float(cached + job)))
+        assert isinstance(candidate.files(lang)[0], SubtitleFile)
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
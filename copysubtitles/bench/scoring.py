@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+#
+# scoring.py
+#
+# Accuracy and speed regression check of the subtitle folder scorer.
+# Every layout of corpus.json is generated in a temporary folder, matched
+# the way the plugin does it and compared with the expected winning folders
+# and languages. Wall and CPU time per layout are compared with baseline.json.
+# Times are measured relative to a fixed reference workload which is run
+# next to every layout, so the baseline does not depend on the machine speed
+# or on the load at the moment. Exit status is 1 if accuracy drops or any
+# layout is slower than allowed.
+#
+# Usage: python bench/scoring.py [--update] [--repeat N] [--slowdown RATIO] [--slack UNITS] [layout ...]
+#
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import resource
+import logging
+import argparse
+import tempfile
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH, '..', 'copysubtitles'))
+
+from langdetect import DetectorFactory, detect_langs  # noqa
+from engine import Engine, SCORE_CACHE_SIZE  # noqa
+
+CORPUS = os.path.join(BENCH, 'corpus.json')
+BASELINE = os.path.join(BENCH, 'baseline.json')
+# passes over the sample lines in the reference workload
+CALIBRATION_ROUNDS = 3
+
+LINES = {
+    'ru': [u'Привет, как у тебя дела сегодня вечером?',
+           u'Я думаю, что нам нужно идти домой прямо сейчас.',
+           u'Это очень интересная история о жизни в большом городе.',
+           u'Почему ты никогда не говоришь мне правду?',
+           u'Завтра мы поедем к бабушке в деревню.',
+           u'Он сказал, что вернётся через несколько минут.'],
+    'uk': [u'Привіт, як у тебе справи сьогодні ввечері?',
+           u'Я думаю, що нам потрібно йти додому просто зараз.',
+           u'Це дуже цікава історія про життя у великому місті.',
+           u'Чому ти ніколи не кажеш мені правду?',
+           u'Завтра ми поїдемо до бабусі в село.',
+           u'Він сказав, що повернеться за кілька хвилин.'],
+    'en': [u'Hello, how are you doing this evening?',
+           u'I think we need to go home right now.',
+           u'This is a very interesting story about life in a big city.',
+           u'Why do you never tell me the truth?',
+           u'Tomorrow we are going to visit grandmother in the village.',
+           u'He said he would be back in a few minutes.'],
+    'de': [u'Hallo, wie geht es dir heute Abend?',
+           u'Ich glaube, wir müssen jetzt sofort nach Hause gehen.',
+           u'Das ist eine sehr interessante Geschichte über das Leben in der Stadt.',
+           u'Warum sagst du mir nie die Wahrheit?',
+           u'Morgen fahren wir zur Großmutter ins Dorf.',
+           u'Er sagte, dass er in ein paar Minuten zurück ist.'],
+}
+
+ASS_HEADER = (u'[Script Info]\nScriptType: v4.00+\n\n[V4+ Styles]\nFormat: Name, Fontname, Fontsize\n'
+              u'Style: Default,Arial,20\n\n[Events]\n'
+              u'Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text\n')
+
+CONFIG = {
+    'lang_count': 1,
+    'transcode': False,
+    'io_rate_limit': 0,
+    'io_ops_limit': 0,
+    'io_idle_priority': False,
+    'io_drop_cache': False,
+    'extract_embedded': False,
+    'fonts': False,
+    'font_store': '',
+    'copy_timeout': 600,
+    'cache_size': SCORE_CACHE_SIZE,
+    'transfer_mode': 'copy',
+    'detection': 'langdetect',
+}
+
+
+def clock():
+    """
+    :return: wall time and CPU time of the process in seconds
+    :rtype: tuple
+    """
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return time.time(), usage.ru_utime + usage.ru_stime
+
+
+def timed(f, *args):
+    """
+    :return: result of the call, its wall and CPU time
+    :rtype: tuple
+    """
+    w, c = clock()
+    result = f(*args)
+    w2, c2 = clock()
+    return result, w2 - w, c2 - c
+
+
+def calibrate():
+    """
+    reference workload: language detection of the sample lines, the most
+    expensive part of scoring
+    """
+    DetectorFactory.seed = 0
+    for _i in range(CALIBRATION_ROUNDS):
+        for lang in sorted(LINES):
+            for line in LINES[lang]:
+                detect_langs(line)
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def timestamp(ms, sep):
+    return '%d:%02d:%02d%s%03d' % (ms // 3600000, ms // 60000 % 60, ms // 1000 % 60, sep, ms % 1000)
+
+
+def make_subtitle(path, lang, episode, events, spacing, encoding):
+    """
+    write a subtitle file with the given number of events every `spacing` seconds
+    """
+    lines = LINES[lang]
+    srt = path.endswith('.srt')
+    out = [] if srt else [ASS_HEADER]
+    for i in range(events):
+        start = i * spacing * 1000
+        end = start + 2500
+        text = u'%s %d' % (lines[(i + episode) % len(lines)], episode)
+        if srt:
+            out.append(u'%d\n%s --> %s\n%s\n\n' % (i + 1, timestamp(start, ','), timestamp(end, ','), text))
+        else:
+            out.append(u'Dialogue: 0,%s,%s,Default,,0,0,0,,%s\n' % (
+                timestamp(start, '.')[:-1], timestamp(end, '.')[:-1], text))
+    with io.open(path, 'w', encoding=encoding) as f:
+        f.write(u''.join(out))
+
+
+def make_layout(root, layout):
+    """
+    :return: torrent folder of the generated layout
+    :rtype: str
+    """
+    torrent = os.path.join(root, layout['name'])
+    for folder, episodes in layout['videos'].items():
+        path = os.path.normpath(os.path.join(torrent, folder))
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        for ep in range(1, episodes + 1):
+            with open(os.path.join(path, 'Show - %02d [1080p].mkv' % ep), 'wb') as f:
+                f.write('\0' * ep)
+    for subs in layout['subtitles']:
+        path = os.path.normpath(os.path.join(torrent, subs['folder']))
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        for ep in range(1, subs['count'] + 1):
+            name = 'Show - %02d%s.%s' % (ep, subs.get('suffix', ''), subs.get('ext', 'ass'))
+            make_subtitle(os.path.join(path, name), subs['lang'], ep, subs.get('events', 300),
+                          subs.get('spacing', 5), subs.get('encoding', 'utf-8'))
+    return torrent
+
+
+def match(torrent, layout):
+    """
+    :return: chosen languages and folders relative to the torrent folder per video folder,
+    e.g. {'.': [['ru', 'Subs/Rus']]}
+    :rtype: dict
+    """
+    config = dict(CONFIG, lang=layout['lang'], lang_count=layout.get('lang_count', 1),
+                  detection=layout.get('detection', 'langdetect'))
+    engine = Engine(config)
+    languages = Engine.parse_languages(config['lang'])
+    location, files = Engine.list_files(torrent)
+    result = {}
+    for video_folder in engine.get_video_folders(location, files):
+        chosen = Engine.rank_languages(languages, engine.find_subtitles(video_folder, languages),
+                                       config['lang_count'])
+        result[os.path.relpath(video_folder, torrent)] = [
+            [lang, os.path.relpath(candidate.location, torrent)] for lang, candidate in chosen]
+    engine.walker.close()
+    return result
+
+
+def run(layout, root, repeat):
+    """
+    every run of the layout is surrounded by runs of the reference workload
+    and the time is divided by the faster one of them.
+
+    :return: result of the layout, the median relative wall and CPU time,
+    and the median wall time in seconds
+    :rtype: dict
+    """
+    torrent = make_layout(root, layout)
+    walls, cpus, seconds = [], [], []
+    result = None
+    _r, ref_wall, ref_cpu = timed(calibrate)
+    for _i in range(repeat):
+        # detection is random unless it is seeded
+        DetectorFactory.seed = 0
+        result, wall, cpu = timed(match, torrent, layout)
+        _r, next_wall, next_cpu = timed(calibrate)
+        walls.append(wall / min(ref_wall, next_wall))
+        cpus.append(cpu / min(ref_cpu, next_cpu))
+        seconds.append(wall)
+        ref_wall, ref_cpu = next_wall, next_cpu
+    expected = dict((os.path.normpath(k), v) for k, v in layout['expected'].items())
+    return {'correct': result == expected, 'result': result, 'wall': round(median(walls), 3),
+            'cpu': round(median(cpus), 3), 'seconds': median(seconds)}
+
+
+def slower(current, base, slowdown, slack):
+    """
+    :return: time keys which are slower than allowed, e.g. ['wall']
+    :rtype: list
+    """
+    return [key for key in ('wall', 'cpu') if current[key] > base[key] * slowdown + slack]
+
+
+def compare(results, baseline, slowdown, slack):
+    """
+    :return: list of regressions
+    :rtype: list
+    """
+    failures = []
+    layouts = baseline.get('layouts', {})
+    for name, current in sorted(results.items()):
+        base = layouts.get(name)
+        if base is None:
+            continue
+        if base['correct'] and not current['correct']:
+            failures.append('%s: wrong match %s' % (name, json.dumps(current['result'], sort_keys=True)))
+        for key in slower(current, base, slowdown, slack):
+            failures.append('%s: relative %s time %.3f, allowed %.3f' % (
+                name, key, current[key], base[key] * slowdown + slack))
+    if 'accuracy' in baseline and accuracy(results) < baseline['accuracy']:
+        failures.append('accuracy %.3f, baseline %.3f' % (accuracy(results), baseline['accuracy']))
+    return failures
+
+
+def accuracy(results):
+    return sum(1 for r in results.values() if r['correct']) / float(len(results) or 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Accuracy and speed regression check of the scorer.')
+    parser.add_argument('layouts', nargs='*', help='names of the layouts to run, all by default')
+    parser.add_argument('--update', action='store_true', help='store the results as the new baseline')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per layout, the median time is taken')
+    parser.add_argument('--slowdown', type=float, default=1.25, help='allowed time ratio to the baseline')
+    parser.add_argument('--slack', type=float, default=.05,
+                        help='allowed time above the ratio, in reference workload units')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    with open(CORPUS) as f:
+        corpus = json.load(f)
+    if args.layouts:
+        corpus = [layout for layout in corpus if layout['name'] in args.layouts]
+    baseline = {}
+    if os.path.exists(BASELINE):
+        with open(BASELINE) as f:
+            baseline = json.load(f)
+    base_layouts = baseline.get('layouts', {}) if not args.update else {}
+    root = tempfile.mkdtemp()
+    results = {}
+    # language profiles are loaded on the first detection
+    calibrate()
+    try:
+        for layout in corpus:
+            name = layout['name']
+            results[name] = r = run(layout, root, max(args.repeat, 1))
+            if name in base_layouts and slower(r, base_layouts[name], args.slowdown, args.slack):
+                # a slow layout is measured once more, longer, so a burst of load is not reported
+                again = run(layout, root, max(args.repeat, 1) * 2)
+                for key in ('wall', 'cpu'):
+                    r[key] = min(r[key], again[key])
+            print('%-32s %-5s wall %6.3f  cpu %6.3f  (%8.1f ms)' % (
+                name, 'ok' if r['correct'] else 'WRONG', r['wall'], r['cpu'], r['seconds'] * 1000))
+    finally:
+        shutil.rmtree(root)
+    print('accuracy: %.3f (%d layouts)' % (accuracy(results), len(results)))
+
+    if args.update:
+        layouts = baseline.get('layouts', {}) if args.layouts else {}
+        layouts.update((name, dict((k, r[k]) for k in ('correct', 'wall', 'cpu'))) for name, r in results.items())
+        with open(BASELINE, 'w') as f:
+            json.dump({'accuracy': accuracy(layouts), 'layouts': layouts},
+                      f, indent=2, sort_keys=True, separators=(',', ': '))
+            f.write('\n')
+        print('baseline is updated')
+        return 0
+
+    if not baseline:
+        print('there is no baseline, run with --update')
+        return 1
+    if args.layouts:
+        # accuracy is comparable only for the whole corpus
+        baseline.pop('accuracy', None)
+    failures = compare(results, baseline, args.slowdown, args.slack)
+    for failure in failures:
+        print('REGRESSION %s' % failure)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -37,7 +37,11 @@
 #    statement from all source files in the program, then also delete it here.
 #
 
-from deluge.plugins.init import PluginInitBase
+try:
+    from deluge.plugins.init import PluginInitBase
+except ImportError:
+    # the engine is used without Deluge by the command line tool, see cli.py
+    PluginInitBase = object
 
 class CorePlugin(PluginInitBase):
     def __init__(self, plugin_name):
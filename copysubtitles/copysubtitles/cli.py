@@ -0,0 +1,190 @@
+#
+# cli.py
+#
+# Copyright (C) 2009 fu2re <fu2re@yandex.ru>
+#
+# Basic plugin template created by:
+# Copyright (C) 2008 Martijn Voncken <mvoncken@gmail.com>
+# Copyright (C) 2007-2009 Andrew Resch <andrewresch@gmail.com>
+# Copyright (C) 2009 Damien Churchill <damoxc@gmail.com>
+#
+# Deluge is free software.
+#
+# You may redistribute it and/or modify it under the terms of the
+# GNU General Public License, as published by the Free Software
+# Foundation; either version 3 of the License, or (at your option)
+# any later version.
+#
+# deluge is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with deluge.    If not, write to:
+#     The Free Software Foundation, Inc.,
+#     51 Franklin Street, Fifth Floor
+#     Boston, MA  02110-1301, USA.
+#
+#    In addition, as a special exception, the copyright holders give
+#    permission to link the code of portions of this program with the OpenSSL
+#    library.
+#    You must obey the GNU General Public License in all respects for all of
+#    the code used other than OpenSSL. If you modify file(s) with this
+#    exception, you may extend this exception to your version of the file(s),
+#    but you are not obligated to do so. If you do not wish to do so, delete
+#    this exception statement from your version. If you delete this exception
+#    statement from all source files in the program, then also delete it here.
+import sys
+import socket
+import logging
+import argparse
+from multiprocessing import Pool
+from multiprocessing.util import Finalize
+
+from engine import Engine, DETECTION_BACKENDS, SCORE_CACHE_SIZE
+from index import SubtitleIndex
+from rules import Rule, MODES
+from shared import SharedStore, SharedStoreError, FolderLocks
+
+
+# seconds to wait for the results of the worker processes. Waiting with a timeout
+# could be interrupted with Ctrl+C, waiting without it could not.
+WAIT_TIMEOUT = 365 * 24 * 3600
+# the engine of this process, see init_worker
+engine = None
+rule = None
+
+
+def init_worker(config, index, shared_store, node_name, suffixes, level):
+    """
+    make the engine of the worker process. Language detection and scoring
+    are CPU bound, so the paths are processed by separate processes, each
+    one with its own engine, caches, index connection and shared store.
+
+    :param config: engine settings, see Engine
+    :param index: subtitle index location or None
+    :param shared_store: folder shared with other nodes or None
+    :param node_name: name of this node in the shared store
+    :param suffixes: extra suffixes of the copied files
+    :param level: logging level
+    :type config: dict
+    :type index: str
+    :type shared_store: str
+    :type node_name: str
+    :type suffixes: tuple
+    :type level: int
+    """
+    global engine, rule
+    # workers started by fork have the logging configured already
+    logging.basicConfig(level=level, stream=sys.stderr, format='%(levelname)s: %(message)s')
+    shared = locks = None
+    if shared_store:
+        shared = SharedStore(shared_store, node_name)
+        locks = FolderLocks(node_name, config['copy_timeout'])
+    engine = Engine(config, SubtitleIndex(index) if index else None, shared, locks)
+    rule = Rule(suffixes)
+    # run when the worker exits after the pool is closed
+    Finalize(None, close_worker, exitpriority=10)
+
+
+def close_worker():
+    engine.walker.close()
+    if engine.index:
+        engine.index.close()
+    if engine.shared:
+        engine.shared.close()
+
+
+def process_path(path):
+    """
+    :return: report of the path, see Engine.process
+    :rtype: dict
+    """
+    return engine.process(path, rule)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog='copysubtitles', description='Copy subtitles next to the videos without the Deluge daemon.'
+    )
+    parser.add_argument('paths', nargs='+', metavar='PATH', help='folder or a single video file')
+    parser.add_argument('-l', '--lang', default='ru|rus', help="language priority list, e.g. 'ru|rus > en|eng'")
+    parser.add_argument('-n', '--lang-count', type=int, default=1, help='count of languages to copy')
+    parser.add_argument('-s', '--suffix', action='append', default=[], help='extra suffix, e.g. forced')
+    parser.add_argument('-m', '--mode', choices=MODES, default='copy', help='how subtitles are placed')
+    parser.add_argument('-d', '--detection', choices=DETECTION_BACKENDS, default='langdetect',
+                        help='detect language by the content or by the file name suffix only')
+    parser.add_argument('-t', '--transcode', action='store_true', help='convert subtitles to UTF-8')
+    parser.add_argument('--no-extract', action='store_true', help='do not extract embedded subtitles')
+    parser.add_argument('--font-store', help='content addressed font storage, fonts are not placed without it')
+    parser.add_argument('--index', help='subtitle index of the daemon, e.g. ~/.config/deluge/copysubtitles.index')
+    parser.add_argument('--shared-store', help='folder shared with other nodes, see README')
+    parser.add_argument('--node-name', default=socket.gethostname(), help='name of this node in the shared store')
+    parser.add_argument('--io-rate-limit', type=int, default=0, help='copy bandwidth limit, KiB/s')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='count of worker processes')
+    parser.add_argument('-o', '--report', help='JSON report location, stdout by default')
+    parser.add_argument('-v', '--verbose', action='store_true')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """
+    console entry point. Exit status is 1 if any path is failed.
+    """
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    level = logging.INFO if args.verbose else logging.WARNING
+    logging.basicConfig(level=level, stream=sys.stderr, format='%(levelname)s: %(message)s')
+    config = {
+        'lang': args.lang,
+        'lang_count': args.lang_count,
+        'transcode': args.transcode,
+        'io_rate_limit': args.io_rate_limit,
+        'io_ops_limit': 0,
+        'io_idle_priority': False,
+        'io_drop_cache': False,
+        'extract_embedded': not args.no_extract,
+        'fonts': bool(args.font_store),
+        'font_store': args.font_store,
+        'copy_timeout': 600,
+        'cache_size': SCORE_CACHE_SIZE,
+        'transfer_mode': args.mode,
+        'detection': args.detection,
+    }
+    if args.shared_store:
+        # a worker which fails to start is started again and again by the pool
+        try:
+            SharedStore(args.shared_store, args.node_name).close()
+        except SharedStoreError, e:
+            logging.error(str(e))
+            return 1
+    worker_args = (config, args.index, args.shared_store, args.node_name,
+                   tuple(s.strip('.').lower() for s in args.suffix), level)
+
+    if args.jobs <= 1 or len(args.paths) == 1:
+        init_worker(*worker_args)
+        try:
+            reports = [process_path(path) for path in args.paths]
+        finally:
+            close_worker()
+    else:
+        pool = Pool(min(args.jobs, len(args.paths)), init_worker, worker_args)
+        try:
+            reports = pool.map_async(process_path, args.paths, chunksize=1).get(WAIT_TIMEOUT)
+        except KeyboardInterrupt:
+            pool.terminate()
+            raise
+        pool.close()
+        pool.join()
+
+    summary = Engine.summary(reports)
+    if args.report:
+        with open(args.report, 'w') as f:
+            f.write(summary + '\n')
+    else:
+        sys.stdout.write(summary + '\n')
+    return 1 if any(r['errors'] or any(f['errors'] for f in r['folders']) for r in reports) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
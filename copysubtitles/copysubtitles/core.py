@@ -36,29 +36,60 @@
 #    this exception statement from your version. If you delete this exception
 #    statement from all source files in the program, then also delete it here.
 #
-import re
-import os
-import shutil
-import thread
+import copy
+import socket
+import threading
+from functools import partial
 from deluge.log import LOG as log
 from deluge.plugins.pluginbase import CorePluginBase
 import deluge.component as component
 import deluge.configmanager
 from deluge.core.rpcserver import export
 from deluge.event import DelugeEvent
-from twisted.python.filepath import FilePath
-from twisted.internet import reactor
-from langdetect import detect_langs
-from langdetect.lang_detect_exception import LangDetectException
-import pysubs2
-
+from twisted.internet import reactor, threads, defer
+from twisted.python.threadpool import ThreadPool
+from engine import Engine, DETECTION_BACKENDS, SCORE_CACHE_SIZE
+from index import SubtitleIndex
+from throttle import JobCancelled
+from scheduler import Scheduler
+from state import relocate, relocate_path
+from shared import SharedStore, SharedStoreError, FolderLocks, FolderLocked
+from rules import RuleMatcher, MODES
+from progress import ProgressReporter
+
+
+# the most time to wait for copying threads when they are cancelled, seconds
+CANCEL_TIMEOUT = 5
+# the least and the most values of the numeric settings, None is no limit
+LIMITS = {
+    'lang_count': (1, None),
+    'copy_workers': (1, 32),
+    'match_workers': (1, 32),
+    'copy_timeout': (1, None),
+    'shutdown_timeout': (0, None),
+    'io_rate_limit': (0, None),
+    'io_ops_limit': (0, None),
+    'cache_size': (16, None),
+}
+FLAGS = ('transcode', 'io_idle_priority', 'io_drop_cache', 'extract_embedded', 'fonts')
+CHOICES = {
+    'transfer_mode': MODES,
+    'detection': DETECTION_BACKENDS,
+}
+STRINGS = ('lang', 'font_store', 'shared_store', 'node_name')
+
+
+class DaemonThreadPool(ThreadPool):
+    """
+    thread pool of daemon threads, so a thread stuck in I/O does not keep
+    the Deluge process alive after the reactor is stopped
+    """
 
-TEST_VIDEO = re.compile('.*(' + '|'.join(['mkv', 'mp4', 'avi', 'mpg']) + ')$')
-TEST_SUB1 = re.compile('.*(' + '|'.join(['ass', 'ssa']) + ')$')
-TEST_SUB2 = re.compile('.*(srt)$')
-# default density is 243 events for 23 min
-DENS = 243 / 1418930.
-ACCURACY = .65
+    @staticmethod
+    def threadFactory(*args, **kwargs):
+        thread = threading.Thread(*args, **kwargs)
+        thread.daemon = True
+        return thread
 
 
 class TorrentCopiedEvent(DelugeEvent):
@@ -66,14 +97,31 @@ class TorrentCopiedEvent(DelugeEvent):
     Emitted when a torrent is copied.
     """
 
-    def __init__(self, torrent_id, old_path, new_path, path_pairs):
+    def __init__(self, torrent_id, old_path, new_path, path_pairs, skipped=0, replaced=0):
         """
         :param torrent_id - hash representing torrent in Deluge
         :param old_path - original path for the torrent
         :param new_path - new path for the torrent
         :param path_pairs - a list of tuples, ( old path, new path )
+        :param skipped - count of files skipped as identical to the existing ones
+        :param replaced - count of stale files replaced
         """
-        self._args = [torrent_id, old_path, new_path, path_pairs]
+        self._args = [torrent_id, old_path, new_path, path_pairs, skipped, replaced]
+
+
+class SubtitleProgressEvent(DelugeEvent):
+    """
+    Emitted when a torrent moves to the next stage and periodically while it is processed.
+    """
+
+    def __init__(self, torrent_id, state):
+        """
+        :param torrent_id - hash representing torrent in Deluge
+        :param state - dict with the name, stage (queued, scanning, scoring, copying, done or failed),
+        done and total items of the stage, bytes_done, bytes_total, count of queued torrents and
+        the copy throughput
+        """
+        self._args = [torrent_id, state]
 
 
 class Core(CorePluginBase):
@@ -83,299 +131,556 @@ class Core(CorePluginBase):
         :return:
         """
         self.config = deluge.configmanager.ConfigManager("copysubtitles.conf", {
-            'lang': 'ru|rus'
+            'lang': 'ru|rus',
+            'lang_count': 1,
+            'transcode': False,
+            'index_roots': [],
+            'io_rate_limit': 0,
+            'io_ops_limit': 0,
+            'io_idle_priority': False,
+            'io_drop_cache': False,
+            'copy_workers': 2,
+            'match_workers': 1,
+            'copy_timeout': 600,
+            'shutdown_timeout': 10,
+            'extract_embedded': True,
+            'cache_size': SCORE_CACHE_SIZE,
+            'transfer_mode': 'copy',
+            'detection': 'langdetect',
+            'fonts': True,
+            'font_store': '',
+            'shared_store': '',
+            'node_name': socket.gethostname(),
+            'rules': [
+                # we assume about any subtitle for anime should be forced
+                {'path': '*/anime', 'suffixes': ['forced']}
+            ]
+        })
+        self.rules = RuleMatcher(self.config["rules"])
+        # the last match result per torrent
+        self.state = deluge.configmanager.ConfigManager("copysubtitles.state", {
+            'torrents': {}
         })
+        try:
+            shared, locks = self.open_shared(self.config["shared_store"], self.config["node_name"])
+        except SharedStoreError, e:
+            # the plugin works on its own until the store is fixed in the preferences
+            log.error("COPYSUBTITLES: %s. Scores and copies are not shared." % e)
+            shared = locks = None
+        self.progress = ProgressReporter(self.emit_progress)
+        self.engine = Engine(
+            self.config, SubtitleIndex(deluge.configmanager.get_config_dir("copysubtitles.index")), shared, locks,
+            self.progress
+        )
+        # copy jobs near to their deferred and the deferred fired when the thread is stopped
+        self.jobs = {}
+        # other work of the plugin: indexing and moving the copied files
+        self.tasks = set()
+        self.stopping = False
+        # matching, copying and the other work have their own threads, so a large batch
+        # of copy jobs or the index build does not delay matching of the next torrent
+        self.match_pool = DaemonThreadPool(0, self.config["match_workers"], "copysubtitles-match")
+        self.copy_pool = DaemonThreadPool(0, self.config["copy_workers"], "copysubtitles-copy")
+        self.task_pool = DaemonThreadPool(0, 1, "copysubtitles-task")
+        for pool in (self.match_pool, self.copy_pool, self.task_pool):
+            pool.start()
+        # matching jobs are ordered by their cost
+        self.scheduler = Scheduler(self.match_pool, self.config["match_workers"])
+        if self.engine.index.empty():
+            self.run_task(self.engine.update_index, self.config["index_roots"]).addErrback(self.on_index_error)
         # Get notified when a torrent finishes downloading
         component.get("EventManager").register_event_handler("TorrentFinishedEvent", self.on_torrent_finished)
+        component.get("EventManager").register_event_handler("TorrentStorageMovedEvent", self.on_storage_moved)
+        component.get("EventManager").register_event_handler("TorrentRemovedEvent", self.on_torrent_removed)
+        # the reactor waits for the jobs on shutdown even if the plugin is not disabled before
+        self.shutdown_trigger = reactor.addSystemEventTrigger("before", "shutdown", self.on_shutdown)
+
+    def on_shutdown(self):
+        self.shutdown_trigger = None
+        return self.disable()
 
     def disable(self):
         """
+        stop the jobs, see drain. It could be called twice: on the reactor shutdown and by Deluge.
 
-        :return:
+        :return: deferred fired when the jobs are stopped
+        :rtype: Deferred
         """
-        try:
-            self.timer.cancel()
-        except:
-            pass
-        component.get("EventManager").deregister_event_handler("TorrentFinishedEvent", self.on_torrent_finished)
-
-    def update(self):
-        pass
-
-    @staticmethod
-    def get_lang_prob(lang, text):
+        if not self.stopping:
+            component.get("EventManager").deregister_event_handler("TorrentFinishedEvent", self.on_torrent_finished)
+            component.get("EventManager").deregister_event_handler("TorrentStorageMovedEvent", self.on_storage_moved)
+            component.get("EventManager").deregister_event_handler("TorrentRemovedEvent", self.on_torrent_removed)
+            if self.shutdown_trigger:
+                reactor.removeSystemEventTrigger(self.shutdown_trigger)
+                self.shutdown_trigger = None
+            self.stopping = True
+            self.scheduler.cancel()
+            self.stopped = self.drain(self.config["shutdown_timeout"]).addBoth(self._stop)
+        d = defer.Deferred()
+        self.stopped.addBoth(lambda r: d.callback(None) or r)
+        return d
+
+    def _stop(self, result):
         """
-        :param lang: desired language
-        :param text: contested text
-        :type lang: str
-        :type text: str
-        :return: score for the matched language
+        stop the thread pools when all the jobs are stopped. A pool joins its
+        threads, so they are stopped in a separate daemon thread: the reactor is
+        not blocked and its shutdown does not wait for a stuck job. The
+        resources are released after that.
         """
-        try:
-            for l in filter(lambda p: p.lang == lang, detect_langs(text)):
-                return l.prob
-            return 0
-        except LangDetectException:
-            return 0
-
-    @staticmethod
-    def score_subtitles_folder(languages, count, location):
-        """
-        get usability score for selected location and list of subtitle
-        file names near to their language.
-        Language is defined by simple majority vote. For example if 2 of 3
-        contested files is defined as RU - all the files will be marked as RU
-
-        :param languages: part of language regexp
-        :param count: count of subtitle files we are looking for
-        :param location: contested location
-        :type languages: str
-        :type count: int
-        :type location: str
-        :return: score (lower is better) and list of tuples. E.g. -132211, [('a.ass', 'ru'), ('b.ass', 'ru')]
-        """
-        lang = languages.split('|')[0]
-        score = 0
-        density = 0
-        files = os.listdir(location)
-        s1 = filter(TEST_SUB1.match, files)
-        s2 = filter(TEST_SUB2.match, files)
-        subs = list(set(s1) | set(s2))
-        subs_lang = []
-        fs = len(subs) or 10 ** -5
-        f1 = len(s1)
-        f2 = len(s2)
-        # number of contested lines. Lower is better for performance.
-        width = 30
-        sl = float(min(3, fs))
-        # contest some files
-        for filename in subs[:int(sl)]:
-            # check existed suffix. it will be equal to 0 if it does not exist
-            f_score = int(bool(re.search('\.(' + languages + ')+\.', filename.lower())))
-            # load subtitles and check it length
-            path = os.path.join(location, filename)
-            sub = pysubs2.load(path)
-            coverage = len(sub)
-            f_density = (coverage / float(sub[-1].end)) / DENS
-            # if language score is still 0 check it more closely
-            if not f_score:
-                # we should not start from begging in case of intro
-                # that's why we try to get part from a middle
-                start = max((coverage/2) - (width/2), 0)
-                # check language for the selected part
-                for line in sub[start:(start+width)]:
-                    f_score += Core.get_lang_prob(lang, line.text)
-            # normalize the score
-            f_score = f_score / float(min(coverage, width))
-            # append language to majority vote list if it accurate enough
-            subs_lang.append(lang if f_score > ACCURACY else None)
-            # stack language score and density
-            score += f_score
-            density += f_density
-        # get the final scores
-        lng_score = int((score / sl) > ACCURACY)
-        cnt_score = int(fs >= count)
-        dns_score = min(round(density / sl), 1)
-        ssa_score = round(f1 / float(fs), 2)
-        srt_score = round(f2 / float(fs), 2)
-        majority = len(set(subs_lang)) == 1
-        log.info("COPYSUBTITLES: scores for %s - %s, %s, %s, %s, %s" % \
-                 (location, lng_score, cnt_score, dns_score, ssa_score, srt_score))
-        return -(
-            lng_score * 10 ** 5 +
-            cnt_score * 10 ** 4 +
-            dns_score * 10 ** 3 +
-            ssa_score * 10 ** 2 +
-            srt_score
-        ), zip(subs, [lang if majority else None] * int(len(subs)))
+        running = len(self.in_flight())
+        if running:
+            log.warning("COPYSUBTITLES: %s jobs are still running" % running)
+        thread = threading.Thread(target=self._stop_pool, name="copysubtitles-stop")
+        thread.daemon = True
+        thread.start()
+        return result
+
+    def _stop_pool(self):
+        for pool in (self.match_pool, self.copy_pool, self.task_pool):
+            pool.stop()
+        reactor.callFromThread(self._release)
+
+    def _release(self):
+        """
+        close the index and the shared store when the thread pools are stopped
+        """
+        self.engine.index.close()
+        self.engine.walker.close()
+        if self.engine.shared:
+            self.engine.shared.close()
 
-    @staticmethod
-    def get_contents(location, test=None, method='walk'):
+    def in_flight(self):
         """
-        Get folder contents
-        :param location: contested location
-        :param test: filter function
-        :param method: one of available twisted.FilePath methods.
-        Should be on of childrens / walk
-        :return: matched paths
-        :rtype: generator
+        :return: deferreds of the running copy and matching jobs and the other work of the plugin
+        :rtype: list
         """
-        path_obj = FilePath(location)
-        for sub_path in getattr(path_obj, method)():
-            if not test or test(sub_path.path):
-                yield sub_path.path
+        return [f for _d, f in self.jobs.values()] + list(self.scheduler.running) + list(self.tasks)
 
-    @staticmethod
-    def get_sub_folders(location):
+    def open_shared(self, location, node):
         """
-        get all sub folders recursievly
-        :param location: contested location
-        :return: matched paths
-        :rtype: generator
+        nodes which use the same storage share scores and do not copy into the same folder at once
+
+        :param location: shared store folder or empty string
+        :param node: name of this node
+        :return: shared store and folder locks or Nones if the storage is not shared
+        :rtype: tuple
+        :raise SharedStoreError: if the store could not be opened
         """
-        return Core.get_contents(location, test=lambda x: os.path.isdir(x))
+        if not location:
+            return None, None
+        return SharedStore(location, node), FolderLocks(node, self.config["copy_timeout"])
 
-    @staticmethod
-    def get_root_folder(location):
+    def drain(self, timeout):
         """
-        Get root folder for the given path
-        :param location: contested location
-        :return: matched path
-        :rtype: str
+        wait for running copy and matching jobs and cancel copy jobs which
+        are not finished in time. Reactor is never blocked.
+
+        :param timeout: seconds to wait before the cancellation
+        :type timeout: int
+        :return: fired when all the jobs are stopped or CANCEL_TIMEOUT
+        seconds after the cancellation
+        :rtype: Deferred
         """
-        l2 = os.path.dirname(location)
-        if not l2:
-            return location
-        return Core.get_root_folder(l2)
+        in_flight = self.in_flight()
+        if not in_flight:
+            return defer.succeed(None)
+        stopped = defer.DeferredList(in_flight)
+        result = defer.Deferred()
+        stopped.addBoth(lambda _r: result.called or result.callback(None))
 
-    @staticmethod
-    def get_video_folders(location, files):
+        def cancel():
+            log.info("COPYSUBTITLES: cancelling %s copy jobs" % len(self.jobs))
+            for d, _f in self.jobs.values():
+                d.cancel()
+            reactor.callLater(CANCEL_TIMEOUT, lambda: result.called or result.callback(None))
+
+        timer = reactor.callLater(timeout, cancel)
+
+        def on_stopped(r):
+            if timer.active():
+                timer.cancel()
+            return r
+
+        return result.addBoth(on_stopped)
+
+    def copy(self, job, target=None, *args):
         """
-        Get sub folders which contains any video files
-        :param location: contested location
-        :param files: list of torrent files
-        :return: matched paths
-        :rtype: generator
+        run the copy job in the copy thread pool
+
+        :param job: files to copy
+        :param target: see Engine.job_target
+        :param args: extra arguments of the target
+        :type job: CopyJob
+        :return: cancellable deferred fired with the list of copied path pairs
+        :rtype: Deferred
         """
-        root_folders = set([Core.get_root_folder(f['path']) for f in files])
-        for rf in root_folders:
-            if not rf:
-                continue
-            loc = os.path.join(location, rf)
-            for d in set([
-                os.path.dirname(path) for path in Core.get_contents(loc, test=lambda x: TEST_VIDEO.match(x))
-            ]):
-                yield d
+        d = defer.Deferred(lambda _d: job.cancel())
+        finished = defer.Deferred()
+        self.jobs[job] = d, finished
+        # the timeout is counted from the start of the job, not from the time it is queued
+        timeout = []
+
+        def on_started():
+            if not d.called:
+                timeout.append(reactor.callLater(self.config["copy_timeout"], d.cancel))
+
+        def on_result(success, result):
+            del self.jobs[job]
+            if timeout and timeout[0].active():
+                timeout[0].cancel()
+            if not d.called:
+                if success:
+                    d.callback(result)
+                else:
+                    d.errback(result)
+            finished.callback(None)
+
+        def on_copied(result):
+            path_pairs, skipped, replaced, kept = result
+            self.record(job, path_pairs + kept)
+            component.get("EventManager").emit(TorrentCopiedEvent(
+                job.torrent_id, job.subtitle_folder, job.video_folder, path_pairs, skipped, replaced
+            ))
+            return path_pairs
+
+        def on_error(failure):
+            if failure.check(defer.CancelledError, JobCancelled):
+                log.info("COPYSUBTITLES: Copying to %s is cancelled" % job.video_folder)
+            elif failure.check(FolderLocked):
+                log.info("COPYSUBTITLES: %s. Skipping." % failure.value)
+            else:
+                log.error("COPYSUBTITLES: Copying to %s is failed.\n%s" % (job.video_folder, failure.getTraceback()))
+
+        target, args = self.engine.job_target(target, args)
+
+        def run(*args):
+            # it is queued to the reactor before the result, so the timer is started before it is stopped
+            reactor.callFromThread(on_started)
+            return target(*args)
+
+        self.copy_pool.callInThreadWithCallback(
+            lambda success, result: reactor.callFromThread(on_result, success, result),
+            run, job, self.engine.throttle, *args
+        )
+        d.addCallbacks(on_copied, on_error)
+        return d
+
+    def run_task(self, f, *args):
+        """
+        run the function in the task thread pool, one at a time. drain waits for it
 
-    def find_subtitles(self, location):
+        :param f: function which can not be cancelled, e.g. indexing
+        :return: deferred fired with the result of the function
+        :rtype: Deferred
         """
+        d = threads.deferToThreadPool(reactor, self.task_pool, f, *args)
+        self.tasks.add(d)
 
-        :param location: contested location
-        :return:
-        :rtype: generator
-        """
-        all_files = os.listdir(location)
-        episodes_count = len(filter(TEST_VIDEO.match, all_files))
-        subtitle_count = len(filter(TEST_SUB1.match, all_files) + filter(TEST_SUB2.match, all_files))
-        # if subtitles already here check suffixes only
-        log.info("COPYSUBTITLES: %s of %s already presented" % (subtitle_count, episodes_count))
-        if subtitle_count >= episodes_count:
-            score, files = Core.score_subtitles_folder(
-                self.config["lang"], episodes_count, location
-            )
-            yield score, location, files
-
-        else:
-
-            folders = Core.get_sub_folders(location)
-            for entry in folders:
-                score, files = Core.score_subtitles_folder(
-                    self.config["lang"], episodes_count, entry
-                )
-                if not files:
-                    continue
-                yield score, entry, files
+        def on_result(result):
+            self.tasks.discard(d)
+            return result
+
+        return d.addBoth(on_result)
+
+    def on_index_error(self, failure):
+        log.error("COPYSUBTITLES: Could not index subtitles.\n%s" % failure.getTraceback())
+
+    def update(self):
+        pass
+
+    def emit_progress(self, torrent_id, state):
+        """
+        send the progress to the clients. It is called from any thread.
+        """
+        state["throughput"] = self.engine.throttle.throughput()
+        reactor.callFromThread(component.get("EventManager").emit, SubtitleProgressEvent(torrent_id, state))
 
     def on_torrent_finished(self, torrent_id):
         """
-        Copy the torrent now. It will do this in a separate thread to avoid
-        freezing up this thread (which causes freezes in the daemon and hence
-        web/gtk UI.)
+        Copy the torrent now. Matching is queued to the scheduler and done
+        in a separate thread to avoid freezing up this thread (which causes
+        freezes in the daemon and hence web/gtk UI.) Torrents with less files
+        and higher queue position are matched first.
         :param torrent_id:
         :type torrent_id: int
         :return:
         """
         torrent = component.get("TorrentManager").torrents[torrent_id]
-        info = torrent.get_status(["name", "save_path", "move_on_completed", "move_on_completed_path"])
+        info = torrent.get_status([
+            "name", "save_path", "move_on_completed", "move_on_completed_path", "queue", "file_priorities"
+        ])
 
         # get the destination path
         location = info["move_on_completed_path"] if info["move_on_completed"] else info["save_path"]
 
-        # we assume about any subtitle for should be forced
-        _p, rest = os.path.split(location)
-        forced = rest.lower() == 'anime'
-
-        # lets do the job
-        video_folders = Core.get_video_folders(location, torrent.get_files())
-        for video_folder in video_folders:
-            # sort subtitle folders according to their score
-            subtitle_folders = sorted(list(self.find_subtitles(video_folder)))
-
-            if not subtitle_folders:
+        # label is provided by the Label plugin if it is enabled
+        extra = component.get("Core").get_torrent_status(torrent_id, ["label", "tracker_host"])
+        rule = self.rules.match(location, extra.get("label"), extra.get("tracker_host"))
+
+        languages = Engine.parse_languages(rule.lang or self.config["lang"])
+        if not languages:
+            return
+
+        files = torrent.get_files()
+        # the previous match result is used to skip unchanged folders
+        previous = copy.deepcopy(self.state["torrents"].get(torrent_id))
+        if previous and previous["location"] != location:
+            previous = None
+        # finished torrents are not queued, their position is -1
+        queue = info["queue"] if info["queue"] >= 0 else 0
+        self.progress.stage(torrent_id, 'queued', name=info["name"])
+        d = self.scheduler.submit(
+            (len(files), queue), self.engine.match, torrent_id, location, files, info["file_priorities"],
+            rule, languages, previous
+        )
+        d.addCallbacks(
+            self.run_jobs, self.on_match_error, callbackArgs=(torrent_id, location, languages),
+            errbackArgs=(torrent_id,)
+        )
+
+    def run_jobs(self, plan, torrent_id, location, languages):
+        """
+        start copy jobs prepared by match and remember the match result
+
+        :param plan: see match
+        :param torrent_id: hash representing torrent in Deluge
+        :param location: torrent location
+        :param languages: list of language codes and suffixes, see parse_languages
+        :type plan: list
+        :type torrent_id: str
+        :type location: str
+        :type languages: list
+        :return:
+        """
+        if self.stopping:
+            return
+        previous = self.state["torrents"].get(torrent_id)
+        last = previous["folders"] if previous and previous["location"] == location else {}
+        folders = {}
+        stale = []
+        for video_folder, fingerprint, jobs, _extract_job in plan:
+            if jobs is None:
+                if video_folder in last:
+                    folders[video_folder] = last[video_folder]
+                else:
+                    # the match result was dropped or moved since the folder was skipped,
+                    # it is left out of the state to be matched again
+                    stale.append(video_folder)
+            else:
+                folders[video_folder] = {
+                    "fingerprint": fingerprint,
+                    "subtitle_folders": [job.subtitle_folder for job in jobs],
+                    # earlier copies are still there, they are moved with the torrent
+                    "pairs": list(last[video_folder]["pairs"]) if video_folder in last else []
+                }
+        self.state["torrents"][torrent_id] = {"location": location, "folders": folders}
+        self.state.save()
+
+        self.progress.stage(torrent_id, 'copying')
+        copies = []
+        for _video_folder, _fingerprint, jobs, extract_job in plan:
+            if jobs is None:
                 continue
-
-            _score, subtitle_folder, files = subtitle_folders[0]
-            log.info("COPYSUBTITLES: Matched %s with score %s" % (subtitle_folder, _score))
-            thread.start_new_thread(
-                Core._thread_copy, (torrent_id, video_folder, subtitle_folder, files, forced)
-            )
-
-    @staticmethod
-    def _thread_copy(torrent_id, video_folder, subtitle_folder, files, forced):
+            for job in jobs:
+                job.progress = partial(self.progress.update, torrent_id)
+            if extract_job:
+                d = self.copy(extract_job, Engine.thread_extract, languages)
+                copies.append(d.addCallback(self._copy_fallback, extract_job, jobs))
+                continue
+            for job in jobs:
+                copies.append(self.copy(job))
+        d = defer.DeferredList(copies).addCallback(lambda _r: self.progress.stage(torrent_id, 'done'))
+        if stale:
+            log.info("COPYSUBTITLES: Match result of %s changed while matching, %d folders will be matched again"
+                     % (torrent_id, len(stale)))
+            d.addCallback(lambda _r: self.rematch(torrent_id))
+
+    def record(self, job, path_pairs):
+        """
+        remember copied files of the job
         """
-        copy files
+        torrent = self.state["torrents"].get(job.torrent_id)
+        if not torrent or job.video_folder not in torrent["folders"]:
+            return
+        folder = torrent["folders"][job.video_folder]
+        # a copy replaces the earlier one of the same destination
+        destinations = set(new for _old, new in path_pairs)
+        folder["pairs"] = [p for p in folder["pairs"] if p[1] not in destinations] + [list(p) for p in path_pairs]
+        self.state.save()
+
+    def on_torrent_removed(self, torrent_id):
+        if self.state["torrents"].pop(torrent_id, None):
+            self.state.save()
+
+    def on_storage_moved(self, torrent_id, path):
+        """
+        move copied subtitles after the torrent instead of matching it again
 
-        :param torrent_id:
-        :param video_folder: destination folder
-        :param subtitle_folder: source folder
-        :param files: list of source files combined with language ('a.ass', 'ru')
-        :param forced: append forced suffix
-        :type torrent_id: int
-        :type video_folder: str
-        :type subtitle_folder: str
-        :type files: list
-        :type forced: boolean
+        :param torrent_id: hash representing torrent in Deluge
+        :param path: new torrent location
         :return:
         """
-        path_pairs = []
-        for filename, lang in files:
-            try:
-                old_file_path = os.path.join(subtitle_folder, filename)
-                filename, file_extension = os.path.splitext(filename)
-                suffixes = filename.lower().split('.')
-
-                if lang and lang not in suffixes:
-                    filename += '.' + lang
-                if forced and 'forced' not in suffixes:
-                    filename += '.forced'
-
-                new_file_path = os.path.join(video_folder, ''.join((filename, file_extension)))
-
-                # check that this file exists at the current location
-                # if not os.path.exists(old_file_path):
-                #     log.debug("COPYSUBTITLES: %s was not downloaded. Skipping." % f["path"])
-                #     break
-
-                # check that this file doesn't already exist at the new location
-                if os.path.exists(new_file_path):
-                    log.info("COPYSUBTITLES: %s already exists in the destination. Skipping." % new_file_path)
-                    continue
-
-                log.info("COPYSUBTITLES: Copying %s to %s" % (old_file_path, new_file_path))
-
-                # ensure dirs up to this exist
-                if not os.path.exists(os.path.dirname(new_file_path)):
-                    os.makedirs(os.path.dirname(new_file_path))
-
-                # copy the file
-                shutil.copy2(old_file_path, new_file_path)
-                path_pairs.append((old_file_path, new_file_path))
+        torrent = self.state["torrents"].get(torrent_id)
+        if not torrent or torrent["location"] == path:
+            return
+        old = torrent["location"]
+        pairs = [p for folder in torrent["folders"].values() for p in folder["pairs"]]
+        log.info("COPYSUBTITLES: Moving %s copied files from %s to %s" % (len(pairs), old, path))
+        d = self.run_task(relocate, pairs, old, path)
+        d.addCallbacks(self.on_relocated, self.on_match_error, callbackArgs=(torrent_id, old, path),
+                       errbackArgs=(torrent_id,))
+
+    def on_relocated(self, moved, torrent_id, old, new):
+        torrent = self.state["torrents"].get(torrent_id)
+        if not torrent or torrent["location"] != old:
+            return
+        folders = {}
+        for video_folder, folder in torrent["folders"].items():
+            folder["subtitle_folders"] = [
+                relocate_path(f, old, new) or f for f in folder["subtitle_folders"]
+            ]
+            folder["pairs"] = [
+                [relocate_path(source, old, new) or source, moved[path]]
+                for source, path in folder["pairs"] if path in moved
+            ]
+            folders[relocate_path(video_folder, old, new) or video_folder] = folder
+        torrent["location"] = new
+        torrent["folders"] = folders
+        self.state.save()
+
+    def on_match_error(self, failure, torrent_id):
+        self.progress.stage(torrent_id, 'failed')
+        if not failure.check(defer.CancelledError):
+            log.error("COPYSUBTITLES: Could not match %s.\n%s" % (torrent_id, failure.getTraceback()))
+
+    def _copy_fallback(self, path_pairs, extract_job, jobs):
+        """
+        copy external subtitles if nothing is extracted
+        """
+        if not path_pairs and not extract_job.cancelled.is_set():
+            return defer.DeferredList([self.copy(job) for job in jobs])
+        return path_pairs
 
-            except Exception, e:
-                os.error("COPYSUBTITLES: Could not copy file.\n%s" % str(e))
+    @staticmethod
+    def validate_config(config):
+        """
+        check the values of the config dictionary
 
-        component.get("EventManager").emit(TorrentCopiedEvent(torrent_id, subtitle_folder, video_folder, path_pairs))
+        :param config: changed keys of copysubtitles.conf
+        :type config: dict
+        :raise ValueError: if a key is unknown or its value is malformed
+        :return: config with the numbers converted to int
+        :rtype: dict
+        """
+        result = {}
+        for key, value in config.items():
+            if key in LIMITS:
+                if isinstance(value, bool) or not isinstance(value, (int, long, float)) or value != int(value):
+                    raise ValueError("%s should be an integer" % key)
+                value = int(value)
+                lower, upper = LIMITS[key]
+                if value < lower or (upper is not None and value > upper):
+                    raise ValueError("%s should be in range %s..%s" % (key, lower, upper or ''))
+            elif key in FLAGS:
+                if not isinstance(value, bool):
+                    raise ValueError("%s should be a boolean" % key)
+            elif key in CHOICES:
+                if value not in CHOICES[key]:
+                    raise ValueError("%s should be one of %s" % (key, ', '.join(CHOICES[key])))
+            elif key in STRINGS:
+                if not isinstance(value, basestring):
+                    raise ValueError("%s should be a string" % key)
+                if key == 'lang' and not Engine.parse_languages(value):
+                    raise ValueError("lang should list at least one language")
+            elif key in ('index_roots', 'rules'):
+                if not isinstance(value, (list, tuple)):
+                    raise ValueError("%s should be a list" % key)
+            else:
+                raise ValueError("Unknown option %s" % key)
+            result[key] = value
+        return result
 
     @export()
     def set_config(self, config):
         """
-        sets the config dictionary
+        sets the config dictionary. Values are validated before anything
+        is changed; all of them are applied at once, queued torrents are kept.
         :param config:
         :return:
         """
+        config = Core.validate_config(config)
+        # malformed rules and a store which could not be opened are rejected before anything is changed
+        rules = RuleMatcher(config["rules"]) if "rules" in config else self.rules
+        current = self.config["shared_store"], self.config["node_name"]
+        store = config.get("shared_store", current[0]), config.get("node_name", current[1])
+        reopen = store != current
+        if reopen:
+            try:
+                shared = self.open_shared(*store)
+            except SharedStoreError, e:
+                raise ValueError(str(e))
+        old_roots = self.config["index_roots"]
         for key in config.keys():
             self.config[key] = config[key]
         self.config.save()
+        self.rules = rules
+        self.engine.configure_throttle()
+        self.engine.configure_caches()
+        self.copy_pool.adjustPoolsize(maxthreads=self.config["copy_workers"])
+        self.match_pool.adjustPoolsize(maxthreads=self.config["match_workers"])
+        self.scheduler.resize(self.config["match_workers"])
+        if reopen:
+            self.replace_shared(*shared)
+        added = [root for root in self.config["index_roots"] if root not in old_roots]
+        if added:
+            self.run_task(self.engine.update_index, added).addErrback(self.on_index_error)
+
+    def replace_shared(self, shared, locks):
+        """
+        use the new shared store for the next jobs. The old one is closed when
+        the jobs which are running or queued for copying now are finished.
+        """
+        old = self.engine.shared
+        self.engine.shared, self.engine.locks = shared, locks
+        log.info("COPYSUBTITLES: Shared store is %s" % (self.config["shared_store"] or "turned off"))
+        if old:
+            defer.DeferredList(self.in_flight()).addBoth(lambda _r: old.close())
+
+    @export()
+    def get_stats(self):
+        """
+        returns the copy engine statistics
+        :return:
+        """
+        return self.engine.throttle.stats()
+
+    @export()
+    def get_progress(self):
+        """
+        returns the progress of the torrents which are not finished yet.
+        It is used to fill the status panel once, updates are pushed by SubtitleProgressEvent
+        :return:
+        """
+        return {"torrents": self.progress.snapshot(), "throughput": self.engine.throttle.throughput()}
+
+    @export()
+    def rematch(self, torrent_id):
+        """
+        match the torrent again. Only changed folders are processed
+        :param torrent_id:
+        :return:
+        """
+        if self.stopping or torrent_id not in component.get("TorrentManager").torrents:
+            return
+        self.on_torrent_finished(torrent_id)
+
+    @export()
+    def rebuild_index(self):
+        """
+        index all subtitle files under the configured roots
+        :return: count of indexed files
+        """
+        return self.run_task(self.engine.update_index, self.config["index_roots"])
 
     @export()
     def get_config(self):
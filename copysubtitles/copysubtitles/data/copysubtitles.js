@@ -31,6 +31,238 @@ Copyright:
     statement from all source files in the program, then also delete it here.
 */
 
+Ext.ns('Deluge.copysubtitles');
+
+/**
+ * Torrents which are processed by the plugin. Rows are updated by
+ * SubtitleProgressEvent pushed by the daemon, the state is requested
+ * only once when the panel is created.
+ */
+Deluge.copysubtitles.StatusPanel = Ext.extend(Ext.grid.GridPanel, {
+    // finished torrents are shown for this count of milliseconds
+    keepFinished: 10000,
+
+    constructor: function(config) {
+        config = Ext.apply({
+            border: false,
+            autoExpandColumn: 'name',
+            store: new Ext.data.JsonStore({
+                idProperty: 'id',
+                fields: ['id', 'name', 'stage', 'done', 'total', 'bytes_done', 'bytes_total', 'since']
+            }),
+            columns: [{
+                id: 'name',
+                header: _('Name'),
+                dataIndex: 'name',
+                sortable: true
+            }, {
+                header: _('Stage'),
+                dataIndex: 'stage',
+                width: 70
+            }, {
+                header: _('Progress'),
+                dataIndex: 'done',
+                width: 70,
+                renderer: function(value, meta, record) {
+                    var total = record.get('total');
+                    return total ? value + ' / ' + total : '';
+                }
+            }, {
+                header: _('Size'),
+                dataIndex: 'bytes_done',
+                width: 120,
+                renderer: function(value, meta, record) {
+                    var total = record.get('bytes_total');
+                    return total ? fsize(value) + ' / ' + fsize(total) : '';
+                }
+            }]
+        }, config);
+        Deluge.copysubtitles.StatusPanel.superclass.constructor.call(this, config);
+    },
+
+    /**
+     * @param {String} torrentId
+     * @param {Object} state see SubtitleProgressEvent
+     */
+    update: function(torrentId, state) {
+        var store = this.getStore();
+        var record = store.getById(torrentId);
+        state.id = torrentId;
+        if (record) {
+            record.beginEdit();
+            for (var field in state) {
+                if (record.fields.containsKey(field)) {
+                    record.set(field, state[field]);
+                }
+            }
+            record.endEdit();
+            record.commit();
+        } else {
+            record = new store.recordType(state, torrentId);
+            store.add(record);
+        }
+        if (state.stage == 'done' || state.stage == 'failed') {
+            (function() {
+                if (record.get('stage') == state.stage) {
+                    store.remove(record);
+                }
+            }).defer(this.keepFinished);
+        }
+    }
+});
+
+/**
+ * Preferences of the plugin. Values are validated by the daemon, workers,
+ * caches and I/O limits are applied without a restart.
+ */
+Deluge.copysubtitles.PreferencePage = Ext.extend(Ext.form.FormPanel, {
+    constructor: function(config) {
+        config = Ext.apply({
+            title: _('Subtitles'),
+            border: false,
+            autoScroll: true,
+            labelWidth: 220,
+            items: [{
+                xtype: 'fieldset',
+                title: _('Languages'),
+                autoHeight: true,
+                defaults: {width: 180},
+                items: [{
+                    xtype: 'textfield',
+                    name: 'lang',
+                    fieldLabel: _('Language priority')
+                }, {
+                    xtype: 'spinnerfield',
+                    name: 'lang_count',
+                    fieldLabel: _('Languages to copy'),
+                    minValue: 1,
+                    maxValue: 10
+                }, {
+                    xtype: 'combo',
+                    name: 'detection',
+                    hiddenName: 'detection',
+                    fieldLabel: _('Language detection'),
+                    mode: 'local',
+                    store: ['langdetect', 'suffix'],
+                    triggerAction: 'all',
+                    editable: false
+                }, {
+                    xtype: 'checkbox',
+                    name: 'transcode',
+                    boxLabel: _('Convert subtitles to UTF-8'),
+                    hideLabel: true
+                }, {
+                    xtype: 'checkbox',
+                    name: 'extract_embedded',
+                    boxLabel: _('Extract embedded subtitles of MKV files'),
+                    hideLabel: true
+                }, {
+                    xtype: 'checkbox',
+                    name: 'fonts',
+                    boxLabel: _('Place fonts used by ASS subtitles'),
+                    hideLabel: true
+                }]
+            }, {
+                xtype: 'fieldset',
+                title: _('Copying'),
+                autoHeight: true,
+                defaults: {width: 180},
+                items: [{
+                    xtype: 'combo',
+                    name: 'transfer_mode',
+                    hiddenName: 'transfer_mode',
+                    fieldLabel: _('Transfer mode'),
+                    mode: 'local',
+                    store: ['copy', 'hardlink', 'symlink'],
+                    triggerAction: 'all',
+                    editable: false
+                }, {
+                    xtype: 'spinnerfield',
+                    name: 'copy_workers',
+                    fieldLabel: _('Copying threads'),
+                    minValue: 1,
+                    maxValue: 32
+                }, {
+                    xtype: 'spinnerfield',
+                    name: 'match_workers',
+                    fieldLabel: _('Torrents matched at once'),
+                    minValue: 1,
+                    maxValue: 32
+                }, {
+                    xtype: 'spinnerfield',
+                    name: 'copy_timeout',
+                    fieldLabel: _('Copy timeout (seconds)'),
+                    minValue: 1
+                }, {
+                    xtype: 'spinnerfield',
+                    name: 'cache_size',
+                    fieldLabel: _('Score cache size (folders)'),
+                    minValue: 16,
+                    incrementValue: 64
+                }]
+            }, {
+                xtype: 'fieldset',
+                title: _('Disk I/O'),
+                autoHeight: true,
+                defaults: {width: 180},
+                items: [{
+                    xtype: 'spinnerfield',
+                    name: 'io_rate_limit',
+                    fieldLabel: _('Bandwidth limit (KiB/s, 0 is unlimited)'),
+                    minValue: 0,
+                    incrementValue: 64
+                }, {
+                    xtype: 'spinnerfield',
+                    name: 'io_ops_limit',
+                    fieldLabel: _('Operations per second (0 is unlimited)'),
+                    minValue: 0,
+                    incrementValue: 10
+                }, {
+                    xtype: 'checkbox',
+                    name: 'io_idle_priority',
+                    boxLabel: _('Idle I/O priority (Linux only)'),
+                    hideLabel: true
+                }, {
+                    xtype: 'checkbox',
+                    name: 'io_drop_cache',
+                    boxLabel: _('Drop copied files from the page cache'),
+                    hideLabel: true
+                }]
+            }]
+        }, config);
+        Deluge.copysubtitles.PreferencePage.superclass.constructor.call(this, config);
+        deluge.preferences.on('show', this.onPreferencesShow, this);
+    },
+
+    onPreferencesShow: function() {
+        deluge.client.copysubtitles.get_config({
+            success: function(config) {
+                this.getForm().setValues(config);
+            },
+            scope: this
+        });
+    },
+
+    onApply: function() {
+        deluge.client.copysubtitles.set_config(this.getForm().getFieldValues(), {
+            failure: function(error) {
+                Ext.MessageBox.show({
+                    title: _('Subtitles'),
+                    msg: _('Preferences are not applied: ') + (error.message || error),
+                    buttons: Ext.MessageBox.OK,
+                    icon: Ext.MessageBox.ERROR
+                });
+            },
+            scope: this
+        });
+    },
+
+    onDestroy: function() {
+        deluge.preferences.un('show', this.onPreferencesShow, this);
+        Deluge.copysubtitles.PreferencePage.superclass.onDestroy.call(this);
+    }
+});
+
 copysubtitlesPlugin = Ext.extend(Deluge.Plugin, {
     constructor: function(config) {
         config = Ext.apply({
@@ -40,11 +272,82 @@ copysubtitlesPlugin = Ext.extend(Deluge.Plugin, {
     },
 
     onDisable: function() {
-
+        deluge.preferences.removePage(this.prefsPage);
+        deluge.events.un('SubtitleProgressEvent', this.onProgress, this);
+        if (this.window) {
+            this.window.destroy();
+            delete this.window;
+        }
+        deluge.statusbar.remove(this.button, true);
+        delete this.button;
+        deluge.statusbar.doLayout();
     },
 
     onEnable: function() {
+        this.prefsPage = deluge.preferences.addPage(new Deluge.copysubtitles.PreferencePage());
+        this.queued = 0;
+        this.throughput = 0;
+        this.panel = new Deluge.copysubtitles.StatusPanel();
+        this.window = new Ext.Window({
+            title: _('Subtitles'),
+            layout: 'fit',
+            width: 500,
+            height: 250,
+            closeAction: 'hide',
+            items: this.panel
+        });
+        this.button = deluge.statusbar.add({
+            id: 'copysubtitles-status',
+            text: _('Subtitles'),
+            cls: 'x-btn-text',
+            handler: function() {
+                this.window.show();
+            },
+            scope: this
+        });
+        deluge.statusbar.doLayout();
+        deluge.events.on('SubtitleProgressEvent', this.onProgress, this);
+        deluge.client.copysubtitles.get_progress({
+            success: this.onGotProgress,
+            scope: this
+        });
+    },
+
+    onGotProgress: function(progress) {
+        this.throughput = progress.throughput;
+        for (var torrentId in progress.torrents) {
+            this.onProgress(torrentId, progress.torrents[torrentId]);
+        }
+        this.updateButton();
+    },
+
+    onProgress: function(torrentId, state) {
+        this.panel.update(torrentId, state);
+        if (state.queued !== undefined) {
+            this.queued = state.queued;
+        }
+        if (state.throughput !== undefined) {
+            this.throughput = state.throughput;
+        }
+        this.updateButton();
+    },
 
+    updateButton: function() {
+        var active = 0;
+        this.panel.getStore().each(function(record) {
+            var stage = record.get('stage');
+            if (stage != 'queued' && stage != 'done' && stage != 'failed') {
+                active++;
+            }
+        });
+        var text = _('Subtitles');
+        if (this.queued || active) {
+            text += String.format(': {0} {1}, {2} {3}', this.queued, _('queued'), active, _('active'));
+        }
+        if (this.throughput) {
+            text += ', ' + fspeed(this.throughput);
+        }
+        this.button.setText(text);
     }
 });
 new copysubtitlesPlugin();
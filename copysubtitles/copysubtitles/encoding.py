@@ -0,0 +1,154 @@
+#
+# encoding.py
+#
+# Copyright (C) 2009 fu2re <fu2re@yandex.ru>
+#
+# Basic plugin template created by:
+# Copyright (C) 2008 Martijn Voncken <mvoncken@gmail.com>
+# Copyright (C) 2007-2009 Andrew Resch <andrewresch@gmail.com>
+# Copyright (C) 2009 Damien Churchill <damoxc@gmail.com>
+#
+# Deluge is free software.
+#
+# You may redistribute it and/or modify it under the terms of the
+# GNU General Public License, as published by the Free Software
+# Foundation; either version 3 of the License, or (at your option)
+# any later version.
+#
+# deluge is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with deluge.    If not, write to:
+#     The Free Software Foundation, Inc.,
+#     51 Franklin Street, Fifth Floor
+#     Boston, MA  02110-1301, USA.
+#
+#    In addition, as a special exception, the copyright holders give
+#    permission to link the code of portions of this program with the OpenSSL
+#    library.
+#    You must obey the GNU General Public License in all respects for all of
+#    the code used other than OpenSSL. If you modify file(s) with this
+#    exception, you may extend this exception to your version of the file(s),
+#    but you are not obligated to do so. If you do not wish to do so, delete
+#    this exception statement from your version. If you delete this exception
+#    statement from all source files in the program, then also delete it here.
+import io
+import codecs
+import shutil
+
+
+BOMS = (
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+# size of the sample used for detection
+SAMPLE_SIZE = 4096
+# size of the chunk used for transcoding
+CHUNK_SIZE = 64 * 1024
+# part of non-ascii bytes which makes us sure it is not a western text
+CYRILLIC_RATIO = .3
+
+
+def sniff_encoding(path, size=SAMPLE_SIZE):
+    """
+    guess encoding of the text file. BOM is checked first, then the sample
+    is tested for UTF-8 and at last byte histogram is used to choose between
+    single byte encodings.
+
+    :param path: path to the text file
+    :param size: count of bytes to check
+    :type path: str
+    :type size: int
+    :return: python codec name
+    :rtype: str
+    """
+    with open(path, 'rb') as f:
+        sample = f.read(size)
+    return sniff_bytes(sample, complete=len(sample) < size)
+
+
+def sniff_bytes(sample, complete=True):
+    """
+    guess encoding of the byte string, see sniff_encoding
+
+    :param sample: contested bytes
+    :param complete: whether the sample is the whole file or its head only
+    :type sample: str
+    :type complete: bool
+    :return: python codec name
+    :rtype: str
+    """
+    for bom, encoding in BOMS:
+        if sample.startswith(bom):
+            return encoding
+
+    histogram = [0] * 256
+    for byte in bytearray(sample):
+        histogram[byte] += 1
+    high = sum(histogram[0x80:])
+    if not high:
+        return 'utf-8'
+
+    # the sample could be cut in the middle of multibyte sequence
+    try:
+        sample.decode('utf-8')
+        return 'utf-8'
+    except UnicodeDecodeError, e:
+        if not complete and e.start >= len(sample) - 3 and e.reason == 'unexpected end of data':
+            return 'utf-8'
+
+    # cyrillic letters are placed at 0xC0-0xFF in both cp1251 and koi8-r,
+    # but lower case letters are the most frequent ones in a text and
+    # they are placed at 0xE0-0xFF in cp1251 and at 0xC0-0xDF in koi8-r
+    upper_half = sum(histogram[0xE0:])
+    lower_half = sum(histogram[0xC0:0xE0])
+    letters = sum(histogram[ord('A'):ord('Z') + 1]) + sum(histogram[ord('a'):ord('z') + 1])
+    if high < (high + letters) * CYRILLIC_RATIO:
+        return 'cp1252'
+    if upper_half >= lower_half:
+        return 'cp1251'
+    return 'koi8-r'
+
+
+def is_utf8(encoding):
+    """
+    :param encoding: python codec name
+    :type encoding: str
+    :return: True if the file in this encoding could be used as UTF-8 one as is
+    :rtype: bool
+    """
+    return codecs.lookup(encoding).name == 'utf-8'
+
+
+def transcode(src, dst, encoding, throttle=None, cancelled=None, chunk_size=CHUNK_SIZE):
+    """
+    stream the text file to UTF-8 without loading it whole.
+    Line endings are kept as is.
+
+    :param src: source path
+    :param dst: destination path
+    :param encoding: source encoding, see sniff_encoding
+    :param throttle: I/O policy, see throttle.Throttle
+    :param cancelled: event which stops transcoding, see throttle.Throttle.copyfileobj
+    :param chunk_size: count of characters to read at once
+    :type src: str
+    :type dst: str
+    :type encoding: str
+    :type throttle: Throttle
+    :type cancelled: threading.Event
+    :type chunk_size: int
+    """
+    with io.open(src, 'r', encoding=encoding, errors='replace', newline='') as fi:
+        with io.open(dst, 'w', encoding='utf-8', newline='') as fo:
+            if throttle:
+                throttle.copyfileobj(fi, fo, chunk_size, cancelled)
+                throttle.finish(fi, fo)
+            else:
+                shutil.copyfileobj(fi, fo, chunk_size)
+    shutil.copystat(src, dst)
@@ -0,0 +1,959 @@
+#
+# engine.py
+#
+# Copyright (C) 2009 fu2re <fu2re@yandex.ru>
+#
+# Basic plugin template created by:
+# Copyright (C) 2008 Martijn Voncken <mvoncken@gmail.com>
+# Copyright (C) 2007-2009 Andrew Resch <andrewresch@gmail.com>
+# Copyright (C) 2009 Damien Churchill <damoxc@gmail.com>
+#
+# Deluge is free software.
+#
+# You may redistribute it and/or modify it under the terms of the
+# GNU General Public License, as published by the Free Software
+# Foundation; either version 3 of the License, or (at your option)
+# any later version.
+#
+# deluge is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with deluge.    If not, write to:
+#     The Free Software Foundation, Inc.,
+#     51 Franklin Street, Fifth Floor
+#     Boston, MA  02110-1301, USA.
+#
+#    In addition, as a special exception, the copyright holders give
+#    permission to link the code of portions of this program with the OpenSSL
+#    library.
+#    You must obey the GNU General Public License in all respects for all of
+#    the code used other than OpenSSL. If you modify file(s) with this
+#    exception, you may extend this exception to your version of the file(s),
+#    but you are not obligated to do so. If you do not wish to do so, delete
+#    this exception statement from your version. If you delete this exception
+#    statement from all source files in the program, then also delete it here.
+import re
+import os
+import json
+import logging
+from langdetect import detect_langs
+from langdetect.lang_detect_exception import LangDetectException
+import pysubs2
+from encoding import sniff_encoding, is_utf8, transcode
+from index import episode_tokens
+from records import FolderCandidate, CopyJob, SSA, SRT
+from throttle import Throttle, JobCancelled, copy_file, link_file
+from fonts import FontStore, FONT_STORE_NAME, ass_fonts
+from hashing import DigestCache
+from mkv import MatroskaFile, MatroskaError, choose_track
+from state import match_fingerprint
+from probe import DurationCache
+from shared import SharedStore
+from rules import DEFAULT_RULE
+from walker import Walker
+
+# the same logger as deluge.log.LOG, so the daemon log is not changed
+log = logging.getLogger("deluge")
+
+
+TEST_VIDEO = re.compile('.*(' + '|'.join(['mkv', 'mp4', 'avi', 'mpg']) + ')$')
+TEST_SUB1 = re.compile('.*(' + '|'.join(['ass', 'ssa']) + ')$')
+TEST_SUB2 = re.compile('.*(srt)$')
+# default density is 243 events for 23 min. It is used when the video duration is unknown
+DENS = 243 / 1418930.
+# subtitles should end within the video, but not earlier than this part of it
+TIMING_COVERAGE = .5
+# subtitles could outlast the video a bit, milliseconds
+TIMING_TOLERANCE = 5000
+ACCURACY = .65
+SCORE_CACHE_SIZE = 1024
+# file caches (digests, durations) are larger than the folder one
+FILE_CACHE_RATIO = 4
+# language detection: by the content and the file name suffix or by the suffix only
+DETECTION_BACKENDS = ('langdetect', 'suffix')
+# count of folders from other torrents to contest
+INDEX_LOOKUP_LIMIT = 5
+
+
+class Engine(object):
+    """
+    scan, score and copy subtitles. It does not depend on Deluge, so it is
+    shared by the plugin and the command line tool. Caches and the I/O
+    policy are kept between the torrents.
+    """
+
+    def __init__(self, config, index=None, shared=None, locks=None, progress=None):
+        """
+        :param config: dict-like with the keys of copysubtitles.conf
+        :param index: subtitles from other torrents. They are not contested if it is None
+        :param shared: score cache and copy journal shared with other nodes or None
+        :param locks: locks of the destination folders shared with other nodes or None
+        :param progress: progress of the torrents or None
+        :type index: SubtitleIndex
+        :type shared: SharedStore
+        :type locks: FolderLocks
+        :type progress: ProgressReporter
+        """
+        self.config = config
+        self.index = index
+        self.shared = shared
+        self.locks = locks
+        self.progress = progress
+        self.scores = {}
+        self.score_cache_size = SCORE_CACHE_SIZE
+        self.digests = DigestCache()
+        self.durations = DurationCache()
+        self.configure_caches()
+        self.throttle = Throttle()
+        self.configure_throttle()
+        self.walker = Walker()
+
+    @staticmethod
+    def parse_languages(languages):
+        """
+        split language priority list to the language codes and their suffixes
+
+        :param languages: priority list, e.g. 'ru|rus > uk|ukr > en|eng'
+        :type languages: str
+        :return: list of tuples. E.g. [('ru', 'ru|rus'), ('uk', 'uk|ukr'), ('en', 'en|eng')]
+        """
+        result = []
+        for part in languages.split('>'):
+            part = part.strip().lower()
+            if part:
+                result.append((part.split('|')[0], part))
+        return result
+
+    @staticmethod
+    def get_lang_probs(lines):
+        """
+        detect languages for the given lines. Detector is called once per line
+        and its output is reused for every language of the priority list.
+
+        :param lines: contested subtitle events
+        :type lines: list
+        :return: summary probability per language. E.g. {'ru': 27.3, 'uk': 1.2}
+        :rtype: dict
+        """
+        probs = {}
+        for line in lines:
+            try:
+                for p in detect_langs(line.text):
+                    probs[p.lang] = probs.get(p.lang, 0) + p.prob
+            except LangDetectException:
+                pass
+        return probs
+
+    @staticmethod
+    def expected_duration(filename, durations, languages):
+        """
+        get duration of the video the subtitle file belongs to
+
+        :param filename: subtitle file name
+        :param durations: video durations in milliseconds by episode number, see episode_tokens
+        :param languages: list of language codes and suffixes, see parse_languages
+        :type filename: str
+        :type durations: dict
+        :type languages: list
+        :return: duration of the same episode or the median one. None if there are no durations
+        :rtype: float
+        """
+        if not durations:
+            return None
+        _series, episode = episode_tokens(filename, languages)
+        if episode in durations:
+            return durations[episode]
+        values = sorted(durations.values())
+        return values[len(values) / 2]
+
+    @staticmethod
+    def timing_fits(end, duration):
+        """
+        :param end: end of the last subtitle event, milliseconds
+        :param duration: video duration, milliseconds
+        :return: True if the subtitles could belong to the video
+        :rtype: bool
+        """
+        return duration * TIMING_COVERAGE <= end <= duration + TIMING_TOLERANCE
+
+    @staticmethod
+    def score_subtitles_folder(languages, count, location, durations=None, detection='langdetect'):
+        """
+        get usability score for selected location and list of subtitle
+        file names near to their language for every language of the priority list.
+        Language is defined by simple majority vote. For example if 2 of 3
+        contested files is defined as RU - all the files will be marked as RU.
+        Subtitles are checked against the video duration if it is known,
+        otherwise against the default density.
+
+        :param languages: list of language codes and suffixes, see parse_languages
+        :param count: count of subtitle files we are looking for
+        :param location: contested location
+        :param durations: video durations in milliseconds by episode number, see expected_duration
+        :param detection: one of DETECTION_BACKENDS
+        :type languages: list
+        :type count: int
+        :type location: str
+        :type durations: dict
+        :type detection: str
+        :return: candidate with scores (lower is better) and labels per language.
+        E.g. FolderCandidate('/a/b', {'ru': -132211, 'en': -32211})
+        :rtype: FolderCandidate
+        """
+        score = dict((lang, 0) for lang, _suffixes in languages)
+        subs_lang = dict((lang, set()) for lang, _suffixes in languages)
+        timing = 0
+        files = os.listdir(location)
+        subs = sorted(f for f in files if TEST_SUB1.match(f) or TEST_SUB2.match(f))
+        candidate = FolderCandidate(
+            location, subs,
+            videos=sum(1 for f in files if TEST_VIDEO.match(f)),
+            ssa=sum(1 for f in subs if TEST_SUB1.match(f)),
+            srt=sum(1 for f in subs if TEST_SUB2.match(f))
+        )
+        fs = len(subs) or 10 ** -5
+        f1 = candidate.counts[SSA]
+        f2 = candidate.counts[SRT]
+        # number of contested lines. Lower is better for performance.
+        width = 30
+        sl = float(min(3, fs))
+        # contest some files
+        for filename in subs[:int(sl)]:
+            # load subtitles and check it length
+            path = os.path.join(location, filename)
+            try:
+                sub = pysubs2.load(path, encoding=sniff_encoding(path))
+            except Exception, e:
+                log.warning("COPYSUBTITLES: Could not load %s.\n%s" % (path, str(e)))
+                sub = []
+            coverage = len(sub)
+            if not coverage:
+                for lang, _suffixes in languages:
+                    subs_lang[lang].add(None)
+                continue
+            end = max(event.end for event in sub)
+            duration = Engine.expected_duration(filename, durations, languages)
+            if duration:
+                timing += int(Engine.timing_fits(end, duration))
+            else:
+                timing += (coverage / float(end or 1)) / DENS
+            # language probabilities are detected lazily and only once per file
+            probs = None
+            for lang, suffixes in languages:
+                # check existed suffix. it will be equal to 0 if it does not exist
+                f_score = int(bool(re.search('\.(' + suffixes + ')+\.', filename.lower())))
+                # if language score is still 0 check it more closely
+                if not f_score and detection == 'langdetect':
+                    if probs is None:
+                        # we should not start from begging in case of intro
+                        # that's why we try to get part from a middle
+                        start = max((coverage / 2) - (width / 2), 0)
+                        # check language for the selected part
+                        probs = Engine.get_lang_probs(sub[start:(start + width)])
+                    # normalize the score
+                    f_score = probs.get(lang, 0) / float(min(coverage, width))
+                # append language to majority vote list if it accurate enough
+                subs_lang[lang].add(lang if f_score > ACCURACY else None)
+                # stack language score
+                score[lang] += f_score
+        # get the final scores
+        cnt_score = int(fs >= count)
+        tmg_score = min(round(timing / sl), 1)
+        ssa_score = round(f1 / float(fs), 2)
+        srt_score = round(f2 / float(fs), 2)
+        for lang, _suffixes in languages:
+            lng_score = int((score[lang] / sl) > ACCURACY)
+            majority = len(subs_lang[lang]) == 1
+            log.info("COPYSUBTITLES: %s scores for %s - %s, %s, %s, %s, %s" % \
+                     (lang, location, lng_score, cnt_score, tmg_score, ssa_score, srt_score))
+            candidate.scores[lang] = -(
+                lng_score * 10 ** 5 +
+                cnt_score * 10 ** 4 +
+                tmg_score * 10 ** 3 +
+                ssa_score * 10 ** 2 +
+                srt_score
+            )
+            candidate.labels[lang] = lang if majority else None
+        return candidate
+
+    @staticmethod
+    def rank_languages(languages, candidates, limit):
+        """
+        choose the best subtitle folder for every language of the priority list
+        and keep the first `limit` languages which are really available.
+        If there is no available language the best folder for the most
+        preferred language is returned.
+        Only the best candidate per language is kept while candidates are consumed.
+
+        :param languages: list of language codes and suffixes, see parse_languages
+        :param candidates: FolderCandidate iterable, see find_subtitles
+        :param limit: count of languages to copy
+        :type languages: list
+        :type candidates: generator
+        :type limit: int
+        :return: list of tuples. E.g. [('ru', FolderCandidate('/a/b', {'ru': -132211}))]
+        """
+        best = {}
+        for candidate in candidates:
+            for lang, _suffixes in languages:
+                if lang not in best or candidate.key(lang) < best[lang].key(lang):
+                    best[lang] = candidate
+        if not best:
+            return []
+        ranked = [(lang, best[lang]) for lang, _suffixes in languages]
+        # language is available only if its language score is set
+        available = [(lang, c) for lang, c in ranked if c.available(lang)]
+        if not available:
+            return ranked[:1]
+        chosen = []
+        seen = set()
+        for lang, candidate in available:
+            key = (candidate.location, candidate.labels[lang])
+            if key in seen:
+                continue
+            seen.add(key)
+            chosen.append((lang, candidate))
+            if len(chosen) >= limit:
+                break
+        return chosen
+
+    def get_contents(self, location, test=None):
+        """
+        Get folder contents. Sibling folders are listed concurrently, see Walker
+        :param location: contested location
+        :param test: filter function, it gets the path and True if the path is a folder
+        :return: matched paths, the location goes first and every folder is followed by its contents
+        :rtype: list
+        """
+        entries, complete = self.walker.walk(location)
+        if not complete:
+            log.warning("COPYSUBTITLES: Listing of %s is not complete. Deeper folders are skipped." % location)
+        return [path for path, folder in entries if not test or test(path, folder)]
+
+    def get_sub_folders(self, location):
+        """
+        get all sub folders recursievly
+        :param location: contested location
+        :return: matched paths
+        :rtype: list
+        """
+        return self.get_contents(location, test=lambda path, folder: folder)
+
+    @staticmethod
+    def get_root_folder(location):
+        """
+        Get root folder for the given path
+        :param location: contested location
+        :return: matched path
+        :rtype: str
+        """
+        l2 = os.path.dirname(location)
+        if not l2:
+            return location
+        return Engine.get_root_folder(l2)
+
+    def get_video_folders(self, location, files, priorities=None):
+        """
+        Get sub folders which contains any video files. Torrent file list is
+        used, the filesystem is checked only to confirm that the video exists.
+        Folders are walked only if none of the listed videos is found.
+        :param location: contested location
+        :param files: list of torrent files
+        :param priorities: file priorities, deselected files are skipped
+        :return: matched paths
+        :rtype: generator
+        """
+        seen = set()
+        for f in files:
+            if priorities and priorities[f['index']] == 0:
+                continue
+            if not TEST_VIDEO.match(f['path']):
+                continue
+            path = os.path.join(location, f['path'])
+            d = os.path.dirname(path)
+            if d not in seen and os.path.exists(path):
+                seen.add(d)
+                yield d
+        if seen:
+            return
+
+        # files could be renamed or extracted from archives
+        root_folders = set(Engine.get_root_folder(f['path']) for f in files)
+        for rf in sorted(root_folders):
+            if not rf:
+                continue
+            loc = os.path.join(location, rf)
+            for path in self.get_contents(loc, test=lambda path, folder: not folder and TEST_VIDEO.match(path)):
+                d = os.path.dirname(path)
+                if d not in seen:
+                    seen.add(d)
+                    yield d
+
+    def score_cached(self, languages, count, location, durations=None):
+        """
+        cached version of score_subtitles_folder. Cached scores are valid
+        until the folder is modified.
+
+        :param languages: list of language codes and suffixes, see parse_languages
+        :param count: count of subtitle files we are looking for
+        :param location: contested location
+        :param durations: video durations, see score_subtitles_folder
+        :return: see score_subtitles_folder
+        """
+        detection = self.config["detection"]
+        key = (location, count, tuple(languages), tuple(sorted((durations or {}).items())), detection)
+        mtime = os.stat(location).st_mtime
+        cached = self.scores.get(key)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        if len(self.scores) >= self.score_cache_size:
+            self.scores.clear()
+        scores = None
+        if self.shared:
+            # the folder could be scored by another node already
+            shared_key = SharedStore.score_key(location, count, languages, durations, detection)
+            scores = self.shared.get_scores(shared_key, location, mtime)
+        if scores is None:
+            scores = Engine.score_subtitles_folder(languages, count, location, durations, detection)
+            if self.shared:
+                self.shared.put_scores(shared_key, mtime, scores)
+        self.scores[key] = (mtime, scores)
+        return scores
+
+    def find_subtitles(self, location, languages):
+        """
+
+        :param location: contested location
+        :param languages: list of language codes and suffixes, see parse_languages
+        :return: scored candidates
+        :rtype: generator
+        """
+        all_files = os.listdir(location)
+        episodes_count = len(filter(TEST_VIDEO.match, all_files))
+        # only the container headers are read
+        durations = {}
+        for f in filter(TEST_VIDEO.match, all_files):
+            duration = self.durations.duration(os.path.join(location, f))
+            if duration:
+                durations[episode_tokens(f, languages)[1]] = duration
+        subtitle_count = len(filter(TEST_SUB1.match, all_files) + filter(TEST_SUB2.match, all_files))
+        # if subtitles already here check suffixes only
+        log.info("COPYSUBTITLES: %s of %s already presented" % (subtitle_count, episodes_count))
+        if subtitle_count >= episodes_count:
+            yield self.score_cached(languages, episodes_count, location, durations)
+
+        else:
+
+            folders = self.get_sub_folders(location)
+            for entry in folders:
+                candidate = self.score_cached(languages, episodes_count, entry, durations)
+                if not candidate.names:
+                    continue
+                yield candidate
+
+            if not self.index:
+                return
+            # subtitles could be shipped in another torrent
+            episodes = [episode_tokens(f, languages) for f in filter(TEST_VIDEO.match, all_files)]
+            for entry in self.index.lookup(episodes, exclude=location)[:INDEX_LOOKUP_LIMIT]:
+                candidate = self.score_cached(languages, episodes_count, entry, durations)
+                if not candidate.names:
+                    continue
+                yield candidate
+
+    def update_index(self, locations):
+        """
+        index subtitle files of the given locations
+
+        :param locations: list of paths
+        :type locations: list
+        :return: count of indexed files
+        :rtype: int
+        """
+        if not self.index:
+            return 0
+        languages = Engine.parse_languages(self.config["lang"])
+        count = 0
+        for location in locations:
+            if os.path.exists(location):
+                count += self.index.update(location, languages)
+        log.info("COPYSUBTITLES: %s subtitle files indexed" % count)
+        return count
+
+    def match(self, torrent_id, location, files, priorities, rule, languages, previous=None):
+        """
+        find subtitles for the video folders of the torrent. It is run in the thread pool.
+
+        :param torrent_id: hash representing torrent in Deluge or None
+        :param location: torrent location
+        :param files: list of torrent files, see list_files
+        :param priorities: file priorities
+        :param rule: the matched rule, see RuleMatcher
+        :param languages: list of language codes and suffixes, see parse_languages
+        :param previous: the last match result of the torrent. Folders which are not changed since are skipped
+        :type previous: dict
+        :return: list of tuples, ( video folder, fingerprint, copy jobs, extract job or None ).
+        Jobs are None if the folder is not changed.
+        :rtype: list
+        """
+        folders = previous["folders"] if previous else {}
+        # index subtitles of this torrent for the next ones
+        if self.index:
+            self.index.update_files([os.path.join(location, f['path']) for f in files], languages)
+
+        # lets do the job
+        plan = []
+        if self.progress:
+            self.progress.stage(torrent_id, 'scanning')
+        video_folders = list(self.get_video_folders(location, files, priorities))
+        if self.progress:
+            self.progress.stage(torrent_id, 'scoring', len(video_folders))
+        for video_folder in video_folders:
+            plan.append(self.match_folder(torrent_id, location, video_folder, folders.get(video_folder), rule,
+                                          languages))
+            if self.progress:
+                self.progress.update(torrent_id, done=1)
+        return plan
+
+    def match_folder(self, torrent_id, location, video_folder, last, rule, languages):
+        """
+        find subtitles for the video folder, see match
+
+        :param last: the last match result of the folder or None
+        :type last: dict
+        :return: video folder, fingerprint, copy jobs and extract job. Jobs are None if the folder is not changed.
+        :rtype: tuple
+        """
+        if last:
+            fingerprint = match_fingerprint(
+                video_folder, last["subtitle_folders"], [new for _old, new in last["pairs"]]
+            )
+            if fingerprint == last["fingerprint"] and all(os.path.exists(new) for _old, new in last["pairs"]):
+                log.info("COPYSUBTITLES: %s is not changed. Skipping." % video_folder)
+                return video_folder, fingerprint, None, None
+
+        # choose the best subtitle folder for the most preferred languages
+        chosen = Engine.rank_languages(
+            languages, self.find_subtitles(video_folder, languages), self.config["lang_count"]
+        )
+        jobs = []
+        for lang, candidate in chosen:
+            log.info("COPYSUBTITLES: Matched %s with score %s for %s" % (
+                candidate.location, candidate.scores[lang], lang))
+            jobs.append(CopyJob(
+                torrent_id, video_folder, candidate.location, candidate.files(lang),
+                suffixes=rule.suffixes, to_utf8=self.config["transcode"],
+                mode=rule.mode or self.config["transfer_mode"], root=location
+            ))
+
+        extract_job = None
+        if self.config["extract_embedded"] and not any(c.available(lang) for lang, c in chosen):
+            # there are no subtitles in the desired language, try the embedded ones
+            extract_job = CopyJob(torrent_id, video_folder, video_folder, [], rule.suffixes, root=location)
+        fingerprint = match_fingerprint(video_folder, [job.subtitle_folder for job in jobs])
+        return video_folder, fingerprint, jobs, extract_job
+
+    def configure_caches(self):
+        """
+        apply the cache size from the config. Shrunk caches are cleared
+        :return:
+        """
+        self.score_cache_size = self.config["cache_size"]
+        if len(self.scores) > self.score_cache_size:
+            self.scores.clear()
+        self.digests.resize(self.score_cache_size * FILE_CACHE_RATIO)
+        self.durations.resize(self.score_cache_size * FILE_CACHE_RATIO)
+
+    def configure_throttle(self):
+        """
+        apply I/O limits from the config to the copy engine
+        :return:
+        """
+        self.throttle.configure(
+            rate=self.config["io_rate_limit"] * 1024,
+            ops=self.config["io_ops_limit"],
+            idle=self.config["io_idle_priority"],
+            nocache=self.config["io_drop_cache"]
+        )
+
+    @staticmethod
+    def thread_locked(job, throttle, locks, target, *args):
+        """
+        run the target holding the lock of the destination folder
+
+        :param job: files to copy
+        :param throttle: I/O policy
+        :param locks: locks shared with other nodes
+        :param target: see job_target
+        :param args: extra arguments of the target
+        :type job: CopyJob
+        :type throttle: Throttle
+        :type locks: FolderLocks
+        :raise FolderLocked: if another node copies into the folder
+        :return: result of the target
+        """
+        locks.acquire(job.video_folder)
+        try:
+            return target(job, throttle, *args)
+        finally:
+            locks.release(job.video_folder)
+
+    @staticmethod
+    def video_stem(name, stems):
+        """
+        find the video the subtitle file belongs to.
+
+        :param name: subtitle file name
+        :param stems: names of the videos without the extension
+        :type name: str
+        :type stems: list
+        :return: the longest video name the subtitle name starts with, or the subtitle name without the extension
+        :rtype: str
+        """
+        matched = [stem for stem in stems if name.startswith(stem + '.')]
+        return max(matched, key=len) if matched else os.path.splitext(name)[0]
+
+    @staticmethod
+    def thread_copy(job, throttle, digests, font_store=None, journal=None):
+        """
+        copy files. Files identical to the existing ones are skipped,
+        stale files are replaced atomically.
+
+        :param job: files to copy
+        :param throttle: I/O policy
+        :param digests: content hashes cache
+        :param font_store: storage for the fonts used by ASS subtitles. Fonts are not copied if it is None
+        :param journal: copy journal shared with other nodes or None
+        :type job: CopyJob
+        :type throttle: Throttle
+        :type digests: DigestCache
+        :type font_store: FontStore
+        :type journal: SharedStore
+        :return: list of tuples ( old path, new path ), count of skipped and count of replaced files,
+        list of tuples ( old path, existing path ) of the copies which are skipped as identical
+        :rtype: tuple
+        """
+        throttle.start()
+        path_pairs = []
+        # earlier copies are remembered again, so they are moved with the torrent
+        kept = []
+        skipped = replaced = 0
+        fonts = set()
+        # subtitles which are already at the destination
+        existing = []
+        videos = []
+        if os.path.isdir(job.video_folder):
+            names = os.listdir(job.video_folder)
+            existing = [os.path.join(job.video_folder, f) for f in names if TEST_SUB1.match(f) or TEST_SUB2.match(f)]
+            videos = [os.path.splitext(f)[0] for f in names if TEST_VIDEO.match(f)]
+        sizes = {}
+        if job.progress:
+            for sub_file in job.files:
+                try:
+                    sizes[sub_file.name] = os.path.getsize(os.path.join(job.subtitle_folder, sub_file.name))
+                except OSError:
+                    pass
+            job.progress(total=len(job.files), bytes_total=sum(sizes.values()))
+        for sub_file in job.files:
+            tmp_file_path = None
+            try:
+                if job.cancelled.is_set():
+                    raise JobCancelled()
+                filename, lang = sub_file.name, sub_file.lang
+                old_file_path = os.path.join(job.subtitle_folder, filename)
+                filename, file_extension = os.path.splitext(filename)
+                suffixes = filename.lower().split('.')
+
+                if lang and lang not in suffixes:
+                    filename += '.' + lang
+                for suffix in job.suffixes:
+                    if suffix not in suffixes:
+                        filename += '.' + suffix
+
+                new_file_path = os.path.join(job.video_folder, ''.join((filename, file_extension)))
+                if os.path.normpath(new_file_path) == os.path.normpath(old_file_path):
+                    log.info("COPYSUBTITLES: %s is already in place. Skipping." % new_file_path)
+                    skipped += 1
+                    continue
+                # only the subtitles of the same video could be the same copy under another suffix,
+                # an identical file of another episode does not replace this one.
+                # The source itself is among the existing files if the subtitles are next to the video
+                stem = Engine.video_stem(os.path.basename(new_file_path), videos) + '.'
+                candidates = [
+                    f for f in existing
+                    if os.path.basename(f).startswith(stem) and os.path.normpath(f) != os.path.normpath(old_file_path)
+                ]
+
+                # check that this file exists at the current location
+                # if not os.path.exists(old_file_path):
+                #     log.debug("COPYSUBTITLES: %s was not downloaded. Skipping." % f["path"])
+                #     break
+
+                # collect fonts referenced by ASS styles
+                if font_store and TEST_SUB1.match(old_file_path):
+                    fonts.update(ass_fonts(old_file_path, sniff_encoding(old_file_path)))
+
+                # the file could be copied by another node
+                owner = journal and os.path.exists(new_file_path) and journal.copied(old_file_path, new_file_path)
+                if owner:
+                    log.info("COPYSUBTITLES: %s is already copied by %s. Skipping." % (new_file_path, owner))
+                    skipped += 1
+                    kept.append((old_file_path, new_file_path))
+                    continue
+
+                encoding = sniff_encoding(old_file_path) if job.to_utf8 else None
+                transcoding = encoding and not is_utf8(encoding)
+
+                # check that the same file doesn't already exist at the new location
+                identical = None if transcoding else digests.find(old_file_path, candidates, throttle)
+                if identical:
+                    log.info("COPYSUBTITLES: %s already exists in the destination. Skipping." % identical)
+                    skipped += 1
+                    kept.append((old_file_path, identical))
+                    continue
+
+                log.info("COPYSUBTITLES: Copying %s to %s" % (old_file_path, new_file_path))
+
+                # ensure dirs up to this exist
+                if not os.path.exists(os.path.dirname(new_file_path)):
+                    os.makedirs(os.path.dirname(new_file_path))
+
+                # copy the file next to the destination, so it could be replaced atomically
+                tmp_file_path = os.path.join(
+                    os.path.dirname(new_file_path), '.%s.part' % os.path.basename(new_file_path)
+                )
+                if transcoding:
+                    log.info("COPYSUBTITLES: Transcoding %s from %s" % (old_file_path, encoding))
+                    transcode(old_file_path, tmp_file_path, encoding, throttle, job.cancelled)
+                    identical = digests.find(tmp_file_path, candidates, throttle)
+                    if identical:
+                        log.info("COPYSUBTITLES: %s already exists in the destination. Skipping." % identical)
+                        os.remove(tmp_file_path)
+                        skipped += 1
+                        kept.append((old_file_path, identical))
+                        continue
+                elif job.mode != 'copy':
+                    if not link_file(old_file_path, tmp_file_path, job.mode == 'symlink', throttle, job.cancelled):
+                        log.info("COPYSUBTITLES: Could not %s %s, copied instead" % (job.mode, old_file_path))
+                else:
+                    copy_file(old_file_path, tmp_file_path, throttle, job.cancelled)
+
+                stale = os.path.exists(new_file_path)
+                if stale and os.name == 'nt':
+                    os.remove(new_file_path)
+                os.rename(tmp_file_path, new_file_path)
+                if stale:
+                    log.info("COPYSUBTITLES: %s is replaced" % new_file_path)
+                    replaced += 1
+                else:
+                    existing.append(new_file_path)
+                path_pairs.append((old_file_path, new_file_path))
+
+            except JobCancelled:
+                # do not leave partially copied file
+                if tmp_file_path and os.path.exists(tmp_file_path):
+                    os.remove(tmp_file_path)
+                raise
+
+            except Exception, e:
+                log.error("COPYSUBTITLES: Could not copy file.\n%s" % str(e))
+
+            finally:
+                if job.progress:
+                    job.progress(done=1, bytes_done=sizes.get(sub_file.name, 0))
+
+        if fonts:
+            try:
+                if not font_store.location:
+                    # the storage should be on the download volume, otherwise fonts could not be hardlinked
+                    font_store = FontStore(os.path.join(job.root or job.video_folder, FONT_STORE_NAME))
+                elif not font_store.same_device(job.video_folder):
+                    log.warning("COPYSUBTITLES: Font storage %s is not on the device of %s. It is not used." % (
+                        font_store.location, job.video_folder))
+                    font_store = FontStore(None)
+                font_pairs = font_store.collect(
+                    fonts, job.subtitle_folder, os.path.join(job.video_folder, 'Fonts'), throttle
+                )
+                log.info("COPYSUBTITLES: %s of %s fonts placed to %s" % (len(font_pairs), len(fonts), job.video_folder))
+                path_pairs.extend(font_pairs)
+            except Exception, e:
+                log.error("COPYSUBTITLES: Could not place fonts.\n%s" % str(e))
+
+        if journal and path_pairs:
+            journal.record(path_pairs)
+        return path_pairs, skipped, replaced, kept
+
+    @staticmethod
+    def thread_extract(job, throttle, languages):
+        """
+        extract embedded subtitles of the mkv files which have no external ones
+
+        :param job: video folder to process, its files are ignored
+        :param throttle: I/O policy
+        :param languages: list of language codes and suffixes, see parse_languages
+        :type job: CopyJob
+        :type throttle: Throttle
+        :type languages: list
+        :return: see thread_copy
+        :rtype: tuple
+        """
+        throttle.start()
+        path_pairs = []
+        files = os.listdir(job.video_folder)
+        subs = [f for f in files if TEST_SUB1.match(f) or TEST_SUB2.match(f)]
+        for filename in files:
+            if not filename.lower().endswith('.mkv'):
+                continue
+            name = os.path.splitext(filename)[0]
+            if any(s.startswith(name + '.') for s in subs):
+                continue
+            video_path = os.path.join(job.video_folder, filename)
+            tmp_file_path = None
+            try:
+                with MatroskaFile(video_path) as video:
+                    chosen = choose_track(video.subtitle_tracks(), languages)
+                    if not chosen:
+                        continue
+                    lang, track = chosen
+                    suffixes = [lang] + list(job.suffixes)
+                    new_file_path = os.path.join(
+                        job.video_folder, '.'.join([name] + suffixes) + track.extension
+                    )
+                    tmp_file_path = os.path.join(job.video_folder, '.%s.part' % os.path.basename(new_file_path))
+                    log.info("COPYSUBTITLES: Extracting track %s of %s" % (track.number, video_path))
+                    count = video.extract(track, tmp_file_path, job.cancelled, throttle)
+                if job.cancelled.is_set():
+                    raise JobCancelled()
+                if not count:
+                    os.remove(tmp_file_path)
+                    continue
+                throttle.acquire(os.path.getsize(tmp_file_path))
+                os.rename(tmp_file_path, new_file_path)
+                path_pairs.append((video_path, new_file_path))
+
+            except JobCancelled:
+                if tmp_file_path and os.path.exists(tmp_file_path):
+                    os.remove(tmp_file_path)
+                raise
+
+            except (MatroskaError, IOError, OSError), e:
+                log.error("COPYSUBTITLES: Could not extract subtitles.\n%s" % str(e))
+
+        return path_pairs, 0, 0, []
+
+    def job_target(self, target=None, args=()):
+        """
+        :param target: function to run instead of thread_copy, see thread_extract
+        :param args: extra arguments of the target
+        :return: function to run the copy job with and its extra arguments
+        :rtype: tuple
+        """
+        if target is None:
+            target = Engine.thread_copy
+            args = (self.digests, FontStore(self.config["font_store"]) if self.config["fonts"] else None, self.shared)
+        if self.locks:
+            args = (self.locks, target) + tuple(args)
+            target = Engine.thread_locked
+        return target, tuple(args)
+
+    def run_job(self, job, target=None, *args):
+        """
+        run the copy job in the calling thread
+
+        :param job: files to copy
+        :param target: see job_target
+        :param args: extra arguments of the target
+        :type job: CopyJob
+        :return: see thread_copy
+        :rtype: tuple
+        """
+        target, args = self.job_target(target, args)
+        return target(job, self.throttle, *args)
+
+    @staticmethod
+    def list_files(path):
+        """
+        list files below the path the way torrent files are listed
+
+        :param path: folder or a single file
+        :type path: str
+        :return: location the files are relative to and the list of files
+        :rtype: tuple
+        """
+        path = os.path.abspath(path)
+        location = os.path.dirname(path)
+        if os.path.isfile(path):
+            paths = [path]
+        else:
+            paths = sorted(os.path.join(d, f) for d, _dirs, files in os.walk(path) for f in files)
+        return location, [
+            {'path': os.path.relpath(p, location), 'index': i, 'size': os.path.getsize(p)}
+            for i, p in enumerate(paths)
+        ]
+
+    def process(self, path, rule=DEFAULT_RULE):
+        """
+        match and copy subtitles for the path in the calling thread
+
+        :param path: folder or a single video file
+        :param rule: see RuleMatcher
+        :type path: str
+        :type rule: Rule
+        :return: report, e.g. {'path': '/a/b', 'folders': [{'folder': '/a/b', 'copied': [['/a/b/s/1.ass',
+        '/a/b/1.ru.ass']], 'skipped': 0, 'replaced': 0, 'errors': []}]}
+        :rtype: dict
+        """
+        report = {'path': path, 'folders': [], 'errors': []}
+        if not os.path.exists(path):
+            report['errors'].append('%s does not exist' % path)
+            return report
+        languages = Engine.parse_languages(rule.lang or self.config["lang"])
+        try:
+            location, files = Engine.list_files(path)
+            plan = self.match(None, location, files, None, rule, languages)
+        except Exception, e:
+            log.error("COPYSUBTITLES: Could not match %s.\n%s" % (path, str(e)))
+            report['errors'].append(str(e))
+            return report
+
+        for video_folder, _fingerprint, jobs, extract_job in plan:
+            folder = {'folder': video_folder, 'copied': [], 'skipped': 0, 'replaced': 0, 'errors': []}
+            report['folders'].append(folder)
+            if extract_job:
+                jobs = [(extract_job, Engine.thread_extract, (languages,))] + [(job, None, ()) for job in jobs]
+            else:
+                jobs = [(job, None, ()) for job in jobs]
+            for job, target, args in jobs:
+                try:
+                    path_pairs, skipped, replaced, _kept = self.run_job(job, target, *args)
+                except Exception, e:
+                    log.error("COPYSUBTITLES: Copying to %s is failed.\n%s" % (video_folder, str(e)))
+                    folder['errors'].append(str(e))
+                    continue
+                folder['copied'].extend([list(p) for p in path_pairs])
+                folder['skipped'] += skipped
+                folder['replaced'] += replaced
+                # external subtitles are copied only if nothing is extracted
+                if target and path_pairs:
+                    break
+        return report
+
+    @staticmethod
+    def summary(reports):
+        """
+        :param reports: list of process results
+        :type reports: list
+        :return: JSON document with the reports and the totals
+        :rtype: str
+        """
+        folders = [f for r in reports for f in r['folders']]
+        return json.dumps({
+            'copied': sum(len(f['copied']) for f in folders),
+            'skipped': sum(f['skipped'] for f in folders),
+            'replaced': sum(f['replaced'] for f in folders),
+            'errors': sum(len(r['errors']) for r in reports) + sum(len(f['errors']) for f in folders),
+            'paths': reports
+        }, indent=2, sort_keys=True)
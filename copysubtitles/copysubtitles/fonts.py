@@ -0,0 +1,273 @@
+#
+# fonts.py
+#
+# Copyright (C) 2009 fu2re <fu2re@yandex.ru>
+#
+# Basic plugin template created by:
+# Copyright (C) 2008 Martijn Voncken <mvoncken@gmail.com>
+# Copyright (C) 2007-2009 Andrew Resch <andrewresch@gmail.com>
+# Copyright (C) 2009 Damien Churchill <damoxc@gmail.com>
+#
+# Deluge is free software.
+#
+# You may redistribute it and/or modify it under the terms of the
+# GNU General Public License, as published by the Free Software
+# Foundation; either version 3 of the License, or (at your option)
+# any later version.
+#
+# deluge is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with deluge.    If not, write to:
+#     The Free Software Foundation, Inc.,
+#     51 Franklin Street, Fifth Floor
+#     Boston, MA  02110-1301, USA.
+#
+#    In addition, as a special exception, the copyright holders give
+#    permission to link the code of portions of this program with the OpenSSL
+#    library.
+#    You must obey the GNU General Public License in all respects for all of
+#    the code used other than OpenSSL. If you modify file(s) with this
+#    exception, you may extend this exception to your version of the file(s),
+#    but you are not obligated to do so. If you do not wish to do so, delete
+#    this exception statement from your version. If you delete this exception
+#    statement from all source files in the program, then also delete it here.
+import re
+import os
+import io
+import struct
+
+from hashing import file_digest
+from throttle import copy_file
+
+
+TEST_FONT = re.compile('.*\.(ttf|otf|ttc)$', re.IGNORECASE)
+TEST_FONT_FOLDER = re.compile('^(fonts?|attachments)$', re.IGNORECASE)
+# inline font override, e.g. {\fnArial}
+FONT_OVERRIDE = re.compile(r'\\fn([^\\}]+)')
+# name table records: family, full name, typographic family
+FONT_NAME_IDS = (1, 4, 16)
+# the default storage folder in the torrent location
+FONT_STORE_NAME = '.copysubtitles-fonts'
+# count of parent folders to look for the fonts folder
+FONT_FOLDER_DEPTH = 2
+
+
+def ass_fonts(path, encoding='utf-8'):
+    """
+    get names of the fonts used by the styles and inline overrides of ASS subtitles
+
+    :param path: subtitle location
+    :param encoding: subtitle encoding
+    :type path: str
+    :type encoding: str
+    :return: lower cased font names
+    :rtype: set
+    """
+    fonts = set()
+    section = None
+    fontname = 1
+    with io.open(path, 'r', encoding=encoding, errors='replace') as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith('['):
+                section = line.lower()
+            elif section in ('[v4+ styles]', '[v4 styles]'):
+                key, _sep, value = line.partition(':')
+                fields = [v.strip() for v in value.split(',')]
+                if key == 'Format':
+                    fields = [v.lower() for v in fields]
+                    fontname = fields.index('fontname') if 'fontname' in fields else 1
+                elif key == 'Style' and len(fields) > fontname:
+                    fonts.add(fields[fontname])
+            elif section == '[events]' and line.startswith('Dialogue:'):
+                fonts.update(FONT_OVERRIDE.findall(line))
+    # vertical fonts are referenced with @ prefix
+    return set(f.lstrip('@').strip().lower() for f in fonts if f.strip())
+
+
+def font_names(path):
+    """
+    get family names of the font reading its name table only
+
+    :param path: TrueType/OpenType font or collection location
+    :type path: str
+    :return: lower cased names
+    :rtype: set
+    """
+    names = set()
+    with open(path, 'rb') as f:
+        tag = f.read(4)
+        if tag == 'ttcf':
+            _version, count = struct.unpack('>II', f.read(8))
+            offsets = struct.unpack('>%dI' % count, f.read(4 * count))
+        else:
+            offsets = (0,)
+        for offset in offsets:
+            names.update(_font_names(f, offset))
+    return names
+
+
+def _font_names(f, offset):
+    f.seek(offset + 4)
+    count, = struct.unpack('>H', f.read(2))
+    f.seek(offset + 12)
+    for _i in range(count):
+        tag, _checksum, table, _length = struct.unpack('>4sIII', f.read(16))
+        if tag == 'name':
+            break
+    else:
+        return
+    f.seek(table)
+    _format, records, storage = struct.unpack('>HHH', f.read(6))
+    entries = [struct.unpack('>HHHHHH', f.read(12)) for _i in range(records)]
+    for platform, _encoding, _language, name_id, length, string_offset in entries:
+        if name_id not in FONT_NAME_IDS:
+            continue
+        f.seek(table + storage + string_offset)
+        raw = f.read(length)
+        try:
+            if platform in (0, 3):
+                name = raw.decode('utf-16-be')
+            else:
+                name = raw.decode('mac-roman')
+        except UnicodeDecodeError:
+            continue
+        yield name.strip().lower()
+
+
+def find_font_files(location):
+    """
+    find font files placed in the fonts folders near to the subtitles folder
+
+    :param location: subtitle folder
+    :type location: str
+    :return: font file paths
+    :rtype: list
+    """
+    result = []
+    folder = location
+    for _i in range(FONT_FOLDER_DEPTH + 1):
+        try:
+            entries = os.listdir(folder)
+        except OSError:
+            break
+        for entry in entries:
+            fonts_folder = os.path.join(folder, entry)
+            if TEST_FONT_FOLDER.match(entry) and os.path.isdir(fonts_folder):
+                for dir_path, _dirs, files in os.walk(fonts_folder):
+                    result.extend(os.path.join(dir_path, f) for f in files if TEST_FONT.match(f))
+        folder = os.path.dirname(folder)
+    return result
+
+
+class FontStore(object):
+    """
+    content addressed font storage. Every font is stored once by its
+    content hash and hardlinked to the video folders.
+    """
+
+    def __init__(self, location):
+        """
+        :param location: storage folder. Fonts are copied without the storage if it is None
+        :type location: str
+        """
+        self.location = location
+
+    def same_device(self, path):
+        """
+        :param path: destination folder, it could be not created yet
+        :type path: str
+        :return: True if fonts of the storage could be hardlinked to the path
+        :rtype: bool
+        """
+        devices = []
+        for folder in (self.location, path):
+            folder = os.path.abspath(folder)
+            while not os.path.exists(folder) and os.path.dirname(folder) != folder:
+                folder = os.path.dirname(folder)
+            devices.append(os.stat(folder).st_dev)
+        return devices[0] == devices[1]
+
+    def add(self, path, throttle=None):
+        """
+        put the font to the storage if it is not there yet
+
+        :param path: font location
+        :param throttle: I/O policy of the hashing and copying
+        :type path: str
+        :type throttle: Throttle
+        :return: stored font location
+        :rtype: str
+        """
+        digest = file_digest(path, throttle=throttle)
+        _name, ext = os.path.splitext(path)
+        stored = os.path.join(self.location, digest[:2], digest + ext.lower())
+        if not os.path.exists(stored):
+            if not os.path.exists(os.path.dirname(stored)):
+                os.makedirs(os.path.dirname(stored))
+            tmp = stored + '.tmp'
+            copy_file(path, tmp, throttle)
+            os.rename(tmp, stored)
+        return stored
+
+    def place(self, path, destination, throttle=None):
+        """
+        place the font to the destination via the storage. Font is hardlinked
+        if the destination is on the same device and copied otherwise.
+        Without the storage the font is copied.
+
+        :param path: font location
+        :param destination: new font location
+        :param throttle: I/O policy of the hashing and copying
+        :type path: str
+        :type destination: str
+        :type throttle: Throttle
+        :return: True if the font is placed
+        :rtype: bool
+        """
+        if os.path.exists(destination):
+            return False
+        if not os.path.exists(os.path.dirname(destination)):
+            os.makedirs(os.path.dirname(destination))
+        if self.location is None:
+            copy_file(path, destination, throttle)
+            return True
+        stored = self.add(path, throttle)
+        try:
+            os.link(stored, destination)
+        except OSError:
+            copy_file(stored, destination, throttle)
+        return True
+
+    def collect(self, fonts, location, destination, throttle=None):
+        """
+        place the fonts referenced by subtitles to the destination fonts folder
+
+        :param fonts: lower cased font names, see ass_fonts
+        :param location: subtitle folder
+        :param destination: destination fonts folder
+        :param throttle: I/O policy of the hashing and copying
+        :type fonts: set
+        :type location: str
+        :type destination: str
+        :type throttle: Throttle
+        :return: list of tuples, ( old path, new path )
+        :rtype: list
+        """
+        path_pairs = []
+        if not fonts:
+            return path_pairs
+        for path in find_font_files(location):
+            try:
+                if not font_names(path) & fonts:
+                    continue
+            except (IOError, struct.error):
+                continue
+            new_path = os.path.join(destination, os.path.basename(path))
+            if self.place(path, new_path, throttle):
+                path_pairs.append((path, new_path))
+        return path_pairs
@@ -47,6 +47,14 @@ import deluge.common
 
 from common import get_resource
 
+# config keys edited with spin buttons, check buttons and combo boxes
+SPINS = ('lang_count', 'copy_workers', 'match_workers', 'copy_timeout', 'cache_size', 'io_rate_limit', 'io_ops_limit')
+CHECKS = ('transcode', 'extract_embedded', 'fonts', 'io_idle_priority', 'io_drop_cache')
+COMBOS = {
+    'transfer_mode': ('copy', 'hardlink', 'symlink'),
+    'detection': ('langdetect', 'suffix'),
+}
+
 class GtkUI(GtkPluginBase):
     def enable(self):
         self.glade = gtk.glade.XML(get_resource("config.glade"))
@@ -63,13 +71,36 @@ class GtkUI(GtkPluginBase):
     def on_apply_prefs(self):
         log.debug("applying prefs for copysubtitles")
         config = {
-            "test":self.glade.get_widget("txt_test").get_text()
+            "lang": self.glade.get_widget("txt_lang").get_text()
         }
-        client.copysubtitles.set_config(config)
+        for key in SPINS:
+            config[key] = self.glade.get_widget("spin_" + key).get_value_as_int()
+        for key in CHECKS:
+            config[key] = self.glade.get_widget("chk_" + key).get_active()
+        for key, values in COMBOS.items():
+            config[key] = values[max(self.glade.get_widget("combo_" + key).get_active(), 0)]
+        client.copysubtitles.set_config(config).addErrback(self.cb_set_config_error)
+
+    def cb_set_config_error(self, failure):
+        "callback for the values rejected by the core"
+        log.error("COPYSUBTITLES: %s" % failure.getErrorMessage())
+        dialog = gtk.MessageDialog(
+            component.get("Preferences").pref_dialog, gtk.DIALOG_MODAL, gtk.MESSAGE_ERROR, gtk.BUTTONS_OK,
+            "Subtitle preferences are not applied: %s" % failure.getErrorMessage()
+        )
+        dialog.run()
+        dialog.destroy()
 
     def on_show_prefs(self):
         client.copysubtitles.get_config().addCallback(self.cb_get_config)
 
     def cb_get_config(self, config):
         "callback for on show_prefs"
-        self.glade.get_widget("txt_test").set_text(config["test"])
+        self.glade.get_widget("txt_lang").set_text(config["lang"])
+        for key in SPINS:
+            self.glade.get_widget("spin_" + key).set_value(config[key])
+        for key in CHECKS:
+            self.glade.get_widget("chk_" + key).set_active(config[key])
+        for key, values in COMBOS.items():
+            if config[key] in values:
+                self.glade.get_widget("combo_" + key).set_active(values.index(config[key]))
@@ -0,0 +1,164 @@
+#
+# hashing.py
+#
+# Copyright (C) 2009 fu2re <fu2re@yandex.ru>
+#
+# Basic plugin template created by:
+# Copyright (C) 2008 Martijn Voncken <mvoncken@gmail.com>
+# Copyright (C) 2007-2009 Andrew Resch <andrewresch@gmail.com>
+# Copyright (C) 2009 Damien Churchill <damoxc@gmail.com>
+#
+# Deluge is free software.
+#
+# You may redistribute it and/or modify it under the terms of the
+# GNU General Public License, as published by the Free Software
+# Foundation; either version 3 of the License, or (at your option)
+# any later version.
+#
+# deluge is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with deluge.    If not, write to:
+#     The Free Software Foundation, Inc.,
+#     51 Franklin Street, Fifth Floor
+#     Boston, MA  02110-1301, USA.
+#
+#    In addition, as a special exception, the copyright holders give
+#    permission to link the code of portions of this program with the OpenSSL
+#    library.
+#    You must obey the GNU General Public License in all respects for all of
+#    the code used other than OpenSSL. If you modify file(s) with this
+#    exception, you may extend this exception to your version of the file(s),
+#    but you are not obligated to do so. If you do not wish to do so, delete
+#    this exception statement from your version. If you delete this exception
+#    statement from all source files in the program, then also delete it here.
+import os
+import hashlib
+import threading
+
+try:
+    from xxhash import xxh64 as fast_hash
+except ImportError:
+    fast_hash = getattr(hashlib, 'blake2b', hashlib.sha1)
+
+
+# size of the chunk used for hashing
+CHUNK_SIZE = 64 * 1024
+# count of cached digests
+DIGEST_CACHE_SIZE = 4096
+
+
+def file_digest(path, chunk_size=CHUNK_SIZE, algorithm=hashlib.sha1, throttle=None):
+    """
+    get content hash of the file
+
+    :param path: file location
+    :param chunk_size: count of bytes to read at once
+    :param algorithm: hashlib compatible constructor
+    :param throttle: I/O policy the reads are limited by, see throttle.Throttle
+    :type path: str
+    :type chunk_size: int
+    :type throttle: Throttle
+    :return: hex digest
+    :rtype: str
+    """
+    h = algorithm()
+    with open(path, 'rb') as f:
+        while True:
+            buf = f.read(chunk_size)
+            if not buf:
+                break
+            if throttle:
+                throttle.acquire(len(buf), copied=False)
+            h.update(buf)
+    return h.hexdigest()
+
+
+class DigestCache(object):
+    """
+    thread safe cache of the fast content hashes by inode.
+    Cached digest is used until the file size or mtime is changed.
+    """
+
+    def __init__(self, size=DIGEST_CACHE_SIZE):
+        """
+        :param size: count of cached digests
+        :type size: int
+        """
+        self.size = size
+        self.lock = threading.Lock()
+        self.digests = {}
+
+    def resize(self, size):
+        """
+        :param size: count of cached digests. The cache is cleared if it is larger
+        :type size: int
+        """
+        with self.lock:
+            self.size = size
+            if len(self.digests) > size:
+                self.digests.clear()
+
+    def digest(self, path, throttle=None):
+        """
+        :param path: file location
+        :param throttle: I/O policy of the reads, see file_digest
+        :type path: str
+        :type throttle: Throttle
+        :return: hex digest
+        :rtype: str
+        """
+        st = os.stat(path)
+        key = st.st_dev, st.st_ino
+        with self.lock:
+            cached = self.digests.get(key)
+        if cached and cached[:2] == (st.st_size, st.st_mtime):
+            return cached[2]
+        digest = file_digest(path, algorithm=fast_hash, throttle=throttle)
+        with self.lock:
+            if len(self.digests) >= self.size:
+                self.digests.clear()
+            self.digests[key] = st.st_size, st.st_mtime, digest
+        return digest
+
+    def same(self, a, b, throttle=None):
+        """
+        compare files by size and then by content hash
+
+        :param a: file location
+        :param b: another file location
+        :param throttle: I/O policy of the reads, see file_digest
+        :type a: str
+        :type b: str
+        :type throttle: Throttle
+        :return: True if the files are byte identical
+        :rtype: bool
+        """
+        if os.path.getsize(a) != os.path.getsize(b):
+            return False
+        return self.digest(a, throttle) == self.digest(b, throttle)
+
+    def find(self, path, candidates, throttle=None):
+        """
+        find a file with the same content
+
+        :param path: file location
+        :param candidates: contested file locations
+        :param throttle: I/O policy of the reads, see file_digest
+        :type path: str
+        :type candidates: list
+        :type throttle: Throttle
+        :return: location of the identical file or None
+        :rtype: str
+        """
+        size = os.path.getsize(path)
+        for candidate in candidates:
+            try:
+                if os.path.getsize(candidate) == size and self.same(path, candidate, throttle):
+                    return candidate
+            except OSError:
+                continue
+        return None
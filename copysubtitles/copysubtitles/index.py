@@ -0,0 +1,232 @@
+#
+# index.py
+#
+# Copyright (C) 2009 fu2re <fu2re@yandex.ru>
+#
+# Basic plugin template created by:
+# Copyright (C) 2008 Martijn Voncken <mvoncken@gmail.com>
+# Copyright (C) 2007-2009 Andrew Resch <andrewresch@gmail.com>
+# Copyright (C) 2009 Damien Churchill <damoxc@gmail.com>
+#
+# Deluge is free software.
+#
+# You may redistribute it and/or modify it under the terms of the
+# GNU General Public License, as published by the Free Software
+# Foundation; either version 3 of the License, or (at your option)
+# any later version.
+#
+# deluge is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with deluge.    If not, write to:
+#     The Free Software Foundation, Inc.,
+#     51 Franklin Street, Fifth Floor
+#     Boston, MA  02110-1301, USA.
+#
+#    In addition, as a special exception, the copyright holders give
+#    permission to link the code of portions of this program with the OpenSSL
+#    library.
+#    You must obey the GNU General Public License in all respects for all of
+#    the code used other than OpenSSL. If you modify file(s) with this
+#    exception, you may extend this exception to your version of the file(s),
+#    but you are not obligated to do so. If you do not wish to do so, delete
+#    this exception statement from your version. If you delete this exception
+#    statement from all source files in the program, then also delete it here.
+import re
+import os
+import sqlite3
+import threading
+
+
+TEST_SUB = re.compile('.*\.(ass|ssa|srt)$', re.IGNORECASE)
+# S01E02, 1x02
+SEASON_EPISODE = re.compile('s(\d{1,2})\s*e(\d{1,4})|\\b(\d{1,2})x(\d{1,4})\\b')
+# ep02, episode 2, e02, - 02, #02
+EPISODE = re.compile('(?:\\bep?|\\bepisode|\s-|#)\s*(\d{1,4})(?:v\d)?\\b')
+# any standalone number which is not a resolution, codec or a year
+NUMBER = re.compile('(?<![\dxh])(\d{1,4})(?:v\d)?(?![\dpik])')
+# [Group], (1080p), {tags}
+TAGS = re.compile('\[[^\]]*\]|\([^)]*\)|\{[^}]*\}')
+WORDS = re.compile('[^\W_]+', re.UNICODE)
+
+
+def episode_tokens(filename, languages=()):
+    """
+    get series name and episode number for the given file name.
+    Season is folded into the episode, so S02E05 becomes 2005.
+
+    :param filename: video or subtitle file name without a folder
+    :param languages: list of language codes and suffixes to strip, see Engine.parse_languages
+    :type filename: str
+    :type languages: list
+    :return: series name and episode number. E.g. ('show name', 5) or ('movie', None)
+    :rtype: tuple
+    """
+    name = filename.lower()
+    # strip extension and language/forced suffixes
+    parts = name.split('.')
+    if len(parts) > 1:
+        parts.pop()
+    suffixes = set(['forced', 'sdh'])
+    for _lang, patterns in languages:
+        suffixes.update(patterns.split('|'))
+    while len(parts) > 1 and parts[-1] in suffixes:
+        parts.pop()
+    name = TAGS.sub(' ', ' '.join(parts).replace('_', ' '))
+
+    episode = None
+    match = SEASON_EPISODE.search(name)
+    if match:
+        season, number = match.group(1, 2) if match.group(1) else match.group(3, 4)
+        episode = int(season) * 1000 + int(number)
+    else:
+        match = EPISODE.search(name) or NUMBER.search(name)
+        if match:
+            episode = int(match.group(1))
+    series = name[:match.start()] if match else name
+    return ' '.join(WORDS.findall(series)), episode
+
+
+def get_lang(filename, languages):
+    """
+    get language code by the file name suffix
+
+    :param filename: subtitle file name
+    :param languages: list of language codes and suffixes, see Engine.parse_languages
+    :return: language code or None
+    """
+    suffixes = filename.lower().split('.')[1:-1]
+    for lang, patterns in languages:
+        if set(patterns.split('|')) & set(suffixes):
+            return lang
+    return None
+
+
+class SubtitleIndex(object):
+    """
+    index of subtitle files under the download roots stored in SQLite,
+    so the subtitles from another torrent could be found by a lookup
+    instead of the filesystem search.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: database location
+        :type path: str
+        """
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.text_factory = str
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS subtitles ("
+            "path TEXT PRIMARY KEY, folder TEXT, series TEXT, episode INTEGER, lang TEXT, mtime REAL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS subtitles_episode ON subtitles (series, episode)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS subtitles_folder ON subtitles (folder)")
+        self.db.commit()
+
+    def empty(self):
+        """
+        :return: True if nothing is indexed yet
+        :rtype: bool
+        """
+        with self.lock:
+            return self.db.execute("SELECT 1 FROM subtitles LIMIT 1").fetchone() is None
+
+    def close(self):
+        with self.lock:
+            self.db.commit()
+            self.db.close()
+
+    def update(self, location, languages):
+        """
+        index all subtitle files below the location. Files which are not
+        exist anymore are dropped, unchanged files are kept as is.
+
+        :param location: contested location
+        :param languages: list of language codes and suffixes, see Engine.parse_languages
+        :type location: str
+        :type languages: list
+        :return: count of indexed files
+        :rtype: int
+        """
+        location = os.path.normpath(location)
+        if os.path.isfile(location):
+            # single file torrent
+            walk = [(os.path.dirname(location), [], [os.path.basename(location)])]
+        else:
+            walk = os.walk(location)
+        rows = []
+        for folder, _dirs, files in walk:
+            rows.extend(self._rows([os.path.join(folder, f) for f in files], languages))
+
+        with self.lock:
+            self.db.execute(
+                "DELETE FROM subtitles WHERE path = ? OR folder = ? OR substr(folder, 1, ?) = ?",
+                (location, location, len(location) + 1, os.path.join(location, ''))
+            )
+            self.db.executemany("INSERT OR REPLACE INTO subtitles VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self.db.commit()
+        return len(rows)
+
+    def update_files(self, paths, languages):
+        """
+        index the given subtitle files, e.g. taken from the torrent file list
+
+        :param paths: file locations. Files which are not subtitles are ignored
+        :param languages: list of language codes and suffixes, see Engine.parse_languages
+        :type paths: list
+        :type languages: list
+        :return: count of indexed files
+        :rtype: int
+        """
+        rows = self._rows(paths, languages)
+        with self.lock:
+            self.db.executemany("INSERT OR REPLACE INTO subtitles VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self.db.commit()
+        return len(rows)
+
+    @staticmethod
+    def _rows(paths, languages):
+        rows = []
+        for path in paths:
+            folder, filename = os.path.split(path)
+            if not TEST_SUB.match(filename):
+                continue
+            try:
+                mtime = os.stat(path).st_mtime
+            except OSError:
+                continue
+            series, episode = episode_tokens(filename, languages)
+            rows.append((path, folder, series, episode, get_lang(filename, languages), mtime))
+        return rows
+
+    def lookup(self, episodes, exclude=None):
+        """
+        find folders with subtitles for the given episodes
+
+        :param episodes: list of tuples (series, episode), see episode_tokens
+        :param exclude: folder which should be skipped with all its sub folders
+        :type episodes: list
+        :type exclude: str
+        :return: folders ordered by count of matched episodes, the most complete first
+        :rtype: list
+        """
+        matched = {}
+        with self.lock:
+            for series, episode in set(episodes):
+                if not series:
+                    continue
+                for (folder,) in self.db.execute(
+                        "SELECT DISTINCT folder FROM subtitles WHERE series = ? AND episode IS ?",
+                        (series, episode)):
+                    matched[folder] = matched.get(folder, 0) + 1
+        if exclude:
+            exclude = os.path.join(os.path.normpath(exclude), '')
+            matched = dict(
+                (f, c) for f, c in matched.items() if not os.path.join(f, '').startswith(exclude)
+            )
+        return [f for c, f in sorted((-c, f) for f, c in matched.items()) if os.path.isdir(f)]
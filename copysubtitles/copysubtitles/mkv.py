@@ -0,0 +1,578 @@
+#
+# mkv.py
+#
+# Copyright (C) 2009 fu2re <fu2re@yandex.ru>
+#
+# Basic plugin template created by:
+# Copyright (C) 2008 Martijn Voncken <mvoncken@gmail.com>
+# Copyright (C) 2007-2009 Andrew Resch <andrewresch@gmail.com>
+# Copyright (C) 2009 Damien Churchill <damoxc@gmail.com>
+#
+# Deluge is free software.
+#
+# You may redistribute it and/or modify it under the terms of the
+# GNU General Public License, as published by the Free Software
+# Foundation; either version 3 of the License, or (at your option)
+# any later version.
+#
+# deluge is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with deluge.    If not, write to:
+#     The Free Software Foundation, Inc.,
+#     51 Franklin Street, Fifth Floor
+#     Boston, MA  02110-1301, USA.
+#
+#    In addition, as a special exception, the copyright holders give
+#    permission to link the code of portions of this program with the OpenSSL
+#    library.
+#    You must obey the GNU General Public License in all respects for all of
+#    the code used other than OpenSSL. If you modify file(s) with this
+#    exception, you may extend this exception to your version of the file(s),
+#    but you are not obligated to do so. If you do not wish to do so, delete
+#    this exception statement from your version. If you delete this exception
+#    statement from all source files in the program, then also delete it here.
+import os
+import zlib
+import struct
+
+
+# element ids
+EBML = 0x1A45DFA3
+SEGMENT = 0x18538067
+SEEK_HEAD = 0x114D9B74
+SEEK = 0x4DBB
+SEEK_ID = 0x53AB
+SEEK_POSITION = 0x53AC
+INFO = 0x1549A966
+TIMECODE_SCALE = 0x2AD7B1
+DURATION = 0x4489
+TRACKS = 0x1654AE6B
+TRACK_ENTRY = 0xAE
+TRACK_NUMBER = 0xD7
+TRACK_TYPE = 0x83
+CODEC_ID = 0x86
+CODEC_PRIVATE = 0x63A2
+LANGUAGE = 0x22B59C
+LANGUAGE_IETF = 0x22B59D
+NAME = 0x536E
+FLAG_DEFAULT = 0x88
+FLAG_FORCED = 0x55AA
+CONTENT_ENCODINGS = 0x6D80
+CONTENT_ENCODING = 0x6240
+CONTENT_COMPRESSION = 0x5034
+CONTENT_COMP_ALGO = 0x4254
+CONTENT_COMP_SETTINGS = 0x4255
+CUES = 0x1C53BB6B
+CUE_POINT = 0xBB
+CUE_TRACK_POSITIONS = 0xB7
+CUE_TRACK = 0xF7
+CUE_CLUSTER_POSITION = 0xF1
+CLUSTER = 0x1F43B675
+TIMECODE = 0xE7
+SIMPLE_BLOCK = 0xA3
+BLOCK_GROUP = 0xA0
+BLOCK = 0xA1
+BLOCK_DURATION = 0x9B
+
+TRACK_TYPE_SUBTITLE = 0x11
+COMP_ZLIB = 0
+COMP_HEADER_STRIPPING = 3
+UNKNOWN_SIZE = -1
+# subtitle codecs near to the extension of the extracted file
+SUBTITLE_CODECS = {
+    'S_TEXT/ASS': '.ass',
+    'S_ASS': '.ass',
+    'S_TEXT/SSA': '.ssa',
+    'S_SSA': '.ssa',
+    'S_TEXT/UTF8': '.srt',
+}
+# used when the block has no duration
+DEFAULT_DURATION = 2000
+ASS_EVENTS = '[Events]\nFormat: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text\n'
+SSA_EVENTS = '[Events]\nFormat: Marked, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text\n'
+
+
+class MatroskaError(Exception):
+    pass
+
+
+def read_vint(f, keep_marker=False):
+    """
+    read variable size integer
+
+    :param f: file object
+    :param keep_marker: keep length marker bits, used for element ids
+    :return: value and its length in bytes
+    :rtype: tuple
+    """
+    first = f.read(1)
+    if not first:
+        raise EOFError()
+    first = ord(first)
+    length = 1
+    mask = 0x80
+    while length <= 8 and not first & mask:
+        length += 1
+        mask >>= 1
+    if length > 8:
+        raise MatroskaError('invalid variable size integer')
+    value = first if keep_marker else first & (mask - 1)
+    unknown = value == mask - 1
+    for byte in bytearray(f.read(length - 1)):
+        value = (value << 8) | byte
+        unknown = unknown and byte == 0xFF
+    if unknown and not keep_marker:
+        return UNKNOWN_SIZE, length
+    return value, length
+
+
+def read_element(f):
+    """
+    read element header
+
+    :param f: file object
+    :return: element id, data size and data offset
+    :rtype: tuple
+    """
+    element_id, _length = read_vint(f, keep_marker=True)
+    size, _length = read_vint(f)
+    return element_id, size, f.tell()
+
+
+def read_uint(data):
+    value = 0
+    for byte in bytearray(data):
+        value = (value << 8) | byte
+    return value
+
+
+def read_float(data):
+    if len(data) == 4:
+        return struct.unpack('>f', data)[0]
+    if len(data) == 8:
+        return struct.unpack('>d', data)[0]
+    return 0.
+
+
+class Track(object):
+    """
+    track header
+    """
+    __slots__ = ('number', 'type', 'codec', 'language', 'name', 'private', 'default', 'forced', 'compression')
+
+    def __init__(self):
+        self.number = 0
+        self.type = 0
+        self.codec = ''
+        # default language according to the specification
+        self.language = 'eng'
+        self.name = ''
+        self.private = ''
+        self.default = True
+        self.forced = False
+        # compression algorithm and its settings
+        self.compression = None
+
+    def __repr__(self):
+        return 'Track(%s, %r, %r)' % (self.number, self.codec, self.language)
+
+    @property
+    def extension(self):
+        """
+        :return: extension of the extracted file or None if the track is not a text subtitle
+        :rtype: str
+        """
+        if self.type != TRACK_TYPE_SUBTITLE:
+            return None
+        return SUBTITLE_CODECS.get(self.codec)
+
+    def decode(self, data):
+        """
+        :param data: block payload
+        :return: decompressed payload
+        """
+        if self.compression is None:
+            return data
+        algorithm, settings = self.compression
+        if algorithm == COMP_ZLIB:
+            return zlib.decompress(data)
+        if algorithm == COMP_HEADER_STRIPPING:
+            return settings + data
+        raise MatroskaError('unsupported compression %s' % algorithm)
+
+
+class MatroskaFile(object):
+    """
+    Matroska reader which reads only the segment headers and cues.
+    Clusters are read only to extract subtitle blocks and their video
+    payload is skipped with seek.
+    """
+
+    def __init__(self, path, elements=(INFO, TRACKS, CUES)):
+        """
+        :param path: mkv file location
+        :param elements: top level elements to read, e.g. (INFO,) to get the duration only
+        :type path: str
+        :type elements: tuple
+        """
+        self.path = path
+        self.elements = elements
+        self.f = open(path, 'rb')
+        self.size = os.fstat(self.f.fileno()).st_size
+        self.timecode_scale = 1000000
+        self.duration = None
+        self.tracks = []
+        # track number -> cluster positions relative to the segment data
+        self.cues = {}
+        self.segment = None
+        self.segment_end = None
+        self.first_cluster = None
+        # where the header scan stopped when the requested elements were found before the clusters
+        self.scanned = None
+        try:
+            self._read_headers()
+        except (EOFError, struct.error):
+            raise MatroskaError('%s is truncated' % path)
+
+    def close(self):
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def children(self, end):
+        """
+        iterate child elements up to the end offset
+
+        :param end: end offset of the parent element or None if its size is unknown
+        :return: element id, data size and data offset. Element data should be read or skipped by caller.
+        :rtype: generator
+        """
+        end = self.size if end is None else end
+        while self.f.tell() < end:
+            element_id, size, offset = read_element(self.f)
+            yield element_id, size, offset
+            self.f.seek(offset + size if size != UNKNOWN_SIZE else offset)
+
+    def _read_headers(self):
+        element_id, size, offset = read_element(self.f)
+        if element_id != EBML:
+            raise MatroskaError('%s is not a matroska file' % self.path)
+        self.f.seek(offset + size)
+        element_id, size, offset = read_element(self.f)
+        if element_id != SEGMENT:
+            raise MatroskaError('%s has no segment' % self.path)
+        self.segment = offset
+        self.segment_end = offset + size if size != UNKNOWN_SIZE else self.size
+
+        seek = {}
+        seen = set()
+        position = self.segment
+        while position < self.segment_end:
+            self.f.seek(position)
+            element_id, size, offset = read_element(self.f)
+            if element_id == CLUSTER:
+                self.first_cluster = position
+                break
+            if size == UNKNOWN_SIZE:
+                break
+            self._read_top_level(element_id, size, offset, seek)
+            seen.add(element_id)
+            position = offset + size
+            if seen.issuperset(self.elements):
+                self.scanned = position
+                break
+        # the rest of the headers could be placed after the clusters
+        for element_id in self.elements:
+            if element_id not in seen and element_id in seek:
+                self.f.seek(self.segment + seek[element_id])
+                element_id, size, offset = read_element(self.f)
+                self._read_top_level(element_id, size, offset, seek)
+
+    def _read_top_level(self, element_id, size, offset, seek):
+        end = offset + size
+        if element_id == SEEK_HEAD:
+            for child, child_size, _offset in self.children(end):
+                if child != SEEK:
+                    continue
+                target = position = None
+                for field, field_size, _offset in self.children(self.f.tell() + child_size):
+                    data = self.f.read(field_size)
+                    if field == SEEK_ID:
+                        target = read_uint(data)
+                    elif field == SEEK_POSITION:
+                        position = read_uint(data)
+                if target is not None and position is not None:
+                    seek.setdefault(target, position)
+        elif element_id not in self.elements:
+            return
+        elif element_id == INFO:
+            for child, child_size, _offset in self.children(end):
+                if child == TIMECODE_SCALE:
+                    self.timecode_scale = read_uint(self.f.read(child_size))
+                elif child == DURATION:
+                    self.duration = read_float(self.f.read(child_size))
+        elif element_id == TRACKS:
+            for child, child_size, child_offset in self.children(end):
+                if child == TRACK_ENTRY:
+                    self.tracks.append(self._read_track(child_offset + child_size))
+        elif element_id == CUES:
+            self._read_cues(end)
+
+    def _read_track(self, end):
+        track = Track()
+        for element_id, size, offset in self.children(end):
+            if element_id == CONTENT_ENCODINGS:
+                track.compression = self._read_compression(offset + size)
+                continue
+            data = self.f.read(size)
+            if element_id == TRACK_NUMBER:
+                track.number = read_uint(data)
+            elif element_id == TRACK_TYPE:
+                track.type = read_uint(data)
+            elif element_id == CODEC_ID:
+                track.codec = data.rstrip('\0')
+            elif element_id == CODEC_PRIVATE:
+                track.private = data
+            elif element_id == LANGUAGE:
+                track.language = data.rstrip('\0').lower()
+            elif element_id == LANGUAGE_IETF:
+                track.language = data.rstrip('\0').lower().split('-')[0]
+            elif element_id == NAME:
+                track.name = data.rstrip('\0')
+            elif element_id == FLAG_DEFAULT:
+                track.default = bool(read_uint(data))
+            elif element_id == FLAG_FORCED:
+                track.forced = bool(read_uint(data))
+        return track
+
+    def _read_compression(self, end):
+        compression = None
+        for element_id, size, offset in self.children(end):
+            if element_id == CONTENT_ENCODING:
+                for child, child_size, child_offset in self.children(offset + size):
+                    if child != CONTENT_COMPRESSION:
+                        continue
+                    algorithm, settings = COMP_ZLIB, ''
+                    for field, field_size, _offset in self.children(child_offset + child_size):
+                        data = self.f.read(field_size)
+                        if field == CONTENT_COMP_ALGO:
+                            algorithm = read_uint(data)
+                        elif field == CONTENT_COMP_SETTINGS:
+                            settings = data
+                    compression = algorithm, settings
+        return compression
+
+    def _read_cues(self, end):
+        for element_id, size, offset in self.children(end):
+            if element_id != CUE_POINT:
+                continue
+            for child, child_size, child_offset in self.children(offset + size):
+                if child != CUE_TRACK_POSITIONS:
+                    continue
+                track = position = None
+                for field, field_size, _offset in self.children(child_offset + child_size):
+                    if field == CUE_TRACK:
+                        track = read_uint(self.f.read(field_size))
+                    elif field == CUE_CLUSTER_POSITION:
+                        position = read_uint(self.f.read(field_size))
+                if track is not None and position is not None:
+                    self.cues.setdefault(track, set()).add(position)
+
+    def subtitle_tracks(self):
+        """
+        :return: text subtitle tracks
+        :rtype: list
+        """
+        return [t for t in self.tracks if t.extension]
+
+    def clusters(self, track):
+        """
+        get offsets of the clusters which contain blocks of the track.
+        Cues are used when they are indexing the track, otherwise all the clusters are visited.
+
+        :param track: track number
+        :return: absolute offsets of the clusters
+        :rtype: generator
+        """
+        if self.cues.get(track):
+            for position in sorted(self.cues[track]):
+                yield self.segment + position
+            return
+        if self.first_cluster is None and self.scanned is not None:
+            self._find_first_cluster()
+        if self.first_cluster is None:
+            return
+        offset = self.first_cluster
+        while offset < self.segment_end:
+            self.f.seek(offset)
+            try:
+                element_id, size, data_offset = read_element(self.f)
+            except EOFError:
+                return
+            if element_id == CLUSTER:
+                yield offset
+            if size == UNKNOWN_SIZE:
+                return
+            offset = data_offset + size
+
+    def _find_first_cluster(self):
+        position, self.scanned = self.scanned, None
+        while position < self.segment_end:
+            self.f.seek(position)
+            try:
+                element_id, size, offset = read_element(self.f)
+            except EOFError:
+                return
+            if element_id == CLUSTER:
+                self.first_cluster = position
+                return
+            if size == UNKNOWN_SIZE:
+                return
+            position = offset + size
+
+    def blocks(self, track, cancelled=None, throttle=None):
+        """
+        read blocks of the track. Payload of the other tracks is skipped.
+
+        :param track: track
+        :param cancelled: event which stops the reading
+        :param throttle: I/O policy, a cluster is one operation of the size of the blocks read there
+        :type track: Track
+        :type cancelled: threading.Event
+        :type throttle: Throttle
+        :return: start and duration in milliseconds and payload of the blocks
+        :rtype: generator
+        """
+        scale = self.timecode_scale / 1000000.
+        for cluster in self.clusters(track.number):
+            if cancelled is not None and cancelled.is_set():
+                return
+            self.f.seek(cluster)
+            element_id, size, offset = read_element(self.f)
+            if element_id != CLUSTER:
+                continue
+            end = offset + size if size != UNKNOWN_SIZE else self.segment_end
+            cluster_timecode = 0
+            read = 0
+            for child, child_size, child_offset in self.children(end):
+                if child == TIMECODE:
+                    cluster_timecode = read_uint(self.f.read(child_size))
+                elif child == SIMPLE_BLOCK:
+                    block = self._read_block(track, child_offset + child_size)
+                    if block:
+                        read += len(block[1])
+                        yield (cluster_timecode + block[0]) * scale, DEFAULT_DURATION, block[1]
+                elif child == BLOCK_GROUP:
+                    block, duration = None, None
+                    for field, field_size, field_offset in self.children(child_offset + child_size):
+                        if field == BLOCK:
+                            block = self._read_block(track, field_offset + field_size)
+                        elif field == BLOCK_DURATION:
+                            duration = read_uint(self.f.read(field_size)) * scale
+                    if block:
+                        read += len(block[1])
+                        yield (cluster_timecode + block[0]) * scale, duration or DEFAULT_DURATION, block[1]
+                elif child == CLUSTER:
+                    # the next cluster of the cluster with unknown size
+                    break
+            if throttle:
+                throttle.acquire(read, copied=False)
+
+    def _read_block(self, track, end):
+        number, _length = read_vint(self.f)
+        if number != track.number:
+            return None
+        timecode, _flags = struct.unpack('>hB', self.f.read(3))
+        return timecode, track.decode(self.f.read(end - self.f.tell()))
+
+    def extract(self, track, path, cancelled=None, throttle=None):
+        """
+        write text subtitle track to the file
+
+        :param track: subtitle track
+        :param path: destination file
+        :param cancelled: event which stops the extraction
+        :param throttle: I/O policy of the reads, see blocks
+        :type track: Track
+        :type path: str
+        :type cancelled: threading.Event
+        :type throttle: Throttle
+        :return: count of extracted events
+        :rtype: int
+        """
+        events = []
+        for start, duration, data in self.blocks(track, cancelled, throttle):
+            events.append((start, start + duration, data))
+        if cancelled is not None and cancelled.is_set():
+            return 0
+        with open(path, 'wb') as f:
+            if track.extension == '.srt':
+                for i, (start, end, data) in enumerate(sorted(events)):
+                    f.write('%s\r\n%s --> %s\r\n%s\r\n\r\n' % (
+                        i + 1, srt_time(start), srt_time(end), data.rstrip('\0').strip()
+                    ))
+            else:
+                f.write(ass_header(track))
+                dialogues = []
+                for start, end, data in events:
+                    # ReadOrder, Layer, Style, Name, MarginL, MarginR, MarginV, Effect, Text
+                    fields = data.rstrip('\0').split(',', 8)
+                    if len(fields) < 9:
+                        continue
+                    try:
+                        order = int(fields[0])
+                    except ValueError:
+                        order = len(dialogues)
+                    dialogues.append((order, 'Dialogue: %s,%s,%s,%s\r\n' % (
+                        fields[1], ass_time(start), ass_time(end), ','.join(fields[2:])
+                    )))
+                for _order, line in sorted(dialogues):
+                    f.write(line)
+        return len(events)
+
+
+def ass_header(track):
+    header = track.private.rstrip('\0').replace('\r\n', '\n')
+    if '[events]' not in header.lower():
+        header = header.rstrip('\n') + '\n\n' + (ASS_EVENTS if track.extension == '.ass' else SSA_EVENTS)
+    return header.rstrip('\n').replace('\n', '\r\n') + '\r\n'
+
+
+def srt_time(ms):
+    ms = int(round(ms))
+    return '%02d:%02d:%02d,%03d' % (ms // 3600000, ms // 60000 % 60, ms // 1000 % 60, ms % 1000)
+
+
+def ass_time(ms):
+    cs = int(round(ms / 10.))
+    return '%d:%02d:%02d.%02d' % (cs // 360000, cs // 6000 % 60, cs // 100 % 60, cs % 100)
+
+
+def choose_track(tracks, languages):
+    """
+    choose subtitle track by the language priority list. ASS tracks are
+    preferred over SRT ones, forced tracks are used only when there is
+    nothing else for the language.
+
+    :param tracks: subtitle tracks
+    :param languages: list of language codes and suffixes, see Engine.parse_languages
+    :type tracks: list
+    :type languages: list
+    :return: language code and the track or None
+    :rtype: tuple
+    """
+    for lang, patterns in languages:
+        codes = patterns.split('|')
+        matched = [t for t in tracks if t.language in codes]
+        if matched:
+            matched.sort(key=lambda t: (t.forced, t.extension == '.srt', not t.default, t.number))
+            return lang, matched[0]
+    return None
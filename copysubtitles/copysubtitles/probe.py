@@ -0,0 +1,196 @@
+#
+# probe.py
+#
+# Copyright (C) 2009 fu2re <fu2re@yandex.ru>
+#
+# Basic plugin template created by:
+# Copyright (C) 2008 Martijn Voncken <mvoncken@gmail.com>
+# Copyright (C) 2007-2009 Andrew Resch <andrewresch@gmail.com>
+# Copyright (C) 2009 Damien Churchill <damoxc@gmail.com>
+#
+# Deluge is free software.
+#
+# You may redistribute it and/or modify it under the terms of the
+# GNU General Public License, as published by the Free Software
+# Foundation; either version 3 of the License, or (at your option)
+# any later version.
+#
+# deluge is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with deluge.    If not, write to:
+#     The Free Software Foundation, Inc.,
+#     51 Franklin Street, Fifth Floor
+#     Boston, MA  02110-1301, USA.
+#
+#    In addition, as a special exception, the copyright holders give
+#    permission to link the code of portions of this program with the OpenSSL
+#    library.
+#    You must obey the GNU General Public License in all respects for all of
+#    the code used other than OpenSSL. If you modify file(s) with this
+#    exception, you may extend this exception to your version of the file(s),
+#    but you are not obligated to do so. If you do not wish to do so, delete
+#    this exception statement from your version. If you delete this exception
+#    statement from all source files in the program, then also delete it here.
+import os
+import struct
+import threading
+
+from mkv import MatroskaFile, MatroskaError, INFO
+
+
+# count of cached durations
+DURATION_CACHE_SIZE = 4096
+# boxes of the mp4 which contain the movie header
+MP4_CONTAINERS = ('moov',)
+
+
+def mkv_duration(path):
+    """
+    read the duration of the matroska file. Only the segment info is read.
+
+    :param path: mkv file location
+    :type path: str
+    :return: duration in milliseconds or None if it is unknown
+    :rtype: float
+    """
+    with MatroskaFile(path, elements=(INFO,)) as video:
+        if not video.duration:
+            return None
+        return video.duration * video.timecode_scale / 1000000.
+
+
+def mp4_boxes(f, end):
+    """
+    iterate boxes up to the end offset. Box data should be read or skipped by caller.
+
+    :param f: file object
+    :param end: end offset of the parent box
+    :return: box type, data offset and end offset
+    :rtype: generator
+    """
+    position = f.tell()
+    while position + 8 <= end:
+        f.seek(position)
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        size, box_type = struct.unpack('>I4s', header)
+        offset = position + 8
+        if size == 1:
+            size = struct.unpack('>Q', f.read(8))[0]
+            offset += 8
+        elif size == 0:
+            # the box lasts up to the end of the file
+            size = end - position
+        if size < offset - position:
+            return
+        yield box_type, offset, position + size
+        position += size
+
+
+def mp4_duration(path):
+    """
+    read the duration of the mp4/mov file from its movie header.
+    Media data is skipped with seek, so the moov box could be placed at the end.
+
+    :param path: mp4 file location
+    :type path: str
+    :return: duration in milliseconds or None if it is unknown
+    :rtype: float
+    """
+    with open(path, 'rb') as f:
+        end = os.fstat(f.fileno()).st_size
+        for box_type, offset, box_end in mp4_boxes(f, end):
+            if box_type not in MP4_CONTAINERS:
+                continue
+            f.seek(offset)
+            for child, child_offset, _child_end in mp4_boxes(f, box_end):
+                if child != 'mvhd':
+                    continue
+                f.seek(child_offset)
+                version = ord(f.read(4)[:1] or '\0')
+                if version == 1:
+                    _created, _modified, timescale, duration = struct.unpack('>QQIQ', f.read(28))
+                else:
+                    _created, _modified, timescale, duration = struct.unpack('>IIII', f.read(16))
+                if not timescale or duration in (0xFFFFFFFF, 0xFFFFFFFFFFFFFFFF):
+                    return None
+                return duration * 1000. / timescale
+    return None
+
+
+PROBES = {
+    '.mkv': mkv_duration,
+    '.mp4': mp4_duration,
+    '.m4v': mp4_duration,
+    '.mov': mp4_duration,
+}
+
+
+def video_duration(path):
+    """
+    :param path: video file location
+    :type path: str
+    :return: duration in milliseconds or None if the container is not supported or broken
+    :rtype: float
+    """
+    probe = PROBES.get(os.path.splitext(path)[1].lower())
+    if probe is None:
+        return None
+    try:
+        return probe(path)
+    except (MatroskaError, IOError, OSError, EOFError, struct.error):
+        return None
+
+
+class DurationCache(object):
+    """
+    thread safe cache of the video durations by inode.
+    Cached duration is used until the file size or mtime is changed.
+    """
+
+    def __init__(self, size=DURATION_CACHE_SIZE):
+        """
+        :param size: count of cached durations
+        :type size: int
+        """
+        self.size = size
+        self.lock = threading.Lock()
+        self.durations = {}
+
+    def resize(self, size):
+        """
+        :param size: count of cached durations. The cache is cleared if it is larger
+        :type size: int
+        """
+        with self.lock:
+            self.size = size
+            if len(self.durations) > size:
+                self.durations.clear()
+
+    def duration(self, path):
+        """
+        :param path: video file location
+        :type path: str
+        :return: duration in milliseconds or None if it is unknown
+        :rtype: float
+        """
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        key = st.st_dev, st.st_ino
+        with self.lock:
+            cached = self.durations.get(key)
+        if cached and cached[:2] == (st.st_size, st.st_mtime):
+            return cached[2]
+        duration = video_duration(path)
+        with self.lock:
+            if len(self.durations) >= self.size:
+                self.durations.clear()
+            self.durations[key] = st.st_size, st.st_mtime, duration
+        return duration
@@ -0,0 +1,135 @@
+#
+# progress.py
+#
+# Copyright (C) 2009 fu2re <fu2re@yandex.ru>
+#
+# Basic plugin template created by:
+# Copyright (C) 2008 Martijn Voncken <mvoncken@gmail.com>
+# Copyright (C) 2007-2009 Andrew Resch <andrewresch@gmail.com>
+# Copyright (C) 2009 Damien Churchill <damoxc@gmail.com>
+#
+# Deluge is free software.
+#
+# You may redistribute it and/or modify it under the terms of the
+# GNU General Public License, as published by the Free Software
+# Foundation; either version 3 of the License, or (at your option)
+# any later version.
+#
+# deluge is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with deluge.    If not, write to:
+#     The Free Software Foundation, Inc.,
+#     51 Franklin Street, Fifth Floor
+#     Boston, MA  02110-1301, USA.
+#
+#    In addition, as a special exception, the copyright holders give
+#    permission to link the code of portions of this program with the OpenSSL
+#    library.
+#    You must obey the GNU General Public License in all respects for all of
+#    the code used other than OpenSSL. If you modify file(s) with this
+#    exception, you may extend this exception to your version of the file(s),
+#    but you are not obligated to do so. If you do not wish to do so, delete
+#    this exception statement from your version. If you delete this exception
+#    statement from all source files in the program, then also delete it here.
+import time
+import threading
+
+
+# the least time between two updates of the same torrent, seconds
+PROGRESS_INTERVAL = .5
+# stages of a torrent in order
+STAGES = ('queued', 'scanning', 'scoring', 'copying', 'done', 'failed')
+# stages after which the torrent is forgotten
+FINAL_STAGES = ('done', 'failed')
+
+
+class ProgressReporter(object):
+    """
+    progress of the torrents. Updates of a torrent are coalesced, so it is
+    emitted at most once per interval; stage changes are emitted at once.
+    Updates could be made from any thread, emit is called in the updating one.
+    """
+
+    def __init__(self, emit, interval=PROGRESS_INTERVAL):
+        """
+        :param emit: function which takes the torrent id and a copy of its state
+        :param interval: the least time between two updates of the same torrent, seconds
+        :type interval: float
+        """
+        self.emit = emit
+        self.interval = interval
+        self.lock = threading.Lock()
+        # torrent id -> state dict
+        self.torrents = {}
+        # torrent id -> time of the last emitted update
+        self.emitted = {}
+
+    def stage(self, key, stage, total=0, **extra):
+        """
+        move the torrent to the stage. Counters of the previous stage are reset,
+        unless the stage is final.
+
+        :param key: torrent id
+        :param stage: one of STAGES
+        :param total: count of items of the stage, e.g. video folders to score
+        :param extra: other fields of the state, e.g. name
+        :type stage: str
+        :type total: int
+        """
+        with self.lock:
+            state = self.torrents.setdefault(key, {
+                'name': None, 'since': time.time(), 'done': 0, 'total': 0, 'bytes_done': 0, 'bytes_total': 0
+            })
+            state.update(extra)
+            state['stage'] = stage
+            if stage in FINAL_STAGES:
+                # the counters of the last stage are kept as the result
+                del self.torrents[key]
+                self.emitted.pop(key, None)
+            else:
+                state.update(done=0, total=total, bytes_done=0, bytes_total=0)
+                self.emitted[key] = time.time()
+            update = self._update(key, state)
+        self.emit(key, update)
+
+    def update(self, key, done=0, total=0, bytes_done=0, bytes_total=0):
+        """
+        add to the counters of the current stage
+
+        :param key: torrent id
+        :param done: count of processed items
+        :param total: count of expected items
+        :param bytes_done: count of processed bytes
+        :param bytes_total: count of expected bytes
+        """
+        with self.lock:
+            state = self.torrents.get(key)
+            if state is None:
+                return
+            state['done'] += done
+            state['total'] += total
+            state['bytes_done'] += bytes_done
+            state['bytes_total'] += bytes_total
+            now = time.time()
+            if now - self.emitted.get(key, 0) < self.interval:
+                return
+            self.emitted[key] = now
+            update = self._update(key, state)
+        self.emit(key, update)
+
+    def _update(self, key, state):
+        update = dict(state)
+        update['queued'] = sum(1 for s in self.torrents.values() if s['stage'] == 'queued')
+        return update
+
+    def snapshot(self):
+        """
+        :return: states of the torrents which are not finished yet by torrent id
+        :rtype: dict
+        """
+        with self.lock:
+            return dict((key, dict(state)) for key, state in self.torrents.items())
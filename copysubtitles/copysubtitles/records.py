@@ -0,0 +1,169 @@
+#
+# records.py
+#
+# Copyright (C) 2009 fu2re <fu2re@yandex.ru>
+#
+# Basic plugin template created by:
+# Copyright (C) 2008 Martijn Voncken <mvoncken@gmail.com>
+# Copyright (C) 2007-2009 Andrew Resch <andrewresch@gmail.com>
+# Copyright (C) 2009 Damien Churchill <damoxc@gmail.com>
+#
+# Deluge is free software.
+#
+# You may redistribute it and/or modify it under the terms of the
+# GNU General Public License, as published by the Free Software
+# Foundation; either version 3 of the License, or (at your option)
+# any later version.
+#
+# deluge is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with deluge.    If not, write to:
+#     The Free Software Foundation, Inc.,
+#     51 Franklin Street, Fifth Floor
+#     Boston, MA  02110-1301, USA.
+#
+#    In addition, as a special exception, the copyright holders give
+#    permission to link the code of portions of this program with the OpenSSL
+#    library.
+#    You must obey the GNU General Public License in all respects for all of
+#    the code used other than OpenSSL. If you modify file(s) with this
+#    exception, you may extend this exception to your version of the file(s),
+#    but you are not obligated to do so. If you do not wish to do so, delete
+#    this exception statement from your version. If you delete this exception
+#    statement from all source files in the program, then also delete it here.
+import threading
+from array import array
+
+
+# indexes of FolderCandidate.counts
+VIDEOS, SSA, SRT = range(3)
+
+
+class SubtitleFile(object):
+    """
+    subtitle file name near to its language
+    """
+    __slots__ = ('name', 'lang')
+
+    def __init__(self, name, lang=None):
+        """
+        :param name: file name without a folder
+        :param lang: language code or None if it is unknown
+        :type name: str
+        :type lang: str
+        """
+        self.name = name
+        self.lang = lang
+
+    def __repr__(self):
+        return 'SubtitleFile(%r, %r)' % (self.name, self.lang)
+
+
+class FolderCandidate(object):
+    """
+    scores of the subtitle folder. File names are stored once and shared
+    between all the languages of the priority list.
+    """
+    __slots__ = ('location', 'names', 'counts', 'scores', 'labels')
+
+    def __init__(self, location, names, videos=0, ssa=0, srt=0):
+        """
+        :param location: contested location
+        :param names: subtitle file names
+        :param videos: count of video files
+        :param ssa: count of ass/ssa files
+        :param srt: count of srt files
+        :type location: str
+        :type names: tuple
+        :type videos: int
+        :type ssa: int
+        :type srt: int
+        """
+        self.location = location
+        self.names = tuple(names)
+        self.counts = array('I', (videos, ssa, srt))
+        # language code -> score (lower is better)
+        self.scores = {}
+        # language code -> language of the files if majority vote passed or None
+        self.labels = {}
+
+    def __repr__(self):
+        return 'FolderCandidate(%r, %s)' % (self.location, self.scores)
+
+    def key(self, lang):
+        """
+        :param lang: language code
+        :return: sort key for the language, lower is better
+        :rtype: tuple
+        """
+        return self.scores[lang], self.location
+
+    def available(self, lang):
+        """
+        :param lang: language code
+        :return: True if the language is detected for the folder
+        :rtype: bool
+        """
+        return -self.scores[lang] >= 10 ** 5
+
+    def files(self, lang):
+        """
+        :param lang: language code
+        :return: subtitle files marked with the language if majority vote passed
+        :rtype: list
+        """
+        label = self.labels.get(lang)
+        return [SubtitleFile(name, label) for name in self.names]
+
+
+class CopyJob(object):
+    """
+    subtitle files which should be copied next to the video
+    """
+    __slots__ = ('torrent_id', 'video_folder', 'subtitle_folder', 'files', 'suffixes', 'to_utf8', 'mode', 'cancelled',
+                 'progress', 'root')
+
+    def __init__(self, torrent_id, video_folder, subtitle_folder, files, suffixes=(), to_utf8=False, mode='copy',
+                 root=None):
+        """
+        :param torrent_id: hash representing torrent in Deluge
+        :param video_folder: destination folder
+        :param subtitle_folder: source folder
+        :param files: list of SubtitleFile
+        :param suffixes: extra suffixes of the copied files, e.g. ('forced',)
+        :param to_utf8: transcode subtitles to UTF-8
+        :param mode: copy, hardlink or symlink. Transcoded files are always copied
+        :param root: torrent location, the default font storage is kept there
+        :type torrent_id: str
+        :type video_folder: str
+        :type subtitle_folder: str
+        :type files: list
+        :type suffixes: tuple
+        :type to_utf8: bool
+        :type mode: str
+        :type root: str
+        """
+        self.torrent_id = torrent_id
+        self.video_folder = video_folder
+        self.subtitle_folder = subtitle_folder
+        self.files = files
+        self.suffixes = suffixes
+        self.to_utf8 = to_utf8
+        self.mode = mode
+        self.root = root
+        self.cancelled = threading.Event()
+        # called with the counters of ProgressReporter.update or None
+        self.progress = None
+
+    def cancel(self):
+        """
+        ask the copying thread to stop as soon as possible
+        """
+        self.cancelled.set()
+
+    def __repr__(self):
+        return 'CopyJob(%r, %r, %r)' % (self.torrent_id, self.video_folder, self.subtitle_folder)
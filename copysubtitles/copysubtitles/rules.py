@@ -0,0 +1,191 @@
+#
+# rules.py
+#
+# Copyright (C) 2009 fu2re <fu2re@yandex.ru>
+#
+# Basic plugin template created by:
+# Copyright (C) 2008 Martijn Voncken <mvoncken@gmail.com>
+# Copyright (C) 2007-2009 Andrew Resch <andrewresch@gmail.com>
+# Copyright (C) 2009 Damien Churchill <damoxc@gmail.com>
+#
+# Deluge is free software.
+#
+# You may redistribute it and/or modify it under the terms of the
+# GNU General Public License, as published by the Free Software
+# Foundation; either version 3 of the License, or (at your option)
+# any later version.
+#
+# deluge is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with deluge.    If not, write to:
+#     The Free Software Foundation, Inc.,
+#     51 Franklin Street, Fifth Floor
+#     Boston, MA  02110-1301, USA.
+#
+#    In addition, as a special exception, the copyright holders give
+#    permission to link the code of portions of this program with the OpenSSL
+#    library.
+#    You must obey the GNU General Public License in all respects for all of
+#    the code used other than OpenSSL. If you modify file(s) with this
+#    exception, you may extend this exception to your version of the file(s),
+#    but you are not obligated to do so. If you do not wish to do so, delete
+#    this exception statement from your version. If you delete this exception
+#    statement from all source files in the program, then also delete it here.
+import re
+import fnmatch
+
+
+# how subtitles are placed next to the video
+MODES = ('copy', 'hardlink', 'symlink')
+# python 2 compiles at most 100 groups in an expression, the whole match is one of them
+RULES_PER_PATTERN = 99
+# characters of the shell patterns which are not literal
+GLOB_CHARS = re.compile(r'[*?\[]')
+
+
+class Rule(object):
+    """
+    what to do with subtitles of the matched torrent
+    """
+    __slots__ = ('suffixes', 'lang', 'mode')
+
+    def __init__(self, suffixes=(), lang=None, mode=None):
+        """
+        :param suffixes: extra suffixes of the copied files, e.g. ('forced',)
+        :param lang: language priority list overriding the configured one, see Engine.parse_languages
+        :param mode: one of MODES or None to use the configured one
+        :type suffixes: tuple
+        :type lang: str
+        :type mode: str
+        """
+        self.suffixes = suffixes
+        self.lang = lang
+        self.mode = mode
+
+    def __repr__(self):
+        return 'Rule(%r, %r, %r)' % (self.suffixes, self.lang, self.mode)
+
+
+DEFAULT_RULE = Rule()
+
+
+def glob_pattern(glob):
+    """
+    translate the shell pattern to a regular expression which could be
+    combined with the others
+
+    :param glob: shell pattern, e.g. '*/anime'
+    :type glob: str
+    :rtype: str
+    """
+    pattern = fnmatch.translate(glob)
+    # python 2 appends the global flags which are not allowed inside of a group
+    if pattern.endswith('(?ms)'):
+        pattern = pattern[:-5]
+    return pattern
+
+
+def normalize_path(path):
+    """
+    :param path: torrent location
+    :type path: str
+    :return: the location with forward slashes and without the trailing one
+    :rtype: str
+    """
+    return path.replace('\\', '/').rstrip('/') or '/'
+
+
+class RuleMatcher(object):
+    """
+    rule table compiled once. Rules are grouped by their label and tracker
+    in a dict. Literal paths and literal path endings, e.g. '*/anime' or no
+    path at all, are looked up in dicts by the location and its endings of
+    the indexed lengths. Other path globs of every group are joined to a
+    single expression per RULES_PER_PATTERN rules, only they are matched in
+    linear time. The first matched rule of the table wins.
+    """
+
+    def __init__(self, rules):
+        """
+        :param rules: list of dicts with optional keys: path (shell pattern of the torrent location),
+        label, tracker (host), suffixes (list), lang (priority list) and mode (copy, hardlink or symlink)
+        :type rules: list
+        :raise ValueError: if a rule is malformed
+        """
+        self.rules = []
+        groups = {}
+        for i, rule in enumerate(rules):
+            unknown = set(rule) - set(['path', 'label', 'tracker', 'suffixes', 'lang', 'mode'])
+            if unknown:
+                raise ValueError("Unknown keys of the rule %s: %s" % (i, ', '.join(sorted(unknown))))
+            mode = rule.get('mode') or None
+            if mode and mode not in MODES:
+                raise ValueError("Unknown transfer mode of the rule %s: %s" % (i, mode))
+            suffixes = tuple(s.strip('.').lower() for s in rule.get('suffixes') or () if s.strip('.'))
+            self.rules.append(Rule(suffixes, rule.get('lang') or None, mode))
+            key = (rule.get('label') or '').lower() or None, (rule.get('tracker') or '').lower() or None
+            # literal path -> rule, length of the ending -> literal ending -> rule, other globs
+            exact, endings, patterns = groups.setdefault(key, ({}, {}, []))
+            path = normalize_path(rule.get('path') or '*').lower()
+            if not GLOB_CHARS.search(path):
+                exact.setdefault(path, i)
+            elif path.startswith('*') and not GLOB_CHARS.search(path[1:]):
+                endings.setdefault(len(path) - 1, {}).setdefault(path[1:], i)
+            else:
+                patterns.append((i, '(?P<r%s>%s)' % (i, glob_pattern(path))))
+        # every expression is kept with its first rule, so it is skipped when an earlier rule is found
+        self.groups = dict(
+            (key, (exact, endings, [
+                (patterns[start][0], re.compile('|'.join(p for _i, p in patterns[start:start + RULES_PER_PATTERN]),
+                                                re.I | re.S))
+                for start in range(0, len(patterns), RULES_PER_PATTERN)
+            ]))
+            for key, (exact, endings, patterns) in groups.items()
+        )
+
+    def __len__(self):
+        return len(self.rules)
+
+    def match(self, location, label=None, tracker=None):
+        """
+        :param location: torrent location
+        :param label: torrent label
+        :param tracker: tracker host
+        :type location: str
+        :type label: str
+        :type tracker: str
+        :return: the first matched rule or DEFAULT_RULE
+        :rtype: Rule
+        """
+        location = normalize_path(location)
+        label = (label or '').lower() or None
+        tracker = (tracker or '').lower() or None
+        lowered = location.lower()
+        found = None
+        for key in set([(label, tracker), (label, None), (None, tracker), (None, None)]):
+            if key not in self.groups:
+                continue
+            exact, endings, patterns = self.groups[key]
+            indexes = [exact.get(lowered)] + [
+                literal.get(lowered[len(lowered) - length:])
+                for length, literal in endings.items() if length <= len(lowered)
+            ]
+            for index in indexes:
+                if index is not None and (found is None or index < found):
+                    found = index
+            for first, pattern in patterns:
+                if found is not None and found < first:
+                    break
+                # alternatives are tried in order and the expressions hold the rules in order,
+                # so the group is the first matched rule of this key
+                m = pattern.match(location)
+                if m:
+                    index = int(m.lastgroup[1:])
+                    if found is None or index < found:
+                        found = index
+                    break
+        return DEFAULT_RULE if found is None else self.rules[found]
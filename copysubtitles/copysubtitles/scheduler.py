@@ -0,0 +1,124 @@
+#
+# scheduler.py
+#
+# Copyright (C) 2009 fu2re <fu2re@yandex.ru>
+#
+# Basic plugin template created by:
+# Copyright (C) 2008 Martijn Voncken <mvoncken@gmail.com>
+# Copyright (C) 2007-2009 Andrew Resch <andrewresch@gmail.com>
+# Copyright (C) 2009 Damien Churchill <damoxc@gmail.com>
+#
+# Deluge is free software.
+#
+# You may redistribute it and/or modify it under the terms of the
+# GNU General Public License, as published by the Free Software
+# Foundation; either version 3 of the License, or (at your option)
+# any later version.
+#
+# deluge is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with deluge.    If not, write to:
+#     The Free Software Foundation, Inc.,
+#     51 Franklin Street, Fifth Floor
+#     Boston, MA  02110-1301, USA.
+#
+#    In addition, as a special exception, the copyright holders give
+#    permission to link the code of portions of this program with the OpenSSL
+#    library.
+#    You must obey the GNU General Public License in all respects for all of
+#    the code used other than OpenSSL. If you modify file(s) with this
+#    exception, you may extend this exception to your version of the file(s),
+#    but you are not obligated to do so. If you do not wish to do so, delete
+#    this exception statement from your version. If you delete this exception
+#    statement from all source files in the program, then also delete it here.
+import heapq
+import itertools
+
+from twisted.internet import reactor, threads, defer
+from twisted.python import failure
+
+
+class Scheduler(object):
+    """
+    priority queue of the jobs in front of the thread pool. Jobs with the
+    lower priority value run first, so small jobs overtake large ones.
+    It should be used from the reactor thread only.
+    """
+
+    def __init__(self, pool, workers):
+        """
+        :param pool: thread pool to run jobs
+        :param workers: count of jobs running at the same time
+        :type pool: twisted.python.threadpool.ThreadPool
+        :type workers: int
+        """
+        self.pool = pool
+        self.workers = workers
+        self.queue = []
+        self.counter = itertools.count()
+        # deferreds of the running jobs
+        self.running = set()
+
+    def __len__(self):
+        """
+        :return: count of queued jobs
+        """
+        return sum(1 for _p, _n, d, _f, _a, _kw in self.queue if not d.called)
+
+    def submit(self, priority, f, *args, **kwargs):
+        """
+        queue the job
+
+        :param priority: sort key, lower is better
+        :param f: function to run in the thread pool
+        :type priority: tuple
+        :type f: callable
+        :return: deferred fired with the result of the function. Queued job is dropped when it is cancelled.
+        :rtype: Deferred
+        """
+        d = defer.Deferred()
+        heapq.heappush(self.queue, (priority, next(self.counter), d, f, args, kwargs))
+        self._dispatch()
+        return d
+
+    def resize(self, workers):
+        """
+        change count of jobs running at the same time
+        """
+        self.workers = workers
+        self._dispatch()
+
+    def cancel(self):
+        """
+        drop all the queued jobs
+        :return: deferred fired when the running jobs are finished
+        :rtype: Deferred
+        """
+        queue, self.queue = self.queue, []
+        for _p, _n, d, _f, _a, _kw in queue:
+            if not d.called:
+                d.cancel()
+        return defer.DeferredList(list(self.running))
+
+    def _dispatch(self):
+        while self.queue and len(self.running) < self.workers:
+            _priority, _n, d, f, args, kwargs = heapq.heappop(self.queue)
+            if d.called:
+                # cancelled while queued
+                continue
+            running = threads.deferToThreadPool(reactor, self.pool, f, *args, **kwargs)
+            self.running.add(running)
+            running.addBoth(self._done, running, d)
+
+    def _done(self, result, running, d):
+        self.running.discard(running)
+        if not d.called:
+            if isinstance(result, failure.Failure):
+                d.errback(result)
+            else:
+                d.callback(result)
+        self._dispatch()
@@ -0,0 +1,306 @@
+#
+# shared.py
+#
+# Copyright (C) 2009 fu2re <fu2re@yandex.ru>
+#
+# Basic plugin template created by:
+# Copyright (C) 2008 Martijn Voncken <mvoncken@gmail.com>
+# Copyright (C) 2007-2009 Andrew Resch <andrewresch@gmail.com>
+# Copyright (C) 2009 Damien Churchill <damoxc@gmail.com>
+#
+# Deluge is free software.
+#
+# You may redistribute it and/or modify it under the terms of the
+# GNU General Public License, as published by the Free Software
+# Foundation; either version 3 of the License, or (at your option)
+# any later version.
+#
+# deluge is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with deluge.    If not, write to:
+#     The Free Software Foundation, Inc.,
+#     51 Franklin Street, Fifth Floor
+#     Boston, MA  02110-1301, USA.
+#
+#    In addition, as a special exception, the copyright holders give
+#    permission to link the code of portions of this program with the OpenSSL
+#    library.
+#    You must obey the GNU General Public License in all respects for all of
+#    the code used other than OpenSSL. If you modify file(s) with this
+#    exception, you may extend this exception to your version of the file(s),
+#    but you are not obligated to do so. If you do not wish to do so, delete
+#    this exception statement from your version. If you delete this exception
+#    statement from all source files in the program, then also delete it here.
+import os
+import json
+import time
+import errno
+import sqlite3
+import threading
+
+from records import FolderCandidate
+
+
+# seconds to wait for the database locked by another node
+BUSY_TIMEOUT = 30
+# advisory lock of the destination folder
+LOCK_NAME = '.copysubtitles.lock'
+
+
+class FolderLocked(Exception):
+    """
+    the destination folder is being copied into by another node
+    """
+
+    def __init__(self, location, owner):
+        Exception.__init__(self, '%s is locked by %s' % (location, owner))
+        self.location = location
+        self.owner = owner
+
+
+class SharedStoreError(Exception):
+    """
+    raised when the shared store could not be opened
+    """
+
+
+class SharedStore(object):
+    """
+    score cache and copy journal shared by the nodes which use the same
+    storage. SQLite in the rollback journal mode is used, as WAL requires
+    shared memory and does not work over network file systems. Errors of
+    the shared database are treated as cache misses, so a busy or broken
+    store never stops copying.
+    """
+
+    def __init__(self, location, node):
+        """
+        :param location: folder on the shared volume
+        :param node: name of this node
+        :type location: str
+        :type node: str
+        :raise SharedStoreError: if the store could not be created or opened
+        """
+        self.node = node
+        self.lock = threading.Lock()
+        try:
+            if not os.path.isdir(location):
+                os.makedirs(location)
+            self.db = sqlite3.connect(
+                os.path.join(location, 'copysubtitles.db'), timeout=BUSY_TIMEOUT, check_same_thread=False
+            )
+            self.db.text_factory = str
+            self.db.execute("PRAGMA journal_mode = DELETE")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS scores ("
+                "key TEXT PRIMARY KEY, mtime REAL, names BLOB, counts TEXT, scores TEXT, labels TEXT, node TEXT)"
+            )
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS journal ("
+                "destination TEXT PRIMARY KEY, source TEXT, size INTEGER, mtime REAL, copied INTEGER, "
+                "node TEXT, time REAL)"
+            )
+            self.db.commit()
+        except (OSError, IOError, sqlite3.Error), e:
+            raise SharedStoreError("Could not open the shared store %s: %s" % (location, e))
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    @staticmethod
+    def score_key(location, count, languages, durations, detection):
+        """
+        :return: key of the scores, see Engine.score_cached
+        :rtype: str
+        """
+        return repr((location, count, tuple(languages), tuple(sorted((durations or {}).items())), detection))
+
+    def get_scores(self, key, location, mtime):
+        """
+        :param key: see score_key
+        :param location: contested location
+        :param mtime: modification time of the contested folder
+        :type key: str
+        :type location: str
+        :type mtime: float
+        :return: scores of the folder if they are computed by any node since it is modified, otherwise None
+        :rtype: FolderCandidate
+        """
+        try:
+            with self.lock:
+                row = self.db.execute(
+                    "SELECT names, counts, scores, labels FROM scores WHERE key = ? AND mtime = ?", (key, mtime)
+                ).fetchone()
+        except sqlite3.Error:
+            return None
+        if row is None:
+            return None
+        names, counts, scores, labels = row
+        candidate = FolderCandidate(
+            location, str(names).split('\0') if names else (), *[int(c) for c in counts.split(',')]
+        )
+        candidate.scores = dict((str(lang), score) for lang, score in json.loads(scores).items())
+        candidate.labels = dict(
+            (str(lang), label and str(label)) for lang, label in json.loads(labels).items()
+        )
+        return candidate
+
+    def put_scores(self, key, mtime, candidate):
+        """
+        share scores of the folder with other nodes
+
+        :param key: see score_key
+        :param mtime: modification time of the contested folder
+        :param candidate: scores of the folder
+        :type key: str
+        :type mtime: float
+        :type candidate: FolderCandidate
+        """
+        try:
+            with self.lock:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO scores VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (key, mtime, sqlite3.Binary('\0'.join(candidate.names)),
+                     ','.join(str(c) for c in candidate.counts),
+                     json.dumps(candidate.scores), json.dumps(candidate.labels), self.node)
+                )
+                self.db.commit()
+        except sqlite3.Error:
+            pass
+
+    def copied(self, source, destination):
+        """
+        check the journal for the destination
+
+        :param source: subtitle file location
+        :param destination: location of its copy
+        :type source: str
+        :type destination: str
+        :return: name of the node which copied the unchanged source to the destination or None
+        :rtype: str
+        """
+        try:
+            with self.lock:
+                row = self.db.execute(
+                    "SELECT source, size, mtime, copied, node FROM journal WHERE destination = ?", (destination,)
+                ).fetchone()
+        except sqlite3.Error:
+            return None
+        if row is None or row[0] != source:
+            return None
+        try:
+            st, copied = os.stat(source), os.path.getsize(destination)
+        except OSError:
+            return None
+        if (st.st_size, st.st_mtime, copied) != row[1:4]:
+            return None
+        return row[4]
+
+    def record(self, path_pairs):
+        """
+        add copied files to the journal
+
+        :param path_pairs: list of tuples ( old path, new path )
+        :type path_pairs: list
+        """
+        rows = []
+        now = time.time()
+        for source, destination in path_pairs:
+            try:
+                st, copied = os.stat(source), os.path.getsize(destination)
+            except OSError:
+                continue
+            rows.append((destination, source, st.st_size, st.st_mtime, copied, self.node, now))
+        try:
+            with self.lock:
+                self.db.executemany("INSERT OR REPLACE INTO journal VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+                self.db.commit()
+        except sqlite3.Error:
+            pass
+
+
+class FolderLocks(object):
+    """
+    advisory locks of the destination folders. Lock is a file created
+    exclusively in the folder, so it works over NFS and SMB. Jobs of the
+    same node share the lock.
+    """
+
+    def __init__(self, node, stale):
+        """
+        :param node: name of this node
+        :param stale: seconds after which the lock of a crashed node is broken
+        :type node: str
+        :type stale: int
+        """
+        self.node = node
+        self.stale = stale
+        self.lock = threading.Lock()
+        # folder -> count of jobs holding its lock
+        self.held = {}
+
+    def acquire(self, location):
+        """
+        :param location: destination folder
+        :type location: str
+        :raise FolderLocked: if the folder is locked by another node
+        """
+        path = os.path.join(location, LOCK_NAME)
+        with self.lock:
+            if location in self.held:
+                self.held[location] += 1
+                return
+            for _attempt in range(2):
+                try:
+                    fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0644)
+                except OSError, e:
+                    if e.errno != errno.EEXIST:
+                        raise
+                    owner = self.owner(path)
+                    # the lock is left by a crashed node or by this node before its restart
+                    if owner == self.node or self.expired(path):
+                        try:
+                            os.remove(path)
+                        except OSError:
+                            pass
+                        continue
+                    raise FolderLocked(location, owner or 'another node')
+                with os.fdopen(fd, 'w') as f:
+                    f.write('%s\n' % self.node)
+                self.held[location] = 1
+                return
+            raise FolderLocked(location, self.owner(path) or 'another node')
+
+    def release(self, location):
+        """
+        :param location: destination folder
+        :type location: str
+        """
+        with self.lock:
+            self.held[location] -= 1
+            if self.held[location]:
+                return
+            del self.held[location]
+            try:
+                os.remove(os.path.join(location, LOCK_NAME))
+            except OSError:
+                pass
+
+    def expired(self, path):
+        try:
+            return time.time() - os.path.getmtime(path) > self.stale
+        except OSError:
+            return True
+
+    @staticmethod
+    def owner(path):
+        try:
+            with open(path) as f:
+                return f.readline().strip() or None
+        except IOError:
+            return None
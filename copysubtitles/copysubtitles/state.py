@@ -0,0 +1,157 @@
+#
+# state.py
+#
+# Copyright (C) 2009 fu2re <fu2re@yandex.ru>
+#
+# Basic plugin template created by:
+# Copyright (C) 2008 Martijn Voncken <mvoncken@gmail.com>
+# Copyright (C) 2007-2009 Andrew Resch <andrewresch@gmail.com>
+# Copyright (C) 2009 Damien Churchill <damoxc@gmail.com>
+#
+# Deluge is free software.
+#
+# You may redistribute it and/or modify it under the terms of the
+# GNU General Public License, as published by the Free Software
+# Foundation; either version 3 of the License, or (at your option)
+# any later version.
+#
+# deluge is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with deluge.    If not, write to:
+#     The Free Software Foundation, Inc.,
+#     51 Franklin Street, Fifth Floor
+#     Boston, MA  02110-1301, USA.
+#
+#    In addition, as a special exception, the copyright holders give
+#    permission to link the code of portions of this program with the OpenSSL
+#    library.
+#    You must obey the GNU General Public License in all respects for all of
+#    the code used other than OpenSSL. If you modify file(s) with this
+#    exception, you may extend this exception to your version of the file(s),
+#    but you are not obligated to do so. If you do not wish to do so, delete
+#    this exception statement from your version. If you delete this exception
+#    statement from all source files in the program, then also delete it here.
+import os
+import shutil
+import hashlib
+
+from shared import LOCK_NAME
+
+
+def folder_fingerprint(location, exclude=()):
+    """
+    get fingerprint of the folder contents. Names, sizes and modification
+    times of the files are used, sub folders are used by name only.
+
+    :param location: contested location
+    :param exclude: paths to ignore, e.g. files copied by the plugin.
+    Folders containing them are ignored as well.
+    :type location: str
+    :type exclude: list
+    :return: hex digest or None if the folder does not exist
+    :rtype: str
+    """
+    ignored = set()
+    for path in exclude:
+        while path and os.path.dirname(path) != path:
+            ignored.add(path)
+            if os.path.dirname(path) == location:
+                break
+            path = os.path.dirname(path)
+    h = hashlib.sha1()
+    try:
+        names = sorted(os.listdir(location))
+    except OSError:
+        return None
+    for name in names:
+        path = os.path.join(location, name)
+        if path in ignored or name.endswith('.part') or name == LOCK_NAME:
+            continue
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        if os.path.isdir(path):
+            h.update('%s/\n' % name)
+        else:
+            h.update('%s:%s:%s\n' % (name, st.st_size, int(st.st_mtime)))
+    return h.hexdigest()
+
+
+def match_fingerprint(video_folder, subtitle_folders, exclude=()):
+    """
+    get fingerprint of the match. It is changed when the video folder or
+    any of the chosen subtitle folders is changed.
+
+    :param video_folder: destination folder
+    :param subtitle_folders: source folders
+    :param exclude: see folder_fingerprint
+    :type video_folder: str
+    :type subtitle_folders: list
+    :type exclude: list
+    :return: hex digest
+    :rtype: str
+    """
+    h = hashlib.sha1()
+    for folder in [video_folder] + sorted(set(subtitle_folders)):
+        h.update('%s\n' % folder_fingerprint(folder, exclude))
+    return h.hexdigest()
+
+
+def relocate_path(path, old, new):
+    """
+    :return: path moved from the old location to the new one or None if it is not below the old location
+    :rtype: str
+    """
+    old = os.path.join(os.path.normpath(old), '')
+    if not path.startswith(old):
+        return None
+    return os.path.join(new, path[len(old):])
+
+
+def relocate(path_pairs, old, new):
+    """
+    move copied files after the torrent is moved. Emptied folders below
+    the old location are removed. Symbolic links are made again, the ones
+    to the files below the old location point to the moved files.
+
+    :param path_pairs: list of tuples, ( old path, new path )
+    :param old: old torrent location
+    :param new: new torrent location
+    :type path_pairs: list
+    :type old: str
+    :type new: str
+    :return: dict of moved paths, { old copied path: new copied path }
+    :rtype: dict
+    """
+    moved = {}
+    old = os.path.normpath(old)
+    for _source, path in path_pairs:
+        new_path = relocate_path(path, old, new)
+        # the link to a moved torrent file is broken already
+        if not new_path or not os.path.lexists(path):
+            continue
+        if not os.path.lexists(new_path):
+            if not os.path.exists(os.path.dirname(new_path)):
+                os.makedirs(os.path.dirname(new_path))
+            if os.path.islink(path):
+                target = os.readlink(path)
+                os.symlink(relocate_path(target, old, new) or target, new_path)
+                os.remove(path)
+            else:
+                shutil.move(path, new_path)
+        else:
+            os.remove(path)
+        moved[path] = new_path
+        folder = os.path.dirname(path)
+        while folder != old and folder.startswith(old):
+            try:
+                os.rmdir(folder)
+            except OSError:
+                break
+            folder = os.path.dirname(folder)
+    return moved
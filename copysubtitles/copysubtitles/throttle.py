@@ -0,0 +1,328 @@
+#
+# throttle.py
+#
+# Copyright (C) 2009 fu2re <fu2re@yandex.ru>
+#
+# Basic plugin template created by:
+# Copyright (C) 2008 Martijn Voncken <mvoncken@gmail.com>
+# Copyright (C) 2007-2009 Andrew Resch <andrewresch@gmail.com>
+# Copyright (C) 2009 Damien Churchill <damoxc@gmail.com>
+#
+# Deluge is free software.
+#
+# You may redistribute it and/or modify it under the terms of the
+# GNU General Public License, as published by the Free Software
+# Foundation; either version 3 of the License, or (at your option)
+# any later version.
+#
+# deluge is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with deluge.    If not, write to:
+#     The Free Software Foundation, Inc.,
+#     51 Franklin Street, Fifth Floor
+#     Boston, MA  02110-1301, USA.
+#
+#    In addition, as a special exception, the copyright holders give
+#    permission to link the code of portions of this program with the OpenSSL
+#    library.
+#    You must obey the GNU General Public License in all respects for all of
+#    the code used other than OpenSSL. If you modify file(s) with this
+#    exception, you may extend this exception to your version of the file(s),
+#    but you are not obligated to do so. If you do not wish to do so, delete
+#    this exception statement from your version. If you delete this exception
+#    statement from all source files in the program, then also delete it here.
+import os
+import time
+import ctypes
+import ctypes.util
+import platform
+import shutil
+import threading
+
+
+# ioprio_set syscall numbers per architecture
+IOPRIO_SYSCALLS = {
+    'x86_64': 251,
+    'i386': 289,
+    'i686': 289,
+    'aarch64': 30,
+    'arm64': 30,
+    'armv7l': 314,
+    'ppc64le': 273,
+}
+IOPRIO_WHO_PROCESS = 1
+# no class: the priority follows the CPU nice level of the thread
+IOPRIO_CLASS_NONE = 0
+IOPRIO_CLASS_IDLE = 3
+IOPRIO_CLASS_SHIFT = 13
+POSIX_FADV_DONTNEED = 4
+# size of the chunk used for copying
+CHUNK_SIZE = 64 * 1024
+# window used to calculate throughput, seconds
+METER_WINDOW = 5.
+
+
+_libc = None
+
+
+class JobCancelled(Exception):
+    """
+    raised by the copy engine when the job is cancelled in the middle of the copying
+    """
+
+
+def get_libc():
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+    return _libc
+
+
+def set_idle_priority(idle=True):
+    """
+    move I/O of the current thread to the idle class, so torrent traffic
+    is always served first, or back to the default class. Linux only.
+
+    :param idle: False to use the default class
+    :type idle: bool
+    :return: True on success
+    :rtype: bool
+    """
+    syscall = IOPRIO_SYSCALLS.get(platform.machine())
+    if syscall is None:
+        return False
+    try:
+        return get_libc().syscall(
+            syscall, IOPRIO_WHO_PROCESS, 0, (IOPRIO_CLASS_IDLE if idle else IOPRIO_CLASS_NONE) << IOPRIO_CLASS_SHIFT
+        ) == 0
+    except (OSError, AttributeError):
+        return False
+
+
+def drop_cache(fd):
+    """
+    tell the kernel that the file data is not needed anymore, so hot
+    torrent pieces are not evicted from the page cache by the copied files.
+
+    :param fd: file descriptor
+    :type fd: int
+    """
+    try:
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        else:
+            get_libc().posix_fadvise(fd, ctypes.c_long(0), ctypes.c_long(0), POSIX_FADV_DONTNEED)
+    except (OSError, AttributeError):
+        pass
+
+
+class TokenBucket(object):
+    """
+    thread safe token bucket. Rate 0 means no limit.
+    """
+
+    def __init__(self, rate, burst=None):
+        """
+        :param rate: tokens per second
+        :param burst: bucket capacity, one second of the rate by default
+        :type rate: float
+        :type burst: float
+        """
+        self.lock = threading.Lock()
+        self.rate = float(rate)
+        self.burst = float(burst or rate)
+        self.tokens = self.burst
+        self.stamp = time.time()
+
+    def consume(self, tokens):
+        """
+        take tokens from the bucket, sleep until they are available
+
+        :param tokens: count of tokens
+        :type tokens: float
+        """
+        if self.rate <= 0:
+            return
+        with self.lock:
+            now = time.time()
+            self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+            # tokens could go negative, so requests larger than burst are still served
+            self.tokens -= tokens
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+class Throttle(object):
+    """
+    I/O policy of the copy engine: bandwidth and operations limits,
+    I/O priority and page cache usage. It also measures throughput.
+    """
+
+    def __init__(self, rate=0, ops=0, idle=False, nocache=False):
+        """
+        :param rate: bandwidth limit, bytes per second
+        :param ops: limit of read/write operations per second
+        :param idle: use idle I/O priority class for the copying threads
+        :param nocache: drop copied files from the page cache
+        :type rate: int
+        :type ops: int
+        :type idle: bool
+        :type nocache: bool
+        """
+        self.lock = threading.Lock()
+        # whether the copying thread is moved to the idle class by start
+        self.local = threading.local()
+        self.window = []
+        self.total_bytes = 0
+        self.total_files = 0
+        self.configure(rate, ops, idle, nocache)
+
+    def configure(self, rate=0, ops=0, idle=False, nocache=False):
+        """
+        change the policy, statistics are kept. See __init__ for parameters
+        """
+        self.bandwidth = TokenBucket(rate, max(rate, CHUNK_SIZE))
+        self.operations = TokenBucket(ops)
+        self.idle = idle
+        self.nocache = nocache
+
+    def start(self):
+        """
+        should be called by the copying thread before any I/O. Threads of the
+        pool are reused, so the idle class is dropped once it is turned off;
+        the priority given to the daemon, e.g. by ionice, is kept otherwise.
+        """
+        if self.idle != getattr(self.local, 'idle', False) and set_idle_priority(self.idle):
+            self.local.idle = self.idle
+
+    def acquire(self, size, copied=True):
+        """
+        wait for the permission to transfer the chunk and account it
+
+        :param size: chunk size, bytes
+        :param copied: count the chunk in the throughput. Reads for hashing and parsing are only limited
+        :type size: int
+        :type copied: bool
+        """
+        self.operations.consume(1)
+        self.bandwidth.consume(size)
+        if not copied:
+            return
+        now = time.time()
+        with self.lock:
+            self.total_bytes += size
+            self.window.append((now, size))
+            while self.window and self.window[0][0] < now - METER_WINDOW:
+                self.window.pop(0)
+
+    def throughput(self):
+        """
+        :return: bytes per second for the last seconds
+        :rtype: float
+        """
+        now = time.time()
+        with self.lock:
+            return sum(size for stamp, size in self.window if stamp >= now - METER_WINDOW) / METER_WINDOW
+
+    def stats(self):
+        """
+        :return: copy engine statistics
+        :rtype: dict
+        """
+        return {
+            'throughput': self.throughput(),
+            'copied_bytes': self.total_bytes,
+            'copied_files': self.total_files,
+            'rate_limit': self.bandwidth.rate,
+            'ops_limit': self.operations.rate,
+        }
+
+    def copyfileobj(self, fi, fo, chunk_size=CHUNK_SIZE, cancelled=None):
+        """
+        throttled version of shutil.copyfileobj
+
+        :param cancelled: event which stops the copying with JobCancelled
+        :type cancelled: threading.Event
+        """
+        while True:
+            if cancelled is not None and cancelled.is_set():
+                raise JobCancelled()
+            buf = fi.read(chunk_size)
+            if not buf:
+                break
+            self.acquire(len(buf))
+            fo.write(buf)
+
+    def finish(self, *files):
+        """
+        should be called when the files are written but not closed yet
+
+        :param files: file objects
+        """
+        with self.lock:
+            self.total_files += 1
+        if self.nocache:
+            for f in files:
+                f.flush()
+                if hasattr(f, 'fileno'):
+                    os.fsync(f.fileno())
+                    drop_cache(f.fileno())
+
+
+def copy_file(src, dst, throttle=None, cancelled=None):
+    """
+    throttled version of shutil.copy2
+
+    :param src: source path
+    :param dst: destination path
+    :param throttle: I/O policy
+    :param cancelled: event which stops the copying with JobCancelled
+    :type src: str
+    :type dst: str
+    :type throttle: Throttle
+    :type cancelled: threading.Event
+    """
+    throttle = throttle or Throttle()
+    with open(src, 'rb') as fi:
+        with open(dst, 'wb') as fo:
+            throttle.copyfileobj(fi, fo, cancelled=cancelled)
+            throttle.finish(fi, fo)
+    shutil.copystat(src, dst)
+
+
+def link_file(src, dst, symbolic=False, throttle=None, cancelled=None):
+    """
+    link the file instead of copying it. The file is copied if the link
+    could not be created, e.g. across file systems or on Windows.
+
+    :param src: source path
+    :param dst: destination path
+    :param symbolic: make a symbolic link instead of a hard one
+    :param throttle: I/O policy of the fallback copying
+    :param cancelled: event which stops the copying with JobCancelled
+    :type src: str
+    :type dst: str
+    :type symbolic: bool
+    :type throttle: Throttle
+    :type cancelled: threading.Event
+    :return: False if the file is copied
+    :rtype: bool
+    """
+    if os.path.lexists(dst):
+        os.remove(dst)
+    try:
+        if symbolic:
+            os.symlink(os.path.abspath(src), dst)
+        else:
+            os.link(src, dst)
+        return True
+    except (AttributeError, OSError):
+        pass
+    copy_file(src, dst, throttle, cancelled)
+    return False
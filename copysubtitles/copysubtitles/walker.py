@@ -0,0 +1,172 @@
+#
+# walker.py
+#
+# Copyright (C) 2009 fu2re <fu2re@yandex.ru>
+#
+# Basic plugin template created by:
+# Copyright (C) 2008 Martijn Voncken <mvoncken@gmail.com>
+# Copyright (C) 2007-2009 Andrew Resch <andrewresch@gmail.com>
+# Copyright (C) 2009 Damien Churchill <damoxc@gmail.com>
+#
+# Deluge is free software.
+#
+# You may redistribute it and/or modify it under the terms of the
+# GNU General Public License, as published by the Free Software
+# Foundation; either version 3 of the License, or (at your option)
+# any later version.
+#
+# deluge is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with deluge.    If not, write to:
+#     The Free Software Foundation, Inc.,
+#     51 Franklin Street, Fifth Floor
+#     Boston, MA  02110-1301, USA.
+#
+#    In addition, as a special exception, the copyright holders give
+#    permission to link the code of portions of this program with the OpenSSL
+#    library.
+#    You must obey the GNU General Public License in all respects for all of
+#    the code used other than OpenSSL. If you modify file(s) with this
+#    exception, you may extend this exception to your version of the file(s),
+#    but you are not obligated to do so. If you do not wish to do so, delete
+#    this exception statement from your version. If you delete this exception
+#    statement from all source files in the program, then also delete it here.
+import os
+import stat
+import time
+import threading
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
+
+
+# count of folders listed at the same time. Every listing is a round-trip on network storage
+WALK_THREADS = 4
+# count of folder levels listed, the root is the first one
+WALK_DEPTH = 8
+# seconds to list a single root. Deeper levels are not listed after that
+WALK_DEADLINE = 30.
+
+
+def list_folder(path):
+    """
+    list the folder and check which entries are folders. It is run in the walker pool.
+
+    :param path: folder location
+    :type path: str
+    :return: sorted list of tuples, (path, (device, inode) of the folder or None for other files)
+    :rtype: list
+    """
+    try:
+        names = sorted(os.listdir(path))
+    except OSError:
+        return []
+    result = []
+    for name in names:
+        child = os.path.join(path, name)
+        try:
+            st = os.stat(child)
+        except OSError:
+            # broken links and files removed in the meantime
+            continue
+        result.append((child, (st.st_dev, st.st_ino) if stat.S_ISDIR(st.st_mode) else None))
+    return result
+
+
+class Walker(object):
+    """
+    walk the tree level by level. Folders of the same level are listed
+    concurrently, results are returned in the order of the sequential walk.
+    """
+
+    def __init__(self, threads=WALK_THREADS, depth=WALK_DEPTH, deadline=WALK_DEADLINE):
+        """
+        :param threads: count of folders listed at the same time
+        :param depth: count of folder levels listed, the root is the first one
+        :param deadline: seconds to list a single root
+        """
+        self.threads = threads
+        self.depth = depth
+        self.deadline = deadline
+        self.pool = None
+        self.lock = threading.Lock()
+
+    def get_pool(self):
+        """
+        :return: thread pool, it is started on the first walk
+        :rtype: ThreadPool
+        """
+        with self.lock:
+            if self.pool is None:
+                self.pool = ThreadPool(self.threads)
+            return self.pool
+
+    def walk(self, location):
+        """
+        list the location and its sub folders. Symbolic links are followed,
+        every folder is listed only once.
+
+        :param location: root folder
+        :type location: str
+        :return: list of tuples ( path, True if it is a folder ) starting from the location itself,
+        every folder is followed by its contents, names are sorted. And True if the whole tree is listed
+        before the deadline and within the depth.
+        :rtype: tuple
+        """
+        try:
+            st = os.stat(location)
+        except OSError:
+            return [], True
+        if not stat.S_ISDIR(st.st_mode):
+            return [(location, False)], True
+
+        pool = self.get_pool()
+        deadline = time.time() + self.deadline
+        seen = set([(st.st_dev, st.st_ino)])
+        contents = {}
+        level = [location]
+        complete = True
+        for depth in range(self.depth + 1):
+            if not level:
+                break
+            if depth == self.depth:
+                complete = False
+                break
+            try:
+                listings = pool.map_async(list_folder, level, 1).get(max(deadline - time.time(), 0))
+            except TimeoutError:
+                # listings which are not finished yet are dropped
+                complete = False
+                break
+            next_level = []
+            for path, listing in zip(level, listings):
+                contents[path] = listing
+                for child, key in listing:
+                    if key is not None and key not in seen:
+                        seen.add(key)
+                        next_level.append(child)
+            level = next_level
+
+        result = [(location, True)]
+        stack = [iter(contents.get(location, ()))]
+        while stack:
+            for child, key in stack[-1]:
+                result.append((child, key is not None))
+                if child in contents:
+                    stack.append(iter(contents[child]))
+                    break
+            else:
+                stack.pop()
+        return result, complete
+
+    def close(self):
+        """
+        stop the thread pool
+        """
+        with self.lock:
+            if self.pool is not None:
+                self.pool.close()
+                self.pool = None
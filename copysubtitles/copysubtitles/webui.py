@@ -47,6 +47,7 @@ from common import get_resource
 class WebUI(WebPluginBase):
 
     scripts = [get_resource("copysubtitles.js")]
+    debug_scripts = scripts
 
     def enable(self):
         pass
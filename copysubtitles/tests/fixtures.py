@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+#
+# fixtures.py
+#
+# Writers of the small matroska and mp4 files used by the tests.
+# Element sizes and unsigned integers always take 8 bytes, so positions
+# could be calculated before the values are known.
+#
+import os
+import sys
+import zlib
+import struct
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'copysubtitles'))
+
+import mkv  # noqa
+
+UNKNOWN_SIZE = '\x01\xff\xff\xff\xff\xff\xff\xff'
+ASS_PRIVATE = '[Script Info]\nTitle: test\n\n[V4+ Styles]\nFormat: Name, Fontname\nStyle: Default,Arial\n'
+# prefix removed from every block of the SRT track
+STRIPPED = 'Hel'
+
+
+def ebml_id(element_id):
+    data = ''
+    while element_id:
+        data = chr(element_id & 0xFF) + data
+        element_id >>= 8
+    return data
+
+
+def element(element_id, data='', unknown_size=False):
+    size = UNKNOWN_SIZE if unknown_size else '\x01' + struct.pack('>Q', len(data))[1:]
+    return ebml_id(element_id) + size + data
+
+
+def uint(element_id, value):
+    return element(element_id, struct.pack('>Q', value))
+
+
+def block(track, timecode, payload):
+    # track number as 1 byte variable size integer, relative timecode and flags
+    return chr(0x80 | track) + struct.pack('>hB', timecode, 0x80) + payload
+
+
+def block_group(track, timecode, payload, duration):
+    return element(mkv.BLOCK_GROUP, element(mkv.BLOCK, block(track, timecode, payload)) +
+                   uint(mkv.BLOCK_DURATION, duration))
+
+
+def track_entry(number, track_type, codec, language=None, private=None, compression=None):
+    data = uint(mkv.TRACK_NUMBER, number) + uint(mkv.TRACK_TYPE, track_type) + element(mkv.CODEC_ID, codec)
+    if language:
+        data += element(mkv.LANGUAGE, language)
+    if private:
+        data += element(mkv.CODEC_PRIVATE, private)
+    if compression:
+        algorithm, settings = compression
+        data += element(mkv.CONTENT_ENCODINGS, element(mkv.CONTENT_ENCODING, element(
+            mkv.CONTENT_COMPRESSION, uint(mkv.CONTENT_COMP_ALGO, algorithm) +
+            element(mkv.CONTENT_COMP_SETTINGS, settings))))
+    return element(mkv.TRACK_ENTRY, data)
+
+
+def write_mkv(path, cues=True, timecode_scale=1000000, duration=60000.):
+    """
+    write a matroska file with a video track, a zlib compressed ASS track
+    and a header stripped SRT track. The first cluster has a size, the
+    second one is the last element of the segment and its size is unknown.
+    Cues index the ASS track only.
+
+    ASS events, by their ReadOrder: 0.2s "Первый", 1s "Второй", 10.5s "Третий".
+    SRT events: 1s "Hello", 10.5s "Hello, world".
+    """
+    info = element(mkv.INFO, uint(mkv.TIMECODE_SCALE, timecode_scale) +
+                   element(mkv.DURATION, struct.pack('>d', duration)))
+    tracks = element(mkv.TRACKS, ''.join([
+        track_entry(1, 1, 'V_MPEG4/ISO/AVC'),
+        track_entry(2, mkv.TRACK_TYPE_SUBTITLE, 'S_TEXT/ASS', 'rus', ASS_PRIVATE, (mkv.COMP_ZLIB, '')),
+        track_entry(3, mkv.TRACK_TYPE_SUBTITLE, 'S_TEXT/UTF8', 'eng', None, (mkv.COMP_HEADER_STRIPPING, STRIPPED)),
+    ]))
+    first = element(mkv.CLUSTER, ''.join([
+        uint(mkv.TIMECODE, 0),
+        element(mkv.SIMPLE_BLOCK, block(1, 0, 'V' * 65536)),
+        block_group(2, 1000, zlib.compress('1,0,Default,,0,0,0,,Второй'), 1500),
+        block_group(2, 200, zlib.compress('0,0,Default,,0,0,0,,Первый'), 500),
+        element(mkv.SIMPLE_BLOCK, block(3, 1000, 'lo')),
+    ]))
+    second = element(mkv.CLUSTER, ''.join([
+        uint(mkv.TIMECODE, 10000),
+        element(mkv.SIMPLE_BLOCK, block(1, 0, 'V' * 65536)),
+        block_group(2, 500, zlib.compress('2,0,Default,,0,0,0,,Третий'), 2000),
+        element(mkv.SIMPLE_BLOCK, block(3, 500, 'lo, world')),
+    ]), unknown_size=True)
+
+    def cue_points(positions):
+        return element(mkv.CUES, ''.join(
+            element(mkv.CUE_POINT, uint(0xB3, 0) + element(mkv.CUE_TRACK_POSITIONS, uint(
+                mkv.CUE_TRACK, 2) + uint(mkv.CUE_CLUSTER_POSITION, position)))
+            for position in positions
+        ))
+
+    head = info + tracks
+    if cues:
+        # sizes do not depend on the values, so the positions are known after the first pass
+        length = len(cue_points([0, 0]))
+        positions = [len(head) + length, len(head) + length + len(first)]
+        head += cue_points(positions)
+    else:
+        positions = [len(head), len(head) + len(first)]
+    with open(path, 'wb') as f:
+        f.write(element(mkv.EBML, element(0x4282, 'matroska')))
+        f.write(element(mkv.SEGMENT, head + first + second))
+    return positions
+
+
+def box(box_type, data, large=False):
+    if large:
+        return struct.pack('>I4sQ', 1, box_type, len(data) + 16) + data
+    return struct.pack('>I4s', len(data) + 8, box_type) + data
+
+
+def write_mp4(path, timescale, duration, version=0):
+    """
+    write an mp4 file with the movie header placed after a media data box with 64 bit size
+    """
+    if version == 1:
+        mvhd = struct.pack('>B3xQQIQ', 1, 0, 0, timescale, duration)
+    else:
+        mvhd = struct.pack('>B3xIIII', 0, 0, 0, timescale, duration)
+    with open(path, 'wb') as f:
+        f.write(box('ftyp', 'isom\0\0\0\0isom'))
+        f.write(box('mdat', '\0' * 65536, large=True))
+        f.write(box('moov', box('mvhd', mvhd + '\0' * 80) + box('trak', '')))
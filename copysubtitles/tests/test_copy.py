@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+#
+# test_copy.py
+#
+# Usage: python -m unittest discover -s tests
+#
+import os
+import sys
+import shutil
+import logging
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'copysubtitles'))
+
+from engine import Engine, SCORE_CACHE_SIZE  # noqa
+from records import CopyJob, SubtitleFile  # noqa
+
+CONFIG = {
+    'lang': 'ru|rus',
+    'lang_count': 1,
+    'transcode': False,
+    'io_rate_limit': 0,
+    'io_ops_limit': 0,
+    'io_idle_priority': False,
+    'io_drop_cache': False,
+    'extract_embedded': False,
+    'fonts': False,
+    'font_store': '',
+    'copy_timeout': 600,
+    'cache_size': SCORE_CACHE_SIZE,
+    'transfer_mode': 'copy',
+    'detection': 'suffix',
+}
+SRT = '1\r\n00:00:01,000 --> 00:00:03,000\r\n%s\r\n\r\n'
+
+
+class CopyTest(unittest.TestCase):
+
+    def setUp(self):
+        logging.getLogger('deluge').setLevel(logging.ERROR)
+        self.folder = tempfile.mkdtemp()
+        self.subs = os.path.join(self.folder, 'Subs')
+        os.mkdir(self.subs)
+        self.engine = Engine(CONFIG)
+
+    def tearDown(self):
+        self.engine.walker.close()
+        shutil.rmtree(self.folder)
+
+    def write(self, path, text):
+        with open(path, 'wb') as f:
+            f.write(SRT % text)
+
+    def copy(self, *names):
+        job = CopyJob(None, self.folder, self.subs, [SubtitleFile(name, 'ru') for name in names])
+        return self.engine.run_job(job)
+
+    def test_copy(self):
+        self.write(os.path.join(self.subs, 'Show - 01.srt'), 'one')
+        path_pairs, skipped, replaced, kept = self.copy('Show - 01.srt')
+        destination = os.path.join(self.folder, 'Show - 01.ru.srt')
+        self.assertEqual(path_pairs, [(os.path.join(self.subs, 'Show - 01.srt'), destination)])
+        self.assertEqual((skipped, replaced, kept), (0, 0, []))
+        with open(destination, 'rb') as f:
+            self.assertEqual(f.read(), SRT % 'one')
+
+    def test_identical_is_kept(self):
+        self.write(os.path.join(self.subs, 'Show - 01.srt'), 'one')
+        self.write(os.path.join(self.folder, 'Show - 01.ru.srt'), 'one')
+        path_pairs, skipped, _replaced, kept = self.copy('Show - 01.srt')
+        # the earlier copy is reported, so it is moved with the torrent
+        self.assertEqual((path_pairs, skipped), ([], 1))
+        self.assertEqual(kept, [(os.path.join(self.subs, 'Show - 01.srt'),
+                                 os.path.join(self.folder, 'Show - 01.ru.srt'))])
+
+    def test_hashing_is_limited(self):
+        self.write(os.path.join(self.subs, 'Show - 01.srt'), 'one')
+        self.write(os.path.join(self.folder, 'Show - 01.ru.srt'), 'one')
+        acquired = []
+        self.engine.throttle.acquire = lambda size, copied=True: acquired.append((size, copied))
+        self.copy('Show - 01.srt')
+        # both files are hashed, nothing is copied
+        self.assertEqual(acquired, [(len(SRT % 'one'), False)] * 2)
+
+    def test_other_suffix_is_kept(self):
+        open(os.path.join(self.folder, 'Show - 01.mkv'), 'wb').close()
+        self.write(os.path.join(self.subs, 'Show - 01.srt'), 'one')
+        self.write(os.path.join(self.folder, 'Show - 01.rus.srt'), 'one')
+        path_pairs, skipped, _replaced, kept = self.copy('Show - 01.srt')
+        self.assertEqual((path_pairs, skipped), ([], 1))
+        self.assertEqual(kept, [(os.path.join(self.subs, 'Show - 01.srt'),
+                                 os.path.join(self.folder, 'Show - 01.rus.srt'))])
+
+    def test_other_episode_is_not_identical(self):
+        for name in ('Show - 01.mkv', 'Show - 01v2.mkv'):
+            open(os.path.join(self.folder, name), 'wb').close()
+        self.write(os.path.join(self.subs, 'Show - 01v2.srt'), 'same')
+        self.write(os.path.join(self.folder, 'Show - 01.ru.srt'), 'same')
+        path_pairs, skipped, _replaced, kept = self.copy('Show - 01v2.srt')
+        self.assertEqual((len(path_pairs), skipped, kept), (1, 0, []))
+        self.assertTrue(os.path.exists(os.path.join(self.folder, 'Show - 01v2.ru.srt')))
+
+    def test_stale_is_replaced(self):
+        self.write(os.path.join(self.subs, 'Show - 01.srt'), 'new')
+        self.write(os.path.join(self.folder, 'Show - 01.ru.srt'), 'old')
+        path_pairs, _skipped, replaced, kept = self.copy('Show - 01.srt')
+        self.assertEqual((len(path_pairs), replaced, kept), (1, 1, []))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+#
+# test_encoding.py
+#
+# Usage: python -m unittest discover -s tests
+#
+import io
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'copysubtitles'))
+
+import encoding  # noqa
+
+RUSSIAN = (u'1\r\n00:00:01,000 --> 00:00:03,000\r\n'
+           u'Привет, как у тебя дела сегодня вечером?\r\n\r\n'
+           u'2\r\n00:00:04,000 --> 00:00:06,000\r\n'
+           u'Я думаю, что нам нужно идти домой прямо сейчас.\r\n\r\n')
+WESTERN = (u'1\r\n00:00:01,000 --> 00:00:03,000\r\nLa señora está en el café con su niño.\r\n\r\n'
+           u'2\r\n00:00:04,000 --> 00:00:06,000\r\nDas Mädchen fährt über die Brücke.\r\n\r\n')
+
+
+class EncodingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def write(self, text, codec, name='a.srt'):
+        path = os.path.join(self.folder, name)
+        with io.open(path, 'w', encoding=codec, newline='') as f:
+            f.write(text)
+        return path
+
+    def test_single_byte(self):
+        self.assertEqual(encoding.sniff_encoding(self.write(RUSSIAN, 'cp1251')), 'cp1251')
+        self.assertEqual(encoding.sniff_encoding(self.write(RUSSIAN, 'koi8-r')), 'koi8-r')
+        self.assertEqual(encoding.sniff_encoding(self.write(WESTERN, 'cp1252')), 'cp1252')
+
+    def test_utf(self):
+        self.assertEqual(encoding.sniff_encoding(self.write(RUSSIAN, 'utf-8')), 'utf-8')
+        self.assertEqual(encoding.sniff_encoding(self.write(RUSSIAN, 'utf-8-sig')), 'utf-8-sig')
+        # python writes the BOM of the native byte order
+        self.assertEqual(encoding.sniff_encoding(self.write(RUSSIAN, 'utf-16')), 'utf-16')
+        self.assertEqual(encoding.sniff_bytes('\xfe\xff' + RUSSIAN.encode('utf-16-be')), 'utf-16')
+        self.assertEqual(encoding.sniff_bytes('plain ascii'), 'utf-8')
+        self.assertTrue(encoding.is_utf8('UTF8'))
+        self.assertFalse(encoding.is_utf8('utf-8-sig'))
+
+    def test_cut_sample(self):
+        data = RUSSIAN.encode('utf-8')
+        # the sample ends in the middle of a two byte letter
+        cut = data[:data.index(u'П'.encode('utf-8')) + 1]
+        self.assertEqual(encoding.sniff_bytes(cut, complete=False), 'utf-8')
+        self.assertNotEqual(encoding.sniff_bytes(cut + 'x', complete=False), 'utf-8')
+        path = self.write(RUSSIAN * 100, 'utf-8')
+        self.assertEqual(encoding.sniff_encoding(path, size=len(cut)), 'utf-8')
+
+    def test_transcode(self):
+        for codec in ('cp1251', 'koi8-r', 'utf-16'):
+            src = self.write(RUSSIAN, codec)
+            dst = os.path.join(self.folder, 'b.srt')
+            encoding.transcode(src, dst, encoding.sniff_encoding(src), chunk_size=16)
+            with open(dst, 'rb') as f:
+                # line endings are kept
+                self.assertEqual(f.read(), RUSSIAN.encode('utf-8'))
+            self.assertEqual(int(os.stat(dst).st_mtime), int(os.stat(src).st_mtime))
+
+
+if __name__ == '__main__':
+    unittest.main()
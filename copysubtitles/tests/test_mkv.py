@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+#
+# test_mkv.py
+#
+# Usage: python -m unittest discover -s tests
+#
+import os
+import shutil
+import tempfile
+import unittest
+
+from fixtures import mkv, write_mkv, ASS_PRIVATE
+
+
+class MatroskaTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, 'video.mkv')
+        self.positions = write_mkv(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def read(self, name):
+        with open(os.path.join(self.folder, name), 'rb') as f:
+            return f.read()
+
+    def test_tracks(self):
+        video = mkv.MatroskaFile(self.path)
+        self.assertEqual(video.duration, 60000.)
+        self.assertEqual(video.timecode_scale, 1000000)
+        ass, srt = video.subtitle_tracks()
+        self.assertEqual((ass.number, ass.language, ass.extension), (2, 'rus', '.ass'))
+        self.assertEqual((srt.number, srt.language, srt.extension), (3, 'eng', '.srt'))
+        self.assertEqual(ass.private, ASS_PRIVATE)
+        self.assertEqual(ass.compression, (mkv.COMP_ZLIB, ''))
+        self.assertEqual(srt.compression, (mkv.COMP_HEADER_STRIPPING, 'Hel'))
+
+    def test_cues(self):
+        video = mkv.MatroskaFile(self.path)
+        self.assertEqual(video.cues, {2: set(self.positions)})
+        self.assertEqual(len(list(video.clusters(2))), 2)
+
+    def test_sequential_clusters(self):
+        write_mkv(self.path, cues=False)
+        video = mkv.MatroskaFile(self.path)
+        self.assertFalse(video.cues)
+        # the last cluster has an unknown size and ends with the segment
+        self.assertEqual(len(list(video.clusters(3))), 2)
+
+    def test_extract_ass(self):
+        video = mkv.MatroskaFile(self.path)
+        out = os.path.join(self.folder, 'video.ass')
+        self.assertEqual(video.extract(video.subtitle_tracks()[0], out), 3)
+        data = self.read('video.ass').decode('utf-8')
+        self.assertTrue(data.startswith(u'[Script Info]\r\n'))
+        self.assertIn(u'[Events]\r\n', data)
+        dialogues = [line for line in data.split(u'\r\n') if line.startswith(u'Dialogue:')]
+        self.assertEqual(dialogues, [
+            u'Dialogue: 0,0:00:00.20,0:00:00.70,Default,,0,0,0,,Первый',
+            u'Dialogue: 0,0:00:01.00,0:00:02.50,Default,,0,0,0,,Второй',
+            u'Dialogue: 0,0:00:10.50,0:00:12.50,Default,,0,0,0,,Третий',
+        ])
+
+    def test_extract_srt(self):
+        video = mkv.MatroskaFile(self.path)
+        out = os.path.join(self.folder, 'video.srt')
+        self.assertEqual(video.extract(video.subtitle_tracks()[1], out), 2)
+        self.assertEqual(self.read('video.srt').decode('utf-8'), (
+            u'1\r\n00:00:01,000 --> 00:00:03,000\r\nHello\r\n\r\n'
+            u'2\r\n00:00:10,500 --> 00:00:12,500\r\nHello, world\r\n\r\n'))
+
+    def test_extract_limited(self):
+        acquired = []
+
+        class Throttle(object):
+            def acquire(self, size, copied=True):
+                acquired.append((size, copied))
+
+        video = mkv.MatroskaFile(self.path)
+        video.extract(video.subtitle_tracks()[1], os.path.join(self.folder, 'video.srt'), throttle=Throttle())
+        # a cluster is one read of the blocks of the track
+        self.assertEqual(acquired, [(len('Hello'), False), (len('Hello, world'), False)])
+
+    def test_info_only(self):
+        video = mkv.MatroskaFile(self.path, elements=(mkv.INFO,))
+        self.assertEqual(video.duration, 60000.)
+        self.assertFalse(video.tracks)
+
+    def test_not_matroska(self):
+        with open(self.path, 'wb') as f:
+            f.write('RIFF' + '\0' * 64)
+        self.assertRaises(mkv.MatroskaError, mkv.MatroskaFile, self.path)
+
+    def test_truncated(self):
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        with open(self.path, 'wb') as f:
+            f.write(data[:60])
+        self.assertRaises(mkv.MatroskaError, mkv.MatroskaFile, self.path)
+
+    def test_choose_track(self):
+        ass, srt = mkv.MatroskaFile(self.path).subtitle_tracks()
+        self.assertEqual(mkv.choose_track([ass, srt], [('en', 'en|eng')]), ('en', srt))
+        self.assertEqual(mkv.choose_track([srt, ass], [('ru', 'ru|rus'), ('en', 'en|eng')]), ('ru', ass))
+        srt.language, srt.forced = 'rus', True
+        # forced track is used only when there is nothing else
+        self.assertEqual(mkv.choose_track([srt, ass], [('ru', 'ru|rus')]), ('ru', ass))
+        self.assertEqual(mkv.choose_track([srt], [('ru', 'ru|rus')]), ('ru', srt))
+        self.assertIsNone(mkv.choose_track([ass, srt], [('de', 'de|ger')]))
+
+
+if __name__ == '__main__':
+    unittest.main()
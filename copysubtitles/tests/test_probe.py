@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+#
+# test_probe.py
+#
+# Usage: python -m unittest discover -s tests
+#
+import os
+import shutil
+import tempfile
+import unittest
+
+from fixtures import write_mkv, write_mp4
+
+import probe  # noqa
+
+
+class ProbeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def path(self, name):
+        return os.path.join(self.folder, name)
+
+    def test_mkv(self):
+        write_mkv(self.path('a.mkv'))
+        self.assertEqual(probe.mkv_duration(self.path('a.mkv')), 60000.)
+        # duration is counted in timecode scale units
+        write_mkv(self.path('b.mkv'), timecode_scale=100000, duration=600000.)
+        self.assertEqual(probe.video_duration(self.path('b.mkv')), 60000.)
+
+    def test_mkv_without_duration(self):
+        write_mkv(self.path('a.mkv'), duration=0.)
+        self.assertIsNone(probe.video_duration(self.path('a.mkv')))
+
+    def test_mp4(self):
+        write_mp4(self.path('a.mp4'), 1000, 90000)
+        self.assertEqual(probe.mp4_duration(self.path('a.mp4')), 90000.)
+        write_mp4(self.path('b.mov'), 90000, 90000 * 5, version=1)
+        self.assertEqual(probe.video_duration(self.path('b.mov')), 5000.)
+
+    def test_mp4_unknown_duration(self):
+        write_mp4(self.path('a.m4v'), 1000, 0xFFFFFFFF)
+        self.assertIsNone(probe.video_duration(self.path('a.m4v')))
+        write_mp4(self.path('b.mp4'), 0, 1000)
+        self.assertIsNone(probe.video_duration(self.path('b.mp4')))
+
+    def test_unsupported(self):
+        with open(self.path('a.avi'), 'wb') as f:
+            f.write('RIFF' + '\0' * 64)
+        self.assertIsNone(probe.video_duration(self.path('a.avi')))
+        os.rename(self.path('a.avi'), self.path('a.mkv'))
+        self.assertIsNone(probe.video_duration(self.path('a.mkv')))
+        self.assertIsNone(probe.video_duration(self.path('missing.mp4')))
+
+    def test_cache(self):
+        path = self.path('a.mkv')
+        cache = probe.DurationCache()
+        write_mkv(path)
+        os.utime(path, (1000000000, 1000000000))
+        self.assertEqual(cache.duration(path), 60000.)
+        # the same size and mtime, the file is not probed again
+        write_mkv(path, duration=30000.)
+        os.utime(path, (1000000000, 1000000000))
+        self.assertEqual(cache.duration(path), 60000.)
+        os.utime(path, (1000000000, 1000000010))
+        self.assertEqual(cache.duration(path), 30000.)
+        self.assertIsNone(cache.duration(self.path('missing.mkv')))
+
+    def test_cache_resize(self):
+        cache = probe.DurationCache(size=1)
+        for name in ('a.mkv', 'b.mkv'):
+            write_mkv(self.path(name))
+            cache.duration(self.path(name))
+        self.assertEqual(len(cache.durations), 1)
+        cache.resize(0)
+        self.assertFalse(cache.durations)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+#
+# test_rules.py
+#
+# Usage: python -m unittest discover -s tests
+#
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'copysubtitles'))
+
+from rules import RuleMatcher, DEFAULT_RULE, RULES_PER_PATTERN  # noqa
+
+
+class RuleMatcherTest(unittest.TestCase):
+
+    def test_first_rule_wins(self):
+        rules = RuleMatcher([
+            {'path': '*/anime', 'label': 'tv', 'suffixes': ['forced']},
+            {'path': '*/anime', 'lang': 'en'},
+            {'tracker': 'tracker.org', 'mode': 'hardlink'},
+        ])
+        self.assertEqual(rules.match('/dl/Anime/', 'TV').suffixes, ('forced',))
+        self.assertEqual(rules.match('/dl/anime', 'movies').lang, 'en')
+        self.assertEqual(rules.match('/dl/anime', None, 'tracker.org').lang, 'en')
+        self.assertEqual(rules.match('/dl/movies', None, 'tracker.org').mode, 'hardlink')
+        self.assertIs(rules.match('C:\\dl\\movies'), DEFAULT_RULE)
+
+    def test_many_rules(self):
+        count = RULES_PER_PATTERN * 2 + 50
+        rules = RuleMatcher([{'path': '/dl/show-%s' % i, 'lang': str(i)} for i in range(count)] +
+                            [{'path': '/dl/*', 'lang': 'any'}])
+        self.assertEqual(len(rules), count + 1)
+        for i in (0, RULES_PER_PATTERN - 1, RULES_PER_PATTERN, count - 1):
+            self.assertEqual(rules.match('/dl/show-%s' % i).lang, str(i))
+        self.assertEqual(rules.match('/dl/other').lang, 'any')
+
+    def test_indexed_and_globs_keep_order(self):
+        rules = RuleMatcher([
+            {'path': '/dl/tv/s?ow', 'lang': 'glob'},
+            {'path': '/DL/tv/show', 'lang': 'exact'},
+            {'path': '*/show', 'lang': 'ending'},
+            {'path': '*/tv/*', 'lang': 'tv'},
+            {'lang': 'any'},
+        ])
+        self.assertEqual(rules.match('/dl/tv/show').lang, 'glob')
+        self.assertEqual(rules.match('/dl/TV/Show/').lang, 'glob')
+        self.assertEqual(rules.match('/data/tv/show').lang, 'ending')
+        self.assertEqual(rules.match('/data/tv/movie').lang, 'tv')
+        self.assertEqual(rules.match('show').lang, 'any')
+        rules = RuleMatcher([{'path': '*/show', 'lang': 'ending'}, {'path': '/dl/*', 'lang': 'glob'}])
+        self.assertEqual(rules.match('/dl/show').lang, 'ending')
+        self.assertEqual(rules.match('/dl/movie').lang, 'glob')
+
+    def test_malformed(self):
+        self.assertRaises(ValueError, RuleMatcher, [{'path': '*', 'size': 1}])
+        self.assertRaises(ValueError, RuleMatcher, [{'mode': 'move'}])
+
+
+if __name__ == '__main__':
+    unittest.main()
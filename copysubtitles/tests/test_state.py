@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+#
+# test_state.py
+#
+# Usage: python -m unittest discover -s tests
+#
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'copysubtitles'))
+
+from state import relocate  # noqa
+
+
+class RelocateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.old = os.path.join(self.folder, 'old', 'Show')
+        self.new = os.path.join(self.folder, 'new', 'Show')
+        os.makedirs(os.path.join(self.old, 'Subs'))
+        os.makedirs(os.path.join(self.folder, 'other'))
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            f.write(path)
+
+    def move_torrent(self):
+        """
+        move the torrent files the way Deluge does, the copied ones are left
+        """
+        os.makedirs(os.path.join(self.new, 'Subs'))
+        os.rename(os.path.join(self.old, 'Subs', '01.ass'), os.path.join(self.new, 'Subs', '01.ass'))
+
+    def test_copy(self):
+        src, dst = os.path.join(self.old, 'Subs', '01.ass'), os.path.join(self.old, 'Season', '01.ru.ass')
+        self.write(src)
+        os.mkdir(os.path.dirname(dst))
+        self.write(dst)
+        self.move_torrent()
+        moved = relocate([(src, dst)], self.old, self.new)
+        new_dst = os.path.join(self.new, 'Season', '01.ru.ass')
+        self.assertEqual(moved, {dst: new_dst})
+        self.assertTrue(os.path.isfile(new_dst))
+        # the emptied folder is removed
+        self.assertFalse(os.path.exists(os.path.dirname(dst)))
+
+    def test_symlinks(self):
+        inside, outside = os.path.join(self.old, 'Subs', '01.ass'), os.path.join(self.folder, 'other', '01.ass')
+        self.write(inside)
+        self.write(outside)
+        links = os.path.join(self.old, '01.ru.ass'), os.path.join(self.old, '01.en.ass')
+        os.symlink(inside, links[0])
+        os.symlink(outside, links[1])
+        self.move_torrent()
+        moved = relocate(zip((inside, outside), links), self.old, self.new)
+        self.assertEqual(moved, {links[0]: os.path.join(self.new, '01.ru.ass'),
+                                 links[1]: os.path.join(self.new, '01.en.ass')})
+        self.assertEqual(os.readlink(moved[links[0]]), os.path.join(self.new, 'Subs', '01.ass'))
+        self.assertEqual(os.readlink(moved[links[1]]), outside)
+        for link in links:
+            self.assertFalse(os.path.lexists(link))
+            self.assertTrue(os.path.isfile(moved[link]))
+
+
+if __name__ == '__main__':
+    unittest.main()